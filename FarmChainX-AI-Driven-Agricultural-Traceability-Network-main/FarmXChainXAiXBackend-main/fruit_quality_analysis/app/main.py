@@ -1,19 +1,151 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
+from fastapi import FastAPI, File, Form, UploadFile, HTTPException, BackgroundTasks, Request
 from fastapi.middleware.cors import CORSMiddleware
-from typing import List, Dict, Any
-import uvicorn
+from fastapi.responses import JSONResponse, PlainTextResponse
+from starlette.concurrency import run_in_threadpool
+from contextlib import asynccontextmanager
+import asyncio
+from typing import List, Dict, Any, Optional
 import os
 from datetime import datetime
-import uuid
+
+from config import API_CONFIG, UPLOAD_CONFIG, ARCHIVE_CONFIG, MODEL_CONFIG, CACHE_CONFIG, METRICS_CONFIG, RESULTS_CONFIG
+from .utils.threading_policy import active_policy, configured_policy, set_native_env, apply_native_threads
+
+# Size the OpenMP/BLAS pools before anything below imports NumPy (the
+# production server has already applied a policy for its worker count)
+threading_policy = active_policy() or configured_policy()
+set_native_env(threading_policy.native_threads)
 
 from .models.fruit_analysis import FruitAnalysis, FruitType, AnalysisResult
+from .utils.executor import AnalysisExecutor
+from .utils.batcher import MicroBatcher
+from .utils.cache import ResultCache, file_signature
+from .utils.results_store import ResultStore
+from .utils.archive import UploadArchive
+from .utils.analysis import FruitQualityAnalyzer
+from .utils.model_registry import registry
 from .utils.image_processor import process_image
-from .utils.analysis import analyze_fruit_quality
+from .utils.warmup import warm_up
+from .utils.uploads import read_upload, RequestSizeLimitMiddleware
+from .utils.pipeline import run_analysis, run_batch_analysis, analyze_processed_batch
+from .utils import metrics, profiling, settings
+from .routes import admin, results
+
+# CPU-bound decoding and analysis run here instead of on the event loop
+executor = AnalysisExecutor(
+    kind=API_CONFIG['executor'],
+    max_workers=threading_policy.executor_workers,
+    initializer=apply_native_threads,
+    initargs=(threading_policy.native_threads,)
+)
+
+# Coalesces concurrent /analyze requests into one inference call when enabled
+batcher = None
+if MODEL_CONFIG['max_batch_size'] > 1:
+    batcher = MicroBatcher(
+        analyze_processed_batch,
+        max_batch_size=MODEL_CONFIG['max_batch_size'],
+        max_wait_ms=MODEL_CONFIG['batch_timeout_ms'],
+        executor=executor
+    )
+
+# Results can only be reused if the analyzer scores an image the same way every time
+result_cache = None
+if CACHE_CONFIG['enabled'] and FruitQualityAnalyzer.DETERMINISTIC:
+    result_cache = ResultCache(
+        max_entries=CACHE_CONFIG['max_entries'],
+        max_bytes=CACHE_CONFIG['max_bytes'],
+        ttl_seconds=CACHE_CONFIG['ttl_seconds'],
+        disk_path=CACHE_CONFIG['disk_path'],
+        # A model file replaced in place gets a new namespace through its size and mtime
+        namespace=(f"{FruitQualityAnalyzer.VERSION}:{MODEL_CONFIG['backend']}:{MODEL_CONFIG['model_path']}"
+                   f":{file_signature(MODEL_CONFIG['model_path'])}")
+    )
+
+# Every result is kept for traceability, written in batches off the request path
+results_store = None
+if RESULTS_CONFIG['enabled']:
+    results_store = ResultStore(
+        RESULTS_CONFIG['url'],
+        queue_size=RESULTS_CONFIG['queue_size'],
+        batch_size=RESULTS_CONFIG['batch_size'],
+        flush_interval_ms=RESULTS_CONFIG['flush_interval_ms'],
+        pool_size=RESULTS_CONFIG['pool_size'],
+        max_overflow=RESULTS_CONFIG['max_overflow'],
+        echo=RESULTS_CONFIG['echo'],
+        auto_migrate=RESULTS_CONFIG['auto_migrate']
+    )
+
+# Raw uploads are archived by content hash after the response
+archive = None
+if UPLOAD_CONFIG['archive_uploads']:
+    archive = UploadArchive(
+        UPLOAD_CONFIG['upload_dir'],
+        fanout=ARCHIVE_CONFIG['fanout'],
+        fsync=ARCHIVE_CONFIG['fsync'],
+        retention_days=ARCHIVE_CONFIG['retention_days'],
+        max_bytes=ARCHIVE_CONFIG['max_bytes'],
+        webp_after_days=ARCHIVE_CONFIG['webp_after_days'],
+        webp_quality=ARCHIVE_CONFIG['webp_quality'],
+        compact_interval=ARCHIVE_CONFIG['compact_interval']
+    )
+
+# Pool, cache, results queue and archive state is read at scrape time
+metrics.REGISTRY.register_callback(
+    'fruit_analysis_executor', 'Analysis executor queue and throughput', ('stat',),
+    lambda: {(name,): value for name, value in executor.stats().items() if isinstance(value, (int, float))}
+)
+if result_cache is not None:
+    metrics.REGISTRY.register_callback(
+        'fruit_analysis_cache', 'Result cache size and effectiveness', ('stat',),
+        lambda: {(name,): value for name, value in result_cache.stats().items()}
+    )
+if results_store is not None:
+    metrics.REGISTRY.register_callback(
+        'fruit_analysis_results_store', 'Results queue depth, drops and batched writes', ('stat',),
+        lambda: {(name,): value for name, value in results_store.stats().items() if isinstance(value, (int, float))}
+    )
+if archive is not None:
+    metrics.REGISTRY.register_callback(
+        'fruit_analysis_archive', 'Upload archive writes, deduplication and space reclaimed', ('stat',),
+        lambda: {(name,): value for name, value in archive.stats().items() if isinstance(value, (int, float))}
+    )
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown"""
+    # Heavy imports, model loading and tracing happen in the background so
+    # the server accepts /health straight away; analysis waits for them
+    loop = asyncio.get_running_loop()
+    app.state.warmup = loop.run_in_executor(
+        None, warm_up, MODEL_CONFIG['model_path'], sorted({1, MODEL_CONFIG['max_batch_size']}), threading_policy
+    )
+    # SIGHUP re-reads the settings overrides file without a restart
+    settings.install_reload_handler(loop)
+    if archive is not None:
+        # Retention runs in every worker; a file lock lets one at a time compact
+        archive.start()
+    if METRICS_CONFIG['enabled'] and METRICS_CONFIG['multiprocess_dir']:
+        # Pre-forked: any worker answers /metrics from every worker's snapshot
+        metrics.REGISTRY.start_sync(METRICS_CONFIG['multiprocess_dir'], METRICS_CONFIG['sync_interval'])
+    yield
+    if METRICS_CONFIG['enabled'] and METRICS_CONFIG['multiprocess_dir']:
+        metrics.REGISTRY.stop_sync(METRICS_CONFIG['multiprocess_dir'])
+    settings.remove_reload_handler(loop)
+    executor.shutdown()
+    if archive is not None:
+        archive.close()
+    if result_cache is not None:
+        result_cache.close()
+    if results_store is not None:
+        # Write what is still queued before the worker exits
+        results_store.close()
 
 app = FastAPI(
     title="Fruit Quality Analysis API",
     description="API for analyzing fruit quality from images",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Configure CORS
@@ -25,47 +157,227 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-# Ensure upload directory exists
-UPLOAD_DIR = "data/raw"
-os.makedirs(UPLOAD_DIR, exist_ok=True)
+# Profiling downloads
+app.include_router(admin.router)
+# Queries over stored results
+app.include_router(results.router)
+
+# The only limit on what a request makes us receive and spool: bodies larger
+# than a full batch get a 413 as soon as they cross it
+app.add_middleware(RequestSizeLimitMiddleware, max_bytes=UPLOAD_CONFIG['max_request_size'])
+
+async def wait_until_ready() -> None:
+    """Block analysis requests until the startup warm-up has finished"""
+    warmup = getattr(app.state, 'warmup', None)
+    if warmup is not None and not warmup.done():
+        await asyncio.shield(warmup)
+
+def startup_status() -> Dict[str, Any]:
+    """Warm-up progress for /health"""
+    warmup = getattr(app.state, 'warmup', None)
+    if warmup is None:
+        # Started without the lifespan hook (e.g. tests); everything loads lazily
+        return {"ready": True, "timings": None, "error": None}
+    if not warmup.done():
+        return {"ready": False, "timings": None, "error": None}
+    if warmup.exception() is not None:
+        return {"ready": False, "timings": None, "error": str(warmup.exception())}
+    return {"ready": True, "timings": warmup.result(), "error": None}
+
+def store_result(result: AnalysisResult, endpoint: str, file: UploadFile, size: int,
+                 fingerprint: str, cached: bool = False, lot: Optional[str] = None) -> None:
+    """Queue a result for the results database; never waits for the write"""
+    if results_store is not None:
+        results_store.record(
+            result, endpoint, filename=file.filename, upload_bytes=size, cached=cached,
+            analyzer_version=FruitQualityAnalyzer.VERSION, settings_fingerprint=fingerprint, lot=lot
+        )
+
+async def run_in_pool(fn, *args):
+    """
+    Run fn on the analysis executor
+    
+    When the request is being timed, the worker's stage timings are carried
+    back and merged into the request's timer; when it is being profiled, the
+    worker runs fn under cProfile as well.
+    """
+    timer = metrics.current_timer()
+    profile = profiling.current_profile()
+    if profile is not None:
+        result, worker_timer, stats = await executor.run(profiling.profiled_call, fn, *args)
+        profile.add_stats(stats)
+    elif timer is not None:
+        result, worker_timer = await executor.run(metrics.timed_call, fn, *args)
+    else:
+        return await executor.run(fn, *args)
+    if timer is not None:
+        timer.merge(worker_timer)
+    return result
+
+async def run_blocking(fn, *args):
+    """
+    Run blocking work that is not analysis (hashing, the cache's SQLite tier) off the event loop
+    
+    It shares the analysis pool when that is a thread pool; process pools
+    cannot take it (the cache does not pickle), so it then goes to the
+    default thread pool.
+    """
+    if executor.kind == 'thread':
+        return await run_in_pool(fn, *args)
+    return await run_in_threadpool(fn, *args)
+
+def cache_lookup(contents: bytes, fingerprint: str):
+    """Hash an upload and look it up in both cache tiers"""
+    key = result_cache.key(contents, fingerprint)
+    return key, result_cache.get(key)
+
+def serialize(content: Any) -> JSONResponse:
+    """Render the response body here so its cost shows up as a stage"""
+    with metrics.stage('serialize'):
+        if isinstance(content, list):
+            return JSONResponse([item.model_dump(mode='json') for item in content])
+        return JSONResponse(content.model_dump(mode='json'))
 
 @app.post("/analyze", response_model=AnalysisResult)
-async def analyze_fruit_image(file: UploadFile = File(...)):
+async def analyze_fruit_image(request: Request, background_tasks: BackgroundTasks, file: UploadFile = File(...),
+                              lot: Optional[str] = Form(None, max_length=64)):
     """
     Analyze a fruit image and return quality metrics.
     
     Args:
         file: Image file of the fruit to analyze
+        lot: Production lot the fruit belongs to, stored with the result
         
     Returns:
         AnalysisResult: Detailed analysis of the fruit's quality
     """
-    try:
-        # Validate file type
-        if not file.content_type.startswith('image/'):
-            raise HTTPException(status_code=400, detail="File must be an image")
-        
-        # Save uploaded file
-        file_extension = file.filename.split('.')[-1]
-        filename = f"{uuid.uuid4()}.{file_extension}"
-        file_path = os.path.join(UPLOAD_DIR, filename)
-        
-        with open(file_path, "wb") as f:
-            f.write(await file.read())
-        
-        # Process image and analyze
-        processed_image = process_image(file_path)
-        analysis_result = analyze_fruit_quality(processed_image)
-        
-        return analysis_result
+    with metrics.track_request('/analyze'), profiling.profile_request('/analyze', request.headers):
+        try:
+            # Copy the spooled upload into memory; non-images and oversized files
+            # are rejected by their bytes rather than the declared content type
+            with metrics.stage('upload_read'):
+                contents = await read_upload(file, UPLOAD_CONFIG['max_upload_size'])
+            metrics.observe_upload(len(contents))
+            await wait_until_ready()
+            
+            # One settings snapshot for the whole request, even if it is swapped meanwhile
+            snapshot = settings.current_settings()
+            
+            # Identical uploads are answered from the cache without decoding
+            cache_key = None
+            if result_cache is not None:
+                # Hashing up to MAX_UPLOAD_SIZE bytes and the disk tier stay off the event loop
+                cache_key, cached_result = await run_blocking(cache_lookup, contents, snapshot.fingerprint)
+                if cached_result is not None:
+                    metrics.observe_result(cached_result)
+                    store_result(cached_result, '/analyze', file, len(contents), snapshot.fingerprint,
+                                 cached=True, lot=lot)
+                    return serialize(cached_result)
+            
+            # Process image and analyze straight from memory on the worker pool
+            if batcher is not None:
+                processed_image = await run_in_pool(process_image, contents, snapshot, registry.get().input_dtype)
+                with metrics.stage('analyze'):
+                    analysis_result = await batcher.submit(processed_image)
+            else:
+                analysis_result = await run_in_pool(run_analysis, contents, snapshot)
+            
+            if cache_key is not None:
+                await run_blocking(result_cache.put, cache_key, analysis_result)
+            
+            # Archiving the raw upload is optional and never delays the response
+            if archive is not None:
+                background_tasks.add_task(archive.store, contents)
+            
+            metrics.observe_result(analysis_result)
+            store_result(analysis_result, '/analyze', file, len(contents), snapshot.fingerprint, lot=lot)
+            return serialize(analysis_result)
+            
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
+
+@app.post("/analyze/batch", response_model=List[AnalysisResult])
+async def analyze_fruit_images(request: Request, background_tasks: BackgroundTasks,
+                               files: List[UploadFile] = File(...),
+                               lot: Optional[str] = Form(None, max_length=64)):
+    """
+    Analyze several fruit images in one request.
+    
+    All images are decoded and stacked into a single model batch, which
+    amortizes per-request overhead for multi-frame clients.
+    
+    Args:
+        files: Image files of the fruit to analyze
+        lot: Production lot all the fruit belongs to, stored with the results
         
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=str(e))
+    Returns:
+        List[AnalysisResult]: One analysis per uploaded image, in upload order
+    """
+    with metrics.track_request('/analyze/batch'), profiling.profile_request('/analyze/batch', request.headers):
+        try:
+            if len(files) > API_CONFIG['max_batch_files']:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"Too many files, at most {API_CONFIG['max_batch_files']} per batch"
+                )
+            
+            with metrics.stage('upload_read'):
+                contents = [await read_upload(file, UPLOAD_CONFIG['max_upload_size']) for file in files]
+            for data in contents:
+                metrics.observe_upload(len(data))
+            await wait_until_ready()
+            
+            snapshot = settings.current_settings()
+            analysis_results = await run_in_pool(run_batch_analysis, contents, snapshot)
+            
+            if archive is not None:
+                for data in contents:
+                    background_tasks.add_task(archive.store, data)
+            
+            for file, data, analysis_result in zip(files, contents, analysis_results):
+                metrics.observe_result(analysis_result)
+                store_result(analysis_result, '/analyze/batch', file, len(data), snapshot.fingerprint, lot=lot)
+            return serialize(analysis_results)
+            
+        except HTTPException:
+            raise
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=str(e))
 
 @app.get("/health")
 async def health_check():
     """Health check endpoint"""
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow(),
+        "worker_pid": os.getpid(),
+        "startup": startup_status(),
+        "model": registry.peek(),
+        "executor": executor.stats(),
+        "threading": threading_policy.as_dict(),
+        "settings": settings.current_settings().fingerprint,
+        "batcher": batcher.stats() if batcher is not None else None,
+        "cache": result_cache.stats() if result_cache is not None else None,
+        "results_store": results_store.stats() if results_store is not None else None,
+        "archive": archive.stats() if archive is not None else None
+    }
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics_endpoint():
+    """Prometheus scrape endpoint"""
+    if not METRICS_CONFIG['enabled']:
+        raise HTTPException(status_code=404, detail="Metrics are disabled")
+    return PlainTextResponse(
+        metrics.REGISTRY.render(METRICS_CONFIG['multiprocess_dir']),
+        media_type="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 if __name__ == "__main__":
-    uvicorn.run("app.main:app", host="0.0.0.0", port=8000, reload=True)
+    from .server import main
+    main()
@@ -0,0 +1,82 @@
+"""
+Database tables for stored analysis results.
+
+Plain SQLAlchemy Core tables: rows are written in batches by the results
+store and read by the query endpoints, neither of which needs ORM objects.
+The schema is owned by the alembic migrations in migrations/; change both
+together.
+"""
+from sqlalchemy import (JSON, Boolean, Column, DateTime, Float, Index, Integer, MetaData, String, Table)
+
+metadata = MetaData()
+
+analysis_results = Table(
+    'analysis_results', metadata,
+    Column('id', Integer, primary_key=True, autoincrement=True),
+    # When the result was produced (UTC), not when it was written
+    Column('created_at', DateTime(timezone=True), nullable=False, index=True),
+    Column('endpoint', String(32), nullable=False),
+    Column('filename', String(255)),
+    Column('upload_bytes', Integer),
+    # Production lot the fruit belongs to, as given by the client
+    Column('lot', String(64)),
+    # Answered from the result cache rather than analyzed again
+    Column('cached', Boolean, nullable=False, default=False),
+    Column('fruit_type', String(32), nullable=False),
+    Column('overall_condition', String(32), nullable=False),
+    Column('confidence', Float, nullable=False),
+    Column('freshness', Float, nullable=False),
+    Column('ripeness', Float, nullable=False),
+    Column('shelf_life_days', Integer, nullable=False),
+    Column('recommendations', JSON, nullable=False),
+    # Which scoring produced it
+    Column('analyzer_version', String(32), nullable=False),
+    Column('settings_fingerprint', String(32)),
+    # Each filter of GET /results, followed by the time range
+    Index('ix_analysis_results_fruit_type_created_at', 'fruit_type', 'created_at'),
+    Index('ix_analysis_results_overall_condition_created_at', 'overall_condition', 'created_at'),
+    Index('ix_analysis_results_lot_created_at', 'lot', 'created_at'),
+)
+
+# Shelf-life histogram of the rollups: (label, lowest day, highest day or None)
+SHELF_LIFE_BUCKETS = (
+    ('0-2', 0, 2),
+    ('3-4', 3, 4),
+    ('5-7', 5, 7),
+    ('8-14', 8, 14),
+    ('15+', 15, None),
+)
+
+def shelf_life_column(label: str) -> str:
+    """Rollup column counting the results in one shelf-life bucket"""
+    return 'shelf_life_' + label.replace('-', '_').replace('+', '_plus')
+
+# Dimensions of a rollup row; results without a lot are rolled up under ''
+ROLLUP_KEYS = ('bucket_start', 'fruit_type', 'overall_condition', 'lot')
+# Additive measures, so a batch is merged in by adding its own totals
+ROLLUP_MEASURES = (
+    'results', 'freshness_sum', 'ripeness_sum', 'shelf_life_sum',
+    *(shelf_life_column(label) for label, _, _ in SHELF_LIFE_BUCKETS),
+)
+
+def _rollup_table(name: str) -> Table:
+    return Table(
+        name, metadata,
+        Column('bucket_start', DateTime(timezone=True), primary_key=True),
+        Column('fruit_type', String(32), primary_key=True),
+        Column('overall_condition', String(32), primary_key=True),
+        Column('lot', String(64), primary_key=True),
+        Column('results', Integer, nullable=False),
+        Column('freshness_sum', Float, nullable=False),
+        Column('ripeness_sum', Float, nullable=False),
+        Column('shelf_life_sum', Integer, nullable=False),
+        *(Column(shelf_life_column(label), Integer, nullable=False) for label, _, _ in SHELF_LIFE_BUCKETS),
+        Index(f'ix_{name}_fruit_type_bucket_start', 'fruit_type', 'bucket_start'),
+        Index(f'ix_{name}_lot_bucket_start', 'lot', 'bucket_start'),
+    )
+
+# Per-hour and per-day totals, kept up to date by the results writer
+ROLLUP_TABLES = {
+    'hour': _rollup_table('analysis_rollups_hourly'),
+    'day': _rollup_table('analysis_rollups_daily'),
+}
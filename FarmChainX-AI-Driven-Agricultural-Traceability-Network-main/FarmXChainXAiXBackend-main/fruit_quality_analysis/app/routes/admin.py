@@ -0,0 +1,101 @@
+import json
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Body, Depends, Header, HTTPException, Query
+from fastapi.responses import Response
+
+from config import PROFILING_CONFIG, SETTINGS_CONFIG
+from ..utils import settings
+from ..utils.profiling import check_admin_token, slow_requests
+
+def require_admin(x_admin_token: Optional[str] = Header(None)) -> None:
+    """Reject callers without the admin token, and everyone when none is configured"""
+    if not check_admin_token(x_admin_token):
+        raise HTTPException(status_code=403, detail="Admin token required")
+
+router = APIRouter(prefix="/admin", tags=["admin"], dependencies=[Depends(require_admin)])
+
+@router.get("/profiles")
+async def list_profiles() -> Dict[str, Any]:
+    """
+    Slowest profiled requests, slowest first
+
+    Returns:
+        Profiling mode and one summary (stage breakdown, image sizes) per kept request
+    """
+    return {
+        "mode": PROFILING_CONFIG['mode'],
+        "profiles": [profile.summary() for profile in slow_requests.entries()]
+    }
+
+@router.get("/profiles/{profile_id}")
+async def download_profile(profile_id: str, format: str = Query("pstats", pattern="^(pstats|speedscope)$")):
+    """
+    Download one request's profile
+
+    Args:
+        profile_id: Id from /admin/profiles
+        format: 'pstats' (load with pstats.Stats or snakeviz) or 'speedscope'
+
+    Returns:
+        The profile as a file attachment
+    """
+    profile = slow_requests.get(profile_id)
+    if profile is None:
+        raise HTTPException(status_code=404, detail=f"No profile '{profile_id}'")
+
+    if format == "speedscope":
+        content = json.dumps(profile.to_speedscope()).encode()
+        filename = f"{profile.id}.speedscope.json"
+        media_type = "application/json"
+    else:
+        content = profile.to_pstats()
+        filename = f"{profile.id}.pstats"
+        media_type = "application/octet-stream"
+
+    return Response(
+        content,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
+@router.delete("/profiles")
+async def clear_profiles() -> Dict[str, List[Any]]:
+    """Forget all kept profiles"""
+    slow_requests.clear()
+    return {"profiles": []}
+
+@router.get("/settings")
+async def get_settings() -> Dict[str, Any]:
+    """Runtime settings this worker is using"""
+    snapshot = settings.current_settings()
+    return {"fingerprint": snapshot.fingerprint, "settings": snapshot.as_dict()}
+
+# Plain def: writing the overrides file blocks, so FastAPI runs it on its threadpool
+@router.put("/settings")
+def update_settings(overrides: Dict[str, Any] = Body(...)) -> Dict[str, Any]:
+    """
+    Change runtime settings without a restart
+
+    Args:
+        overrides: Partial settings in the shape returned by GET /admin/settings,
+            e.g. {"image_processing": {"hist_bins": 64}}
+
+    Returns:
+        The new settings; 'persisted' when they were written to the overrides
+        file and 'broadcast' when every pre-forked worker was told to reload
+        it (otherwise only this worker changed)
+    """
+    try:
+        snapshot = settings.update(overrides)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    persisted = SETTINGS_CONFIG['overrides_path'] is not None
+    return {
+        "fingerprint": snapshot.fingerprint,
+        "settings": snapshot.as_dict(),
+        "persisted": persisted,
+        # Other workers can only pick up what was written to the file
+        "broadcast": persisted and settings.broadcast_reload(),
+    }
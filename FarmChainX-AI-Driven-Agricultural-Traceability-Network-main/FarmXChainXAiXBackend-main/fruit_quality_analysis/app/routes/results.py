@@ -0,0 +1,101 @@
+from datetime import datetime
+from typing import Any, Dict, List, Optional
+
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+
+from config import RESULTS_CONFIG
+from ..models.fruit_analysis import ConditionLevel, FruitType
+from ..utils.profiling import check_token
+from ..utils.results_query import find_results, rollup_series
+
+def require_results_token(x_results_token: Optional[str] = Header(None)) -> None:
+    """Reject callers without the results API token, and everyone when none is configured"""
+    if not check_token(x_results_token, RESULTS_CONFIG['api_token']):
+        raise HTTPException(status_code=403, detail="Results API token required")
+
+router = APIRouter(prefix="/results", tags=["results"], dependencies=[Depends(require_results_token)])
+
+def _engine():
+    """Engine of the results store, or 503 when storing results is disabled"""
+    from .. import main
+
+    if main.results_store is None:
+        raise HTTPException(status_code=503, detail="Results store is disabled")
+    return main.results_store.engine
+
+def _values(items: Optional[List[Any]]) -> List[str]:
+    return [item.value for item in items or ()]
+
+# Plain def: the queries block, so FastAPI runs them on its threadpool
+
+@router.get("")
+def list_results(
+    fruit_type: Optional[List[FruitType]] = Query(None),
+    overall_condition: Optional[List[ConditionLevel]] = Query(None),
+    lot: Optional[str] = Query(None, max_length=64),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Stored results, newest first
+
+    Args:
+        fruit_type: Any of these fruit types (repeatable)
+        overall_condition: Any of these conditions (repeatable)
+        lot: Only this lot
+        start: Produced at or after (UTC when no offset is given)
+        end: Produced before
+        limit: Page size
+        cursor: 'next' of the previous page
+
+    Returns:
+        {'results': [...], 'next': cursor for the following page or None}
+    """
+    try:
+        with _engine().connect() as connection:
+            return find_results(
+                connection, fruit_types=_values(fruit_type), conditions=_values(overall_condition),
+                lot=lot, start=start, end=end, limit=limit, cursor=cursor
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@router.get("/rollups")
+def list_rollups(
+    granularity: str = Query("day", pattern="^(hour|day)$"),
+    fruit_type: Optional[List[FruitType]] = Query(None),
+    overall_condition: Optional[List[ConditionLevel]] = Query(None),
+    lot: Optional[str] = Query(None, max_length=64),
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None,
+    group_by: Optional[List[str]] = Query(None)
+) -> Dict[str, Any]:
+    """
+    Hourly or daily aggregates of the stored results
+
+    Reads the rollup tables only, so the cost grows with the number of
+    buckets rather than results. share is each entry's count over all
+    conditions of its bucket and group, e.g. fruit_type=Mango with
+    overall_condition=Poor&overall_condition=Spoiled gives the share of
+    poor or spoiled mangoes per day.
+
+    Args:
+        granularity: 'hour' or 'day'
+        fruit_type, overall_condition, lot, start, end: As for GET /results
+        group_by: Split buckets by fruit_type, overall_condition and/or lot (repeatable)
+
+    Returns:
+        {'granularity': ..., 'series': [one entry per bucket and group]}
+    """
+    try:
+        with _engine().connect() as connection:
+            series = rollup_series(
+                connection, granularity=granularity, fruit_types=_values(fruit_type),
+                conditions=_values(overall_condition), lot=lot, start=start, end=end,
+                group_by=group_by or ()
+            )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"granularity": granularity, "series": series}
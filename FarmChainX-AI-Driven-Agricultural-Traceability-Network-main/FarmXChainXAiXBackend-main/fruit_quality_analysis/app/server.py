@@ -0,0 +1,222 @@
+"""
+Server launch modes for the Fruit Quality Analysis API.
+
+Development runs a single uvicorn worker with auto-reload. Production loads
+the application (and the model) once in a supervisor process, binds the
+listening socket, and then forks the workers, so the model weights and
+imported libraries are shared copy-on-write. Dead workers are replaced,
+SIGHUP reloads the runtime settings in every worker and SIGTERM/SIGINT shut
+everything down gracefully.
+"""
+import logging
+import os
+import shutil
+import signal
+import socket
+import sys
+import time
+from typing import Dict, Optional
+
+import uvicorn
+
+from config import API_CONFIG, METRICS_CONFIG, MODEL_CONFIG, RESULTS_CONFIG
+from .utils import metrics, settings
+from .utils.threading_policy import active_policy, apply_policy, configured_policy
+
+logger = logging.getLogger(__name__)
+
+def preload() -> None:
+    """Import the app, migrate the results database and load the model before forking"""
+    from .main import app, results_store  # noqa: F401
+    from .utils.image_processor import cv2
+    from .utils.model_registry import registry
+    from .utils.results_store import migrate
+
+    cv2.load()
+    if results_store is not None and RESULTS_CONFIG['auto_migrate']:
+        # Once here, so the workers' own migration runs find nothing to do
+        migrate(results_store.engine)
+        results_store.engine.dispose()
+    if API_CONFIG['preload_model'] and MODEL_CONFIG['model_path']:
+        started = time.perf_counter()
+        registry.load(model_path=MODEL_CONFIG['model_path'])
+        logger.info("Loaded model %s in %.2fs", MODEL_CONFIG['model_path'], time.perf_counter() - started)
+
+def bind_socket(host: str, port: int, backlog: int) -> socket.socket:
+    """Listening socket shared by all workers"""
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+def uvicorn_config(**overrides) -> uvicorn.Config:
+    """uvicorn settings for a production worker"""
+    from .main import app
+
+    settings = dict(
+        app=app,
+        lifespan='on',
+        backlog=API_CONFIG['backlog'],
+        timeout_keep_alive=API_CONFIG['timeout_keep_alive'],
+        limit_concurrency=API_CONFIG['limit_concurrency'],
+    )
+    settings.update(overrides)
+    return uvicorn.Config(**settings)
+
+class PreforkServer:
+    """Forks uvicorn workers off a loaded supervisor and keeps them running"""
+
+    # Workers that die sooner than this after starting are restarted with a delay
+    MIN_WORKER_LIFETIME = 1.0
+
+    def __init__(self, sock: socket.socket, workers: int):
+        """
+        Args:
+            sock: Bound, listening socket
+            workers: Number of worker processes
+        """
+        self.sock = sock
+        self.workers = workers
+        self.children: Dict[int, float] = {}  # pid -> start time
+        self.stopping = False
+
+    def spawn(self) -> int:
+        """Fork one worker"""
+        pid = os.fork()
+        if pid == 0:
+            self._run_worker()
+        self.children[pid] = time.monotonic()
+        return pid
+
+    def _run_worker(self) -> None:
+        """Body of a forked worker; never returns"""
+        status = 0
+        try:
+            # uvicorn installs its own handlers once it is serving
+            signal.signal(signal.SIGTERM, signal.SIG_DFL)
+            signal.signal(signal.SIGINT, signal.SIG_DFL)
+            # The app's lifespan installs the settings reload handler
+            signal.signal(signal.SIGHUP, signal.SIG_IGN)
+            # OpenCV's pool does not survive fork(); size it again
+            apply_policy(active_policy() or configured_policy())
+            server = uvicorn.Server(uvicorn_config())
+            server.run(sockets=[self.sock])
+        except BaseException:
+            logger.exception("Worker %d crashed", os.getpid())
+            status = 1
+        finally:
+            sys.stdout.flush()
+            sys.stderr.flush()
+            os._exit(status)
+
+    def stop(self, signum: Optional[int] = None, frame=None) -> None:
+        """Ask every worker to shut down gracefully"""
+        self.stopping = True
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    def reload(self, signum: Optional[int] = None, frame=None) -> None:
+        """Reload the runtime settings here (for future workers) and in every worker"""
+        settings.reload()
+        for pid in list(self.children):
+            try:
+                os.kill(pid, signal.SIGHUP)
+            except ProcessLookupError:
+                pass
+
+    def run(self) -> None:
+        """Start the workers and supervise them until stopped"""
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        signal.signal(signal.SIGHUP, self.reload)
+        # Workers forward settings changes made through /admin/settings here
+        settings.set_supervisor(os.getpid())
+
+        for _ in range(self.workers):
+            self.spawn()
+        logger.info("Started %d workers on %s", self.workers, self.sock.getsockname())
+
+        while self.children:
+            try:
+                pid, status = os.wait()
+            except ChildProcessError:
+                break
+            started = self.children.pop(pid, None)
+            if started is None or self.stopping:
+                continue
+
+            logger.warning("Worker %d exited with status %d, restarting", pid, os.waitstatus_to_exitcode(status))
+            if time.monotonic() - started < self.MIN_WORKER_LIFETIME:
+                time.sleep(self.MIN_WORKER_LIFETIME)
+            if not self.stopping:
+                self.spawn()
+
+        self.sock.close()
+
+def run_development() -> None:
+    """Single worker with auto-reload"""
+    uvicorn.run(
+        "app.main:app",
+        host=API_CONFIG['host'],
+        port=API_CONFIG['port'],
+        reload=API_CONFIG['reload'],
+        workers=1
+    )
+
+def run_production() -> None:
+    """Pre-forked multi-worker server with API_CONFIG['workers'] workers"""
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s [%(levelname)s] %(name)s: %(message)s')
+    workers = API_CONFIG['workers']
+    # Applied before NumPy loads so the supervisor and every worker inherit it;
+    # each worker gets its share of the cores (see threading_policy)
+    policy = configured_policy(workers=workers)
+    apply_policy(policy)
+    logger.info("Threading policy: %r", policy)
+    # Workers share their metrics through this directory, emptied of any
+    # previous run's; the environment carries it to spawned workers too
+    created = METRICS_CONFIG['multiprocess_dir'] is None
+    METRICS_CONFIG['multiprocess_dir'] = metrics.prepare_multiprocess_dir(METRICS_CONFIG['multiprocess_dir'])
+    os.environ['METRICS_MULTIPROC_DIR'] = METRICS_CONFIG['multiprocess_dir']
+    try:
+        _serve(workers)
+    finally:
+        if created:
+            shutil.rmtree(METRICS_CONFIG['multiprocess_dir'], ignore_errors=True)
+
+def _serve(workers: int) -> None:
+    if not hasattr(os, 'fork'):
+        # No fork() on Windows: uvicorn spawns workers, each loading its own model
+        uvicorn.run(
+            "app.main:app",
+            host=API_CONFIG['host'],
+            port=API_CONFIG['port'],
+            workers=workers,
+            backlog=API_CONFIG['backlog'],
+            timeout_keep_alive=API_CONFIG['timeout_keep_alive'],
+            limit_concurrency=API_CONFIG['limit_concurrency'],
+        )
+        return
+
+    preload()
+    sock = bind_socket(API_CONFIG['host'], API_CONFIG['port'], API_CONFIG['backlog'])
+    PreforkServer(sock, workers).run()
+
+def main(production: Optional[bool] = None) -> None:
+    """
+    Start the server in the configured mode
+
+    Args:
+        production: Force a mode; defaults to API_CONFIG['server_mode']
+    """
+    if production is None:
+        production = API_CONFIG['server_mode'] == 'production'
+    if production:
+        run_production()
+    else:
+        run_development()
@@ -1,6 +1,35 @@
 """Utility functions for the fruit quality analysis application."""
 
-from .image_processor import process_image, ImageProcessor
-from .analysis import analyze_fruit_quality, FruitQualityAnalyzer
+import importlib
 
-__all__ = ['process_image', 'ImageProcessor', 'analyze_fruit_quality', 'FruitQualityAnalyzer']
+# Names are resolved on first access so that importing app.utils does not
+# pull in OpenCV, NumPy or the model stack up front.
+_EXPORTS = {
+    'process_image': '.image_processor',
+    'process_images': '.image_processor',
+    'ImageProcessor': '.image_processor',
+    'ProcessedImage': '.image_processor',
+    'analyze_fruit_quality': '.analysis',
+    'analyze_fruit_quality_batch': '.analysis',
+    'FruitQualityAnalyzer': '.analysis',
+    'run_analysis': '.pipeline',
+    'run_batch_analysis': '.pipeline',
+    'analyze_processed_batch': '.pipeline',
+    'AnalysisExecutor': '.executor',
+    'MicroBatcher': '.batcher',
+    'ResultCache': '.cache',
+    'ResultStore': '.results_store',
+    'UploadArchive': '.archive',
+}
+
+__all__ = list(_EXPORTS)
+
+def __getattr__(name):
+    if name not in _EXPORTS:
+        raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+    value = getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    globals()[name] = value
+    return value
+
+def __dir__():
+    return sorted(set(globals()) | set(__all__))
@@ -0,0 +1,466 @@
+"""
+Content-addressed archive of raw uploads.
+
+Uploads are stored under the SHA-256 of their bytes in a fan-out layout
+(ab/cd/abcd...ef.jpg), so a shard directory never holds more than a small
+share of the files and an image uploaded many times is stored once. Files
+are written to a temporary name in their shard and renamed into place, so
+readers never see a partial file.
+
+A background compactor applies the retention policy: files not uploaded
+again for retention_days are deleted, the oldest are deleted while the
+archive is over max_bytes, and files older than webp_after_days can be
+re-encoded to WebP. A re-encoded file keeps the hash of the original
+upload as its name, so later uploads of the same image still deduplicate
+against it.
+"""
+import hashlib
+import logging
+import os
+import re
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, FrozenSet, Iterator, Optional, Tuple
+
+from . import metrics
+from .uploads import SNIFF_BYTES, sniff_image_type
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+# File extension per sniffed format; anything else is kept as .bin
+EXTENSIONS = {'jpeg': 'jpg', 'png': 'png', 'webp': 'webp', 'bmp': 'bmp', 'tiff': 'tiff'}
+
+# Uploads from before the sharded layout: a uuid4 named by the old upload
+# handler, with the extension of the client's file name
+_FLAT_UPLOAD_NAME = re.compile(
+    r'[0-9a-f]{8}-[0-9a-f]{4}-4[0-9a-f]{3}-[89ab][0-9a-f]{3}-[0-9a-f]{12}'
+    r'\.(?:jpe?g|png|webp|bmp|tiff?|gif)', re.IGNORECASE
+)
+
+# Temporary files left behind by a crash are removed once this old
+_STALE_TEMP_SECONDS = 3600.0
+
+# Size-based eviction finds its cutoff by hours of files, oldest first, so
+# the first scan keeps a count per hour rather than every file
+_EVICTION_BUCKET_SECONDS = 3600
+
+# Files remembered as not worth re-encoding, least recently seen forgotten
+# first; a forgotten one just gets another (failed) attempt
+_INCOMPRESSIBLE_LIMIT = 100000
+
+class UploadArchive:
+    """
+    Stores raw uploads by content hash and enforces a retention policy
+
+    store() is cheap enough for a background task after the response: one
+    hash, at most two stat() calls and, for new content, one write and a
+    rename. compact() walks the whole archive and is meant for the
+    background thread started by start().
+    """
+
+    def __init__(
+        self,
+        root: os.PathLike,
+        fanout: int = 2,
+        fsync: bool = False,
+        retention_days: Optional[float] = None,
+        max_bytes: Optional[int] = None,
+        webp_after_days: Optional[float] = None,
+        webp_quality: int = 90,
+        compact_interval: float = 3600.0
+    ):
+        """
+        Args:
+            root: Archive directory
+            fanout: Directory levels of two hex digits above each file
+            fsync: Flush every new file to disk before renaming it into place
+            retention_days: Delete files not uploaded again for this long (None keeps them)
+            max_bytes: Delete the oldest files while the archive is larger (None for no limit)
+            webp_after_days: Re-encode older files to WebP (None never does)
+            webp_quality: WebP quality, 1-100
+            compact_interval: Seconds between compactions of the background thread
+        """
+        if not 0 <= fanout <= 8:
+            raise ValueError("fanout must be between 0 and 8")
+        self.root = Path(root)
+        self.fanout = fanout
+        self.fsync = fsync
+        self.retention_days = retention_days
+        self.max_bytes = max_bytes
+        self.webp_after_days = webp_after_days
+        self.webp_quality = webp_quality
+        self.compact_interval = compact_interval
+        os.makedirs(self.root, exist_ok=True)
+
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        # Files in the root that are not uploads, logged when they change
+        self._foreign: FrozenSet[str] = frozenset()
+        # Files whose WebP version was not smaller; not tried again. Only
+        # files still present at the last compaction are kept
+        self._incompressible: 'OrderedDict[str, None]' = OrderedDict()
+
+        self._stored = 0
+        self._deduplicated = 0
+        self._bytes_written = 0
+        self._bytes_deduplicated = 0
+        self._write_errors = 0
+        self._compactions = 0
+        self._expired = 0
+        self._evicted = 0
+        self._reencoded = 0
+        self._adopted = 0
+        self._bytes_reclaimed = 0
+        self._files = 0
+        self._bytes = 0
+        self._last_compaction_at: Optional[float] = None
+        self._last_compaction_seconds = 0.0
+
+    def path_for(self, digest: str, extension: str) -> Path:
+        """Location of the file with this content hash"""
+        shards = [digest[2 * level:2 * level + 2] for level in range(self.fanout)]
+        return self.root.joinpath(*shards, f"{digest}.{extension}")
+
+    def store(self, contents: bytes) -> Tuple[Path, bool]:
+        """
+        Archive an upload unless the same bytes are already stored
+
+        A duplicate refreshes the stored file's modification time, so
+        retention counts from the last time an image was uploaded.
+
+        Args:
+            contents: Raw upload
+
+        Returns:
+            (path of the archived file, whether it was written now)
+        """
+        started = time.perf_counter()
+        digest = hashlib.sha256(contents).hexdigest()
+        extension = EXTENSIONS.get(sniff_image_type(bytes(contents[:SNIFF_BYTES])), 'bin')
+        path = self.path_for(digest, extension)
+
+        existing = self._existing(digest, extension)
+        if existing is not None:
+            try:
+                os.utime(existing)
+                self._deduplicated += 1
+                self._bytes_deduplicated += len(contents)
+                return existing, False
+            except FileNotFoundError:
+                # Deleted by the compactor meanwhile; write it again
+                pass
+
+        try:
+            self._write_atomic(path, contents)
+        except OSError:
+            self._write_errors += 1
+            raise
+        self._stored += 1
+        self._bytes_written += len(contents)
+        metrics.observe_stage('archive_write', time.perf_counter() - started)
+        return path, True
+
+    def _existing(self, digest: str, extension: str) -> Optional[Path]:
+        """The stored file for digest, as uploaded or re-encoded"""
+        for candidate in (extension, 'webp'):
+            path = self.path_for(digest, candidate)
+            if path.exists():
+                return path
+        return None
+
+    def _write_atomic(self, path: Path, contents: bytes, mtime: Optional[float] = None) -> None:
+        """Write to a temporary file next to path and rename it into place"""
+        os.makedirs(path.parent, exist_ok=True)
+        descriptor, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f".{path.stem[:16]}.", suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as f:
+                f.write(contents)
+                if self.fsync:
+                    f.flush()
+                    os.fsync(f.fileno())
+            # mkstemp creates files readable by the owner only
+            os.chmod(temp_path, 0o644)
+            if mtime is not None:
+                os.utime(temp_path, (mtime, mtime))
+            os.replace(temp_path, path)
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def _scan(self) -> Iterator[os.DirEntry]:
+        """Every file in the shard directories"""
+        def walk(directory: str, depth: int) -> Iterator[os.DirEntry]:
+            try:
+                entries = list(os.scandir(directory))
+            except FileNotFoundError:
+                return
+            for entry in entries:
+                if depth < self.fanout:
+                    if entry.is_dir(follow_symlinks=False) and len(entry.name) == 2:
+                        yield from walk(entry.path, depth + 1)
+                elif entry.is_file(follow_symlinks=False):
+                    yield entry
+        return walk(str(self.root), 0)
+
+    def _adopt_flat_files(self) -> None:
+        """
+        Move uploads from before the sharded layout (uuid names in root) into it
+
+        Anything else in the root (a README, logs) is left where it is.
+        """
+        if self.fanout == 0:
+            return
+        foreign = set()
+        for entry in list(os.scandir(self.root)):
+            if entry.name.startswith('.') or not entry.is_file(follow_symlinks=False):
+                continue
+            if not _FLAT_UPLOAD_NAME.fullmatch(entry.name):
+                foreign.add(entry.name)
+                continue
+            try:
+                mtime = entry.stat().st_mtime
+                with open(entry.path, 'rb') as f:
+                    contents = f.read()
+                digest = hashlib.sha256(contents).hexdigest()
+                extension = EXTENSIONS.get(sniff_image_type(contents[:SNIFF_BYTES]), 'bin')
+                if self._existing(digest, extension) is None:
+                    self._write_atomic(self.path_for(digest, extension), contents, mtime=mtime)
+                else:
+                    self._bytes_reclaimed += len(contents)
+                os.unlink(entry.path)
+                self._adopted += 1
+            except OSError:
+                logger.exception("Could not move %s into the archive", entry.path)
+        if foreign and foreign != self._foreign:
+            logger.warning("Leaving files that are not uploads in %s: %s", self.root, ', '.join(sorted(foreign)))
+        self._foreign = frozenset(foreign)
+
+    def _reencode(self, entry: os.DirEntry, size: int, mtime: float) -> int:
+        """
+        Replace a file by a smaller WebP version
+
+        Returns:
+            int: Bytes saved (0 when the file was kept)
+        """
+        from .image_processor import cv2, np
+
+        with open(entry.path, 'rb') as f:
+            contents = f.read()
+        image = cv2.imdecode(np.frombuffer(contents, np.uint8), cv2.IMREAD_COLOR)
+        ok, encoded = False, None
+        if image is not None:
+            ok, encoded = cv2.imencode('.webp', image, [cv2.IMWRITE_WEBP_QUALITY, self.webp_quality])
+        if not ok or len(encoded) >= size:
+            self._mark_incompressible(entry.path)
+            return 0
+
+        digest = entry.name.split('.', 1)[0]
+        self._write_atomic(self.path_for(digest, 'webp'), encoded.tobytes(), mtime=mtime)
+        os.unlink(entry.path)
+        return size - len(encoded)
+
+    def _evict(self, path: str, size: int) -> bool:
+        """Delete a file to make room; False when it was already gone"""
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            return False
+        self._evicted += 1
+        self._bytes_reclaimed += size
+        return True
+
+    def _mark_incompressible(self, path: str) -> None:
+        self._incompressible[path] = None
+        self._incompressible.move_to_end(path)
+        while len(self._incompressible) > _INCOMPRESSIBLE_LIMIT:
+            self._incompressible.popitem(last=False)
+
+    def compact(self, now: Optional[float] = None) -> Optional[Dict[str, Any]]:
+        """
+        Apply the retention policy once
+
+        Only one process compacts a given archive at a time; pre-forked
+        workers that find it busy skip their turn.
+
+        Args:
+            now: Current time (for tests)
+
+        Returns:
+            What this run did, or None when another process was compacting
+        """
+        lock = self._try_lock()
+        if lock is False:
+            return None
+        try:
+            return self._compact(time.time() if now is None else now)
+        finally:
+            if lock is not None:
+                lock.close()
+
+    def _try_lock(self):
+        """Open file holding the compaction lock, None without fcntl, False when busy"""
+        if fcntl is None:
+            return None
+        lock = open(self.root / '.compact.lock', 'a')
+        try:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock.close()
+            return False
+        return lock
+
+    def _compact(self, now: float) -> Dict[str, Any]:
+        started = time.perf_counter()
+        before = (self._expired, self._evicted, self._reencoded, self._adopted, self._bytes_reclaimed)
+        self._adopt_flat_files()
+
+        expire_before = now - self.retention_days * 86400 if self.retention_days else None
+        reencode_before = now - self.webp_after_days * 86400 if self.webp_after_days else None
+
+        # Bytes kept per hour of last upload, to find where size-based eviction stops
+        kept_bytes: Dict[int, int] = {}
+        files = 0
+        total = 0
+        # Rebuilt from the files this run still finds, so removed ones drop out
+        incompressible, self._incompressible = self._incompressible, OrderedDict()
+        for entry in self._scan():
+            mtime = None
+            try:
+                stat = entry.stat(follow_symlinks=False)
+                if entry.name.startswith('.'):
+                    if entry.name.endswith('.tmp') and stat.st_mtime < now - _STALE_TEMP_SECONDS:
+                        os.unlink(entry.path)
+                    continue
+                size, mtime = stat.st_size, stat.st_mtime
+
+                if expire_before is not None and mtime < expire_before:
+                    os.unlink(entry.path)
+                    self._expired += 1
+                    self._bytes_reclaimed += size
+                    continue
+                if entry.path in incompressible:
+                    self._mark_incompressible(entry.path)
+                elif (reencode_before is not None and mtime < reencode_before
+                        and not entry.name.endswith('.webp')):
+                    saved = self._reencode(entry, size, mtime)
+                    if saved:
+                        self._reencoded += 1
+                        self._bytes_reclaimed += saved
+                        size -= saved
+            except FileNotFoundError:
+                # Replaced or removed meanwhile
+                continue
+            except Exception:
+                logger.exception("Could not compact %s", entry.path)
+                if mtime is None:
+                    continue
+
+            hour = int(mtime // _EVICTION_BUCKET_SECONDS)
+            kept_bytes[hour] = kept_bytes.get(hour, 0) + size
+            files += 1
+            total += size
+
+        if self.max_bytes is not None and total > self.max_bytes:
+            # Hours older than the one the excess ends in go whole; in that
+            # hour the oldest files go one by one until the rest fits.
+            # Nothing uploaded after this run started is touched
+            excess = total - self.max_bytes
+            for hour in sorted(kept_bytes):
+                if kept_bytes[hour] >= excess:
+                    break
+                excess -= kept_bytes[hour]
+            whole_before = hour * _EVICTION_BUCKET_SECONDS
+            boundary_before = min(whole_before + _EVICTION_BUCKET_SECONDS, now)
+            boundary = []
+            for entry in self._scan():
+                if entry.name.startswith('.'):
+                    continue
+                try:
+                    stat = entry.stat(follow_symlinks=False)
+                except FileNotFoundError:
+                    continue
+                if stat.st_mtime < whole_before:
+                    if self._evict(entry.path, stat.st_size):
+                        files -= 1
+                        total -= stat.st_size
+                elif stat.st_mtime < boundary_before:
+                    boundary.append((stat.st_mtime, entry.path, stat.st_size))
+
+            for _, path, size in sorted(boundary):
+                if total <= self.max_bytes:
+                    break
+                if self._evict(path, size):
+                    files -= 1
+                    total -= size
+
+        elapsed = time.perf_counter() - started
+        self._files = files
+        self._bytes = total
+        self._compactions += 1
+        self._last_compaction_at = now
+        self._last_compaction_seconds = elapsed
+        metrics.observe_stage('archive_compaction', elapsed)
+
+        after = (self._expired, self._evicted, self._reencoded, self._adopted, self._bytes_reclaimed)
+        run = dict(zip(('expired', 'evicted', 'reencoded', 'adopted', 'bytes_reclaimed'),
+                       (b - a for a, b in zip(before, after))))
+        run.update(files=files, bytes=total, seconds=elapsed)
+        if any(run[name] for name in ('expired', 'evicted', 'reencoded', 'adopted')):
+            logger.info("Archive compaction: %s", run)
+        return run
+
+    def start(self) -> None:
+        """Compact every compact_interval seconds in a background thread"""
+        if self._thread is not None:
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name='archive-compactor', daemon=True)
+        self._thread.start()
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Stop the background thread (a running compaction finishes first)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.compact_interval):
+            try:
+                self.compact()
+            except Exception:
+                logger.exception("Archive compaction failed")
+
+    def stats(self) -> Dict[str, Any]:
+        """Writes, deduplication and space reclaimed, for /health and /metrics"""
+        uploads = self._stored + self._deduplicated
+        return {
+            'stored': self._stored,
+            'deduplicated': self._deduplicated,
+            'dedup_ratio': self._deduplicated / uploads if uploads else 0.0,
+            'bytes_written': self._bytes_written,
+            'bytes_deduplicated': self._bytes_deduplicated,
+            'write_errors': self._write_errors,
+            'compactions': self._compactions,
+            'expired': self._expired,
+            'evicted': self._evicted,
+            'reencoded': self._reencoded,
+            'adopted': self._adopted,
+            'bytes_reclaimed': self._bytes_reclaimed,
+            # As of the last compaction
+            'files': self._files,
+            'bytes': self._bytes,
+            'last_compaction_at': self._last_compaction_at,
+            'last_compaction_seconds': self._last_compaction_seconds,
+        }
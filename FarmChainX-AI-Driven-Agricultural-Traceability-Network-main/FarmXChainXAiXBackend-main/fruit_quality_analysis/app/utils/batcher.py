@@ -0,0 +1,113 @@
+import asyncio
+from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+
+from .executor import AnalysisExecutor
+
+class MicroBatcher:
+    """
+    Coalesces concurrent single-item requests into batched calls
+
+    Items wait until either max_batch_size items are queued or the oldest has
+    waited max_wait_ms, then the whole group is handed to process_batch in one
+    call and each awaiting request gets its own result back.
+    """
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 8,
+        max_wait_ms: float = 5.0,
+        executor: Optional[AnalysisExecutor] = None
+    ):
+        """
+        Args:
+            process_batch: Maps a list of items to a list of results (same order)
+            max_batch_size: Largest batch handed to process_batch
+            max_wait_ms: Longest an item waits for the batch to fill up
+            executor: Pool to run process_batch on; None runs it inline
+        """
+        if max_batch_size < 1:
+            raise ValueError("max_batch_size must be at least 1")
+
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.executor = executor
+
+        self._queue: List[Tuple[Any, asyncio.Future]] = []
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._running: Set[asyncio.Task] = set()
+
+        self._batches = 0
+        self._items = 0
+        self._largest_batch = 0
+
+    async def submit(self, item: Any) -> Any:
+        """
+        Queue an item and wait for its result from the next batch
+
+        Args:
+            item: Input for process_batch
+
+        Returns:
+            The result process_batch produced for this item
+        """
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._queue.append((item, future))
+
+        if len(self._queue) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.max_wait, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        """Dispatch queued items in batches of at most max_batch_size"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._queue:
+            batch = self._queue[:self.max_batch_size]
+            self._queue = self._queue[self.max_batch_size:]
+
+            task = asyncio.ensure_future(self._run_batch(batch))
+            self._running.add(task)
+            task.add_done_callback(self._running.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, asyncio.Future]]) -> None:
+        """Run one batch and fan the results back to the waiting requests"""
+        items = [item for item, _ in batch]
+        self._batches += 1
+        self._items += len(items)
+        self._largest_batch = max(self._largest_batch, len(items))
+
+        try:
+            if self.executor is not None:
+                results = await self.executor.run(self.process_batch, items)
+            else:
+                results = self.process_batch(items)
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        for (_, future), result in zip(batch, results):
+            # The request may have been cancelled (client went away)
+            if not future.done():
+                future.set_result(result)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of batching behaviour"""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'queued': len(self._queue),
+            'batches': self._batches,
+            'items': self._items,
+            'avg_batch_size': self._items / self._batches if self._batches else 0.0,
+            'largest_batch': self._largest_batch,
+        }
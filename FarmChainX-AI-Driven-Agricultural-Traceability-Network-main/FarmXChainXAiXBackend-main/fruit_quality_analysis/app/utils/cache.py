@@ -0,0 +1,231 @@
+import hashlib
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Tuple, Union
+
+from ..models.fruit_analysis import AnalysisResult
+
+logger = logging.getLogger(__name__)
+
+def file_signature(path: Optional[Union[str, os.PathLike]]) -> str:
+    """Size and modification time of a file, so a replaced model file changes cache namespaces"""
+    if path is None:
+        return ''
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return ''
+    return f"{stat.st_size}:{stat.st_mtime_ns}"
+
+class ResultCache:
+    """
+    LRU + TTL cache of analysis results keyed by the hash of the upload bytes
+
+    Results are stored serialized, so memory use is bounded by max_bytes and
+    callers can never mutate a cached entry. An optional SQLite file adds a
+    second tier that survives restarts. Errors of that tier are logged and
+    treated as misses, never raised to the request.
+    """
+
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        max_bytes: int = 32 * 1024 * 1024,
+        ttl_seconds: float = 3600.0,
+        disk_path: Optional[Union[str, os.PathLike]] = None,
+        namespace: str = ''
+    ):
+        """
+        Args:
+            max_entries: Largest number of results held in memory
+            max_bytes: Largest total size of serialized results held in memory
+            ttl_seconds: How long a result stays valid
+            disk_path: SQLite file for the persistent tier, None to disable
+            namespace: Mixed into every key (e.g. the analyzer version) so
+                results from a different scoring never match
+        """
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.namespace = namespace
+        # blake2b keys are limited to 64 bytes; hashing the namespace keeps
+        # all of it significant, however long the model path
+        self._hash_key = hashlib.blake2b(namespace.encode(), digest_size=32).digest()
+
+        self._entries: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+        self.disk_path = os.fspath(disk_path) if disk_path is not None else None
+        self._db = None
+        if self.disk_path is not None:
+            self._connect()
+            # SQLite connections must not be used across fork(); pre-forked
+            # workers each open their own
+            if hasattr(os, 'register_at_fork'):
+                cache = weakref.ref(self)
+                os.register_at_fork(after_in_child=lambda: cache() is not None and cache()._after_fork())
+
+        self._hits = 0
+        self._disk_hits = 0
+        self._misses = 0
+        self._evictions = 0
+        self._expirations = 0
+        self._disk_errors = 0
+
+    def _connect(self) -> None:
+        """Open the persistent tier"""
+        self._db = sqlite3.connect(self.disk_path, check_same_thread=False)
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS analysis_cache ("
+            "key TEXT PRIMARY KEY, value BLOB NOT NULL, expires_at REAL NOT NULL)"
+        )
+        self._db.commit()
+
+    def _after_fork(self) -> None:
+        """Replace the lock and connection inherited from the parent process"""
+        self._lock = threading.Lock()
+        if self._db is not None:
+            self._connect()
+
+    def key(self, data: Union[bytes, bytearray, memoryview], variant: str = '') -> str:
+        """
+        Content hash of the upload bytes within this cache's namespace
+
+        Args:
+            data: Upload bytes
+            variant: Up to 16 characters telling apart results computed
+                differently for the same bytes (e.g. a settings fingerprint)
+        """
+        digest = hashlib.blake2b(data, digest_size=20, key=self._hash_key, person=variant.encode()[:16])
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[AnalysisResult]:
+        """
+        Look up a cached result
+
+        Args:
+            key: Value returned by key()
+
+        Returns:
+            The cached AnalysisResult, or None on a miss
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, expires_at = entry
+                if expires_at > now:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                    return AnalysisResult.model_validate_json(value)
+                self._remove(key)
+                self._expirations += 1
+
+            if self._db is not None:
+                try:
+                    row = self._db.execute(
+                        "SELECT value, expires_at FROM analysis_cache WHERE key = ?", (key,)
+                    ).fetchone()
+                    if row is not None:
+                        value, expires_at = row
+                        if expires_at > now:
+                            self._store(key, value, expires_at)
+                            self._disk_hits += 1
+                            return AnalysisResult.model_validate_json(value)
+                        self._db.execute("DELETE FROM analysis_cache WHERE key = ?", (key,))
+                        self._db.commit()
+                        self._expirations += 1
+                except sqlite3.Error as e:
+                    self._disk_error(e)
+
+            self._misses += 1
+            return None
+
+    def put(self, key: str, result: AnalysisResult) -> None:
+        """
+        Cache a result
+
+        Args:
+            key: Value returned by key()
+            result: Analysis result for the upload
+        """
+        value = result.model_dump_json().encode()
+        expires_at = time.time() + self.ttl_seconds
+        with self._lock:
+            self._store(key, value, expires_at)
+            if self._db is not None:
+                try:
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO analysis_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                        (key, value, expires_at)
+                    )
+                    self._db.commit()
+                except sqlite3.Error as e:
+                    self._disk_error(e)
+
+    def _disk_error(self, error: sqlite3.Error) -> None:
+        """Count a failed persistent-tier operation and undo its transaction (lock held)"""
+        self._disk_errors += 1
+        if self._disk_errors % 100 == 1:
+            logger.warning("Result cache disk tier error (%d so far): %s", self._disk_errors, error)
+        try:
+            self._db.rollback()
+        except sqlite3.Error:
+            pass
+
+    def _store(self, key: str, value: bytes, expires_at: float) -> None:
+        """Insert into the memory tier and evict down to the bounds (lock held)"""
+        if len(value) > self.max_bytes:
+            return
+        self._remove(key)
+        self._entries[key] = (value, expires_at)
+        self._bytes += len(value)
+
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            oldest = next(iter(self._entries))
+            self._remove(oldest)
+            self._evictions += 1
+
+    def _remove(self, key: str) -> None:
+        """Drop a key from the memory tier (lock held)"""
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= len(entry[0])
+
+    def clear(self) -> None:
+        """Empty both tiers"""
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+            if self._db is not None:
+                self._db.execute("DELETE FROM analysis_cache")
+                self._db.commit()
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of cache effectiveness"""
+        with self._lock:
+            lookups = self._hits + self._disk_hits + self._misses
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self._hits,
+                'disk_hits': self._disk_hits,
+                'misses': self._misses,
+                'evictions': self._evictions,
+                'expirations': self._expirations,
+                'disk_errors': self._disk_errors,
+                'hit_ratio': (self._hits + self._disk_hits) / lookups if lookups else 0.0,
+            }
+
+    def close(self) -> None:
+        """Close the persistent tier"""
+        with self._lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
@@ -0,0 +1,132 @@
+import asyncio
+import os
+import threading
+import time
+from concurrent.futures import Executor, ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+EXECUTOR_KINDS = ('thread', 'process')
+
+def _timed_call(fn: Callable[..., Any], *args: Any) -> Tuple[float, Any]:
+    """
+    Run fn in the worker and report when it actually started
+
+    Module level so it can be pickled for process pools. time.time() is used
+    because it is comparable between the parent and worker processes.
+    """
+    started_at = time.time()
+    return started_at, fn(*args)
+
+class AnalysisExecutor:
+    """Runs CPU-bound pipeline work off the event loop on a worker pool"""
+
+    def __init__(self, kind: str = 'thread', max_workers: Optional[int] = None,
+                 initializer: Optional[Callable[..., Any]] = None, initargs: Tuple[Any, ...] = ()):
+        """
+        Args:
+            kind: 'thread' (OpenCV releases the GIL) or 'process'
+            max_workers: Pool size, defaults to the number of CPUs
+            initializer: Called in each new worker (picklable for process pools)
+            initargs: Arguments for initializer
+        """
+        if kind not in EXECUTOR_KINDS:
+            raise ValueError(f"Unknown executor kind '{kind}', expected one of {EXECUTOR_KINDS}")
+
+        self.kind = kind
+        self.max_workers = max_workers or os.cpu_count() or 1
+        self.initializer = initializer
+        self.initargs = initargs
+        self._executor: Optional[Executor] = None
+        self._lock = threading.Lock()
+
+        # Saturation metrics
+        self._pending = 0
+        self._submitted = 0
+        self._completed = 0
+        self._failed = 0
+        self._wait_total = 0.0
+        self._wait_max = 0.0
+        self._run_total = 0.0
+
+    def _get_executor(self) -> Executor:
+        """Create the underlying pool on first use"""
+        if self._executor is None:
+            with self._lock:
+                if self._executor is None:
+                    if self.kind == 'process':
+                        self._executor = ProcessPoolExecutor(
+                            max_workers=self.max_workers,
+                            initializer=self.initializer,
+                            initargs=self.initargs
+                        )
+                    else:
+                        self._executor = ThreadPoolExecutor(
+                            max_workers=self.max_workers,
+                            thread_name_prefix='analysis',
+                            initializer=self.initializer,
+                            initargs=self.initargs
+                        )
+        return self._executor
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run fn(*args) on the pool and await its result
+
+        Args:
+            fn: Callable to run (must be picklable for process pools)
+            *args: Positional arguments for fn
+
+        Returns:
+            Whatever fn returns
+        """
+        loop = asyncio.get_running_loop()
+        submitted_at = time.time()
+        with self._lock:
+            self._pending += 1
+            self._submitted += 1
+
+        # If fn raises we never learn when it started; count it as no wait
+        failed = True
+        started_at = submitted_at
+        try:
+            started_at, result = await loop.run_in_executor(
+                self._get_executor(), _timed_call, fn, *args
+            )
+            failed = False
+            return result
+        finally:
+            finished_at = time.time()
+            wait = max(0.0, started_at - submitted_at)
+            with self._lock:
+                self._pending -= 1
+                self._completed += 1
+                self._failed += int(failed)
+                self._wait_total += wait
+                self._wait_max = max(self._wait_max, wait)
+                self._run_total += max(0.0, finished_at - started_at)
+
+    def stats(self) -> Dict[str, Any]:
+        """Snapshot of pool saturation metrics"""
+        with self._lock:
+            completed = self._completed
+            return {
+                'kind': self.kind,
+                'max_workers': self.max_workers,
+                'in_flight': self._pending,
+                # Pools start tasks FIFO as soon as a worker frees up, so
+                # anything beyond max_workers is waiting in the queue
+                'queue_depth': max(0, self._pending - self.max_workers),
+                'submitted': self._submitted,
+                'completed': completed,
+                'failed': self._failed,
+                'wait_seconds_avg': self._wait_total / completed if completed else 0.0,
+                'wait_seconds_max': self._wait_max,
+                'run_seconds_avg': self._run_total / completed if completed else 0.0,
+            }
+
+    def shutdown(self, wait: bool = True) -> None:
+        """Stop the pool; it is recreated if the executor is used again"""
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=wait)
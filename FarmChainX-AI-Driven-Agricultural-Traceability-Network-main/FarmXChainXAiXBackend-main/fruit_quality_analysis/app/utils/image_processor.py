@@ -1,24 +1,235 @@
-import cv2
 import numpy as np
-from typing import Tuple, Dict, Any
+from typing import Tuple, Dict, Any, Optional, Sequence, Union
 import os
+import threading
+
+from .lazy import lazy_import
+from .metrics import stage, record_image_size
+from .settings import Settings, current_settings
+
+# OpenCV is imported on first use (or by the startup warm-up)
+cv2 = lazy_import('cv2')
+
+# Anything that exposes the buffer protocol (bytes, bytearray, memoryview)
+ImageBuffer = Union[bytes, bytearray, memoryview]
+
+# JPEG start-of-frame markers (baseline, progressive, lossless, ...) carry the
+# image dimensions; 0xC4, 0xC8 and 0xCC share the range but are not frames
+_JPEG_SOF_MARKERS = frozenset(range(0xC0, 0xD0)) - {0xC4, 0xC8, 0xCC}
+
+def _jpeg_size(data: ImageBuffer) -> Optional[Tuple[int, int]]:
+    """
+    Read (width, height) from a JPEG header without decoding it
+    
+    Returns None for anything that is not a well-formed JPEG.
+    """
+    view = memoryview(data).cast('B')
+    size = len(view)
+    if size < 4 or view[0] != 0xFF or view[1] != 0xD8:
+        return None
+    
+    offset = 2
+    while offset + 9 < size:
+        if view[offset] != 0xFF:
+            return None
+        marker = view[offset + 1]
+        if marker == 0xFF:
+            # Padding before a marker
+            offset += 1
+            continue
+        if marker == 0x01 or 0xD0 <= marker <= 0xD8:
+            # Markers without a length field
+            offset += 2
+            continue
+        if marker in _JPEG_SOF_MARKERS:
+            height = (view[offset + 5] << 8) | view[offset + 6]
+            width = (view[offset + 7] << 8) | view[offset + 8]
+            return width, height
+        offset += 2 + ((view[offset + 2] << 8) | view[offset + 3])
+    return None
+
+class ProcessedImage:
+    """
+    Features extracted from one image, and nothing else
+    
+    The decoded frame is dropped as soon as the features exist, so an
+    in-flight request only holds the small model tensor and histogram. Item
+    access (image_data['color_histogram']) is kept for code written against
+    the dictionary that process_image() used to return.
+    """
+    
+    __slots__ = ('processed_image', 'color_histogram', 'image_path', 'image_size', 'settings')
+    
+    def __init__(self, processed_image: np.ndarray, color_histogram: np.ndarray,
+                 image_path: Optional[str] = None, image_size: Optional[Tuple[int, int]] = None,
+                 settings: Optional[Settings] = None):
+        """
+        Args:
+            processed_image: Model input tensor with a batch dimension of 1
+            color_histogram: Flattened HSV histogram
+            image_path: Source file, None for in-memory uploads
+            image_size: (width, height) of the decoded frame
+            settings: Snapshot the features were extracted with; the analysis
+                must score with the same one
+        """
+        self.processed_image = processed_image
+        self.color_histogram = color_histogram
+        self.image_path = image_path
+        self.image_size = image_size
+        self.settings = settings
+    
+    def __getitem__(self, key: str) -> Any:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+    
+    def __contains__(self, key: object) -> bool:
+        return key in self.__slots__
+    
+    def get(self, key: str, default: Any = None) -> Any:
+        """Dictionary-style lookup with a default"""
+        return getattr(self, key) if key in self.__slots__ else default
+    
+    @property
+    def nbytes(self) -> int:
+        """Memory held by the feature arrays"""
+        return self.processed_image.nbytes + self.color_histogram.nbytes
+
+class Preprocessor:
+    """
+    Fused resize, colour conversion and scaling into reusable buffers
+    
+    The intermediate images (the resized frame, its RGB and HSV versions)
+    live in scratch buffers owned by the calling thread and are reused for
+    every image of the same target size. OpenCV writes into them through its
+    dst= arguments and the float scaling writes straight into the output, so
+    the only allocation per image is the output itself, or none when the
+    caller passes slots of a preallocated batch.
+    """
+    
+    def __init__(self):
+        self._local = threading.local()
+    
+    def scratch(self, name: str, shape: Tuple[int, ...], dtype=np.uint8) -> np.ndarray:
+        """This thread's buffer called name, reallocated only when its shape changes"""
+        buffers = self._local.__dict__.setdefault('buffers', {})
+        buffer = buffers.get(name)
+        if buffer is None or buffer.shape != shape or buffer.dtype != dtype:
+            buffer = buffers[name] = np.empty(shape, dtype=dtype)
+        return buffer
+    
+    def _resize(self, image: np.ndarray, target_size: Tuple[int, int]) -> np.ndarray:
+        width, height = target_size
+        small = self.scratch('small', (height, width, 3))
+        cv2.resize(image, target_size, dst=small, interpolation=cv2.INTER_AREA)
+        return small
+    
+    def _model_input(self, small: np.ndarray, out: np.ndarray) -> None:
+        """Write the RGB tensor for a resized BGR image into out ([0, 1] floats or uint8 pixels)"""
+        if out.dtype == np.uint8:
+            # Quantized models take the pixels as they are
+            cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=out)
+            return
+        rgb = self.scratch('rgb', small.shape)
+        cv2.cvtColor(small, cv2.COLOR_BGR2RGB, dst=rgb)
+        # Same float32 division as normalize_image(), without the astype copy
+        np.divide(rgb, np.float32(255.0), out=out)
+    
+    def _histogram(self, small: np.ndarray, bins: int, out: np.ndarray) -> None:
+        """Write the flattened, per-channel L2-normalized HSV histogram into out"""
+        hsv = self.scratch('hsv', small.shape)
+        cv2.cvtColor(small, cv2.COLOR_BGR2HSV, dst=hsv)
+        for channel in range(3):
+            channel_hist = out[channel * bins:(channel + 1) * bins].reshape(bins, 1)
+            cv2.calcHist([hsv], [channel], None, [bins], [0, 256], hist=channel_hist)
+            cv2.normalize(channel_hist, channel_hist)
+    
+    def model_input(self, image: np.ndarray, target_size: Tuple[int, int],
+                    out: Optional[np.ndarray] = None, dtype: Any = np.float32) -> np.ndarray:
+        """
+        Resize, convert BGR to RGB and scale to [0, 1]
+        
+        Args:
+            image: Input image in BGR format
+            target_size: Model input (width, height)
+            out: (1, height, width, 3) array to fill, allocated if None
+            dtype: Dtype of the allocated tensor; uint8 keeps the pixel values
+            
+        Returns:
+            The model tensor with its batch dimension (out when given)
+        """
+        width, height = target_size
+        if out is None:
+            out = np.empty((1, height, width, 3), dtype=dtype)
+        self._model_input(self._resize(image, target_size), out[0])
+        return out
+    
+    def features(self, image: np.ndarray, target_size: Tuple[int, int], bins: int,
+                 tensor_out: Optional[np.ndarray] = None,
+                 hist_out: Optional[np.ndarray] = None,
+                 dtype: Any = np.float32) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Model tensor and color histogram from a single resize
+        
+        Args:
+            image: Input image in BGR format
+            target_size: Model input (width, height)
+            bins: Histogram bins per channel
+            tensor_out: (1, height, width, 3) slot to fill, e.g. a batch row
+            hist_out: (3 * bins,) float32 slot to fill
+            dtype: Dtype of an allocated tensor: float32 in [0, 1], or uint8
+                pixels for quantized models
+            
+        Returns:
+            (model tensor with batch dimension, flattened color histogram);
+            without slots, float32 outputs are views of one new allocation
+        """
+        width, height = target_size
+        tensor_size = height * width * 3
+        if tensor_out is None and hist_out is None and np.dtype(dtype) == np.float32:
+            block = np.empty(tensor_size + 3 * bins, dtype=np.float32)
+            tensor_out = block[:tensor_size].reshape(1, height, width, 3)
+            hist_out = block[tensor_size:]
+        if tensor_out is None:
+            tensor_out = np.empty((1, height, width, 3), dtype=dtype)
+        if hist_out is None:
+            hist_out = np.empty(3 * bins, dtype=np.float32)
+        
+        with stage('preprocess'):
+            small = self._resize(image, target_size)
+            self._model_input(small, tensor_out[0])
+        
+        with stage('histogram'):
+            self._histogram(small, bins, hist_out)
+        return tensor_out, hist_out
+
+# Shared by every caller; the buffers themselves are per thread
+preprocessor = Preprocessor()
 
 class ImageProcessor:
     """Handles image processing tasks for fruit analysis"""
     
     @staticmethod
-    def load_image(image_path: str) -> np.ndarray:
+    def load_image(image_path: str, min_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
         """
         Load an image from the given path
         
         Args:
             image_path: Path to the image file
+            min_size: Smallest (width, height) the caller needs; JPEGs larger
+                than this are decoded at reduced resolution
             
         Returns:
             np.ndarray: Loaded image in BGR format
         """
         if not os.path.exists(image_path):
             raise FileNotFoundError(f"Image not found at {image_path}")
+        
+        if min_size is not None:
+            try:
+                return ImageProcessor.decode_image(np.fromfile(image_path, dtype=np.uint8), min_size)
+            except ValueError:
+                raise ValueError(f"Could not read image at {image_path}")
             
         image = cv2.imread(image_path)
         if image is None:
@@ -27,17 +238,75 @@ class ImageProcessor:
         return image
     
     @staticmethod
-    def resize_image(image: np.ndarray, target_size: Tuple[int, int] = (224, 224)) -> np.ndarray:
+    def reduced_decode_flag(image_size: Optional[Tuple[int, int]], min_size: Tuple[int, int]) -> int:
+        """
+        Pick the cheapest OpenCV decode mode that still yields at least min_size
+        
+        JPEG can be decoded at 1/2, 1/4 or 1/8 scale directly in the DCT
+        domain, which is far cheaper than a full decode followed by a resize.
+        
+        Args:
+            image_size: (width, height) of the encoded image, None if unknown
+            min_size: Smallest (width, height) the caller needs
+            
+        Returns:
+            cv2.IMREAD_* flag for cv2.imdecode
+        """
+        if image_size is None:
+            return cv2.IMREAD_COLOR
+        
+        # EXIF orientation may swap the axes, so compare against the tighter side
+        shortest_side = min(image_size)
+        needed = max(min_size)
+        for factor, flag in ((8, cv2.IMREAD_REDUCED_COLOR_8),
+                             (4, cv2.IMREAD_REDUCED_COLOR_4),
+                             (2, cv2.IMREAD_REDUCED_COLOR_2)):
+            if shortest_side // factor >= needed:
+                return flag
+        return cv2.IMREAD_COLOR
+    
+    @staticmethod
+    def decode_image(data: ImageBuffer, min_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+        """
+        Decode an encoded image (JPEG, PNG, ...) held in memory
+        
+        Args:
+            data: Encoded image bytes
+            min_size: Smallest (width, height) the caller needs; JPEGs larger
+                than this are decoded at reduced resolution
+            
+        Returns:
+            np.ndarray: Decoded image in BGR format
+        """
+        # np.frombuffer gives a zero-copy view over the upload bytes
+        buffer = np.frombuffer(data, dtype=np.uint8)
+        if buffer.size == 0:
+            raise ValueError("Image buffer is empty")
+        
+        flag = cv2.IMREAD_COLOR
+        if min_size is not None:
+            flag = ImageProcessor.reduced_decode_flag(_jpeg_size(buffer), min_size)
+            
+        image = cv2.imdecode(buffer, flag)
+        if image is None:
+            raise ValueError("Could not decode image buffer")
+            
+        return image
+    
+    @staticmethod
+    def resize_image(image: np.ndarray, target_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
         """
         Resize the image to the target dimensions
         
         Args:
             image: Input image
-            target_size: Target (width, height) dimensions
+            target_size: Target (width, height) dimensions, defaults to the
+                current settings' target_size
             
         Returns:
             Resized image
         """
+        target_size = target_size or current_settings().target_size
         return cv2.resize(image, target_size, interpolation=cv2.INTER_AREA)
     
     @staticmethod
@@ -54,46 +323,44 @@ class ImageProcessor:
         return image.astype('float32') / 255.0
     
     @staticmethod
-    def preprocess_for_model(image: np.ndarray) -> np.ndarray:
+    def preprocess_for_model(image: np.ndarray, target_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
         """
-        Preprocess image for the model (resize and normalize)
+        Preprocess image for the model (resize, BGR to RGB and normalize)
+        
+        The channel swap commutes with the per-channel resize, so it runs on
+        the small image; the result equals converting first. Intermediates
+        go to per-thread buffers (see Preprocessor).
         
         Args:
             image: Input image in BGR format
+            target_size: Model input (width, height), defaults to the current settings
             
         Returns:
             Preprocessed image ready for model input
         """
-        # Convert BGR to RGB
-        image_rgb = cv2.cvtColor(image, cv2.COLOR_BGR2RGB)
-        
-        # Resize to model's expected sizing
-        resized = ImageProcessor.resize_image(image_rgb)
-        
-        # Normalize pixel values
-        normalized = ImageProcessor.normalize_image(resized)
-        
-        # Add batch dimension
-        return np.expand_dims(normalized, axis=0)
+        return preprocessor.model_input(image, target_size or current_settings().target_size)
     
     @staticmethod
-    def extract_color_histogram(image: np.ndarray) -> np.ndarray:
+    def extract_color_histogram(image: np.ndarray, bins: Optional[int] = None) -> np.ndarray:
         """
         Extract color histogram features from the image
         
         Args:
             image: Input image in BGR format
+            bins: Bins per channel, defaults to the current settings' hist_bins
             
         Returns:
-            Flattened color histogram features
+            Flattened color histogram features (3 * bins values)
         """
+        bins = bins or current_settings().hist_bins
+        
         # Convert to HSV color space
         hsv = cv2.cvtColor(image, cv2.COLOR_BGR2HSV)
         
         # Compute histogram for each channel
-        hist_h = cv2.calcHist([hsv], [0], None, [256], [0, 256])
-        hist_s = cv2.calcHist([hsv], [1], None, [256], [0, 256])
-        hist_v = cv2.calcHist([hsv], [2], None, [256], [0, 256])
+        hist_h = cv2.calcHist([hsv], [0], None, [bins], [0, 256])
+        hist_s = cv2.calcHist([hsv], [1], None, [bins], [0, 256])
+        hist_v = cv2.calcHist([hsv], [2], None, [bins], [0, 256])
         
         # Normalize histograms
         hist_h = cv2.normalize(hist_h, hist_h).flatten()
@@ -102,32 +369,119 @@ class ImageProcessor:
         
         # Concatenate features
         return np.hstack([hist_h, hist_s, hist_v])
+    
+    @staticmethod
+    def extract_features(image: np.ndarray, target_size: Optional[Tuple[int, int]] = None,
+                         bins: Optional[int] = None) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Derive the model tensor and the color histogram from one resize
+        
+        The image is shrunk to the model input size once; the RGB tensor and
+        the HSV histogram are both computed from that small image instead of
+        converting the full-resolution frame twice.
+        
+        Args:
+            image: Input image in BGR format
+            target_size: Model input (width, height), defaults to the current settings
+            bins: Histogram bins per channel, defaults to the current settings
+            
+        Returns:
+            (model tensor with batch dimension, flattened color histogram)
+        """
+        settings = current_settings()
+        return preprocessor.features(image, target_size or settings.target_size, bins or settings.hist_bins)
 
-def process_image(image_path: str) -> Dict[str, Any]:
+def process_image(source: Union[str, os.PathLike, ImageBuffer],
+                  settings: Optional[Settings] = None, input_dtype: Any = np.float32) -> ProcessedImage:
     """
     Process an image and extract features for analysis
     
     Args:
-        image_path: Path to the image file
+        source: Path to the image file, or the encoded image bytes
+        settings: Settings snapshot to use, defaults to the current one
+        input_dtype: Model tensor dtype (ModelHandle.input_dtype): float32
+            in [0, 1], or uint8 pixels for quantized models
         
     Returns:
-        Dictionary containing processed image data and features
+        ProcessedImage: Model tensor and color histogram; the decoded frame
+        itself is released before returning
     """
+    settings = settings or current_settings()
     try:
         # Initialize processor
         processor = ImageProcessor()
         
-        # Load and process image
-        image = processor.load_image(image_path)
-        processed_image = processor.preprocess_for_model(image)
-        color_hist = processor.extract_color_histogram(image)
+        # Large JPEGs only need decoding down to the model's input size
+        min_size = settings.target_size if settings.reduced_decode else None
+        
+        # Load and process image; buffers are decoded without touching disk
+        with stage('decode'):
+            if isinstance(source, (str, os.PathLike)):
+                image_path = os.fspath(source)
+                image = processor.load_image(image_path, min_size)
+            else:
+                image_path = None
+                image = processor.decode_image(source, min_size)
+        processed_image, color_hist = preprocessor.features(
+            image, settings.target_size, settings.hist_bins, dtype=input_dtype
+        )
+        image_size = (image.shape[1], image.shape[0])
+        record_image_size(image_size)
+        del image
         
-        return {
-            'original_image': image,
-            'processed_image': processed_image,
-            'color_histogram': color_hist,
-            'image_path': image_path
-        }
+        return ProcessedImage(processed_image, color_hist, image_path, image_size, settings)
         
     except Exception as e:
         raise ValueError(f"Error processing image: {str(e)}")
+
+def process_images(sources: Sequence[Union[str, os.PathLike, ImageBuffer]],
+                   settings: Optional[Settings] = None, input_dtype: Any = np.float32) -> Dict[str, Any]:
+    """
+    Process a batch of images and extract features for batched analysis
+    
+    Args:
+        sources: Paths to image files and/or encoded image bytes
+        settings: Settings snapshot to use, defaults to the current one
+        input_dtype: Model tensor dtype, as for process_image()
+        
+    Returns:
+        Dictionary with an (N, H, W, 3) model tensor, an (N, 3 * hist_bins)
+        matrix of color histograms and the image paths (None for in-memory images)
+    """
+    if not sources:
+        raise ValueError("No images to process")
+    
+    settings = settings or current_settings()
+    processor = ImageProcessor()
+    min_size = settings.target_size if settings.reduced_decode else None
+    width, height = settings.target_size
+    
+    # Each image is preprocessed straight into its row of the batch
+    processed_images = np.empty((len(sources), height, width, 3), dtype=input_dtype)
+    color_histograms = np.empty((len(sources), 3 * settings.hist_bins), dtype=np.float32)
+    image_paths = []
+    
+    for index, source in enumerate(sources):
+        try:
+            with stage('decode'):
+                if isinstance(source, (str, os.PathLike)):
+                    image_paths.append(os.fspath(source))
+                    image = processor.load_image(os.fspath(source), min_size)
+                else:
+                    image_paths.append(None)
+                    image = processor.decode_image(source, min_size)
+            record_image_size((image.shape[1], image.shape[0]))
+            
+            preprocessor.features(
+                image, settings.target_size, settings.hist_bins,
+                tensor_out=processed_images[index:index + 1],
+                hist_out=color_histograms[index]
+            )
+        except Exception as e:
+            raise ValueError(f"Error processing image {index}: {str(e)}")
+    
+    return {
+        'processed_images': processed_images,
+        'color_histograms': color_histograms,
+        'image_paths': image_paths
+    }
@@ -0,0 +1,259 @@
+"""
+Inference backends the model registry can load a trained model into.
+
+Every backend takes the pipeline's (N, H, W, 3) RGB batch, either float32
+in [0, 1] or uint8 pixels, and returns (N, num_classes) probabilities.
+Quantized models advertise uint8 as their input_dtype so the preprocessor
+hands them pixels directly instead of scaling to float and back.
+
+The runtimes are optional dependencies and imported only when a backend
+of that kind is loaded:
+
+- keras: tf.keras.models.load_model (.h5, .keras or a Keras SavedModel)
+- savedmodel: the serving signature of any TF SavedModel, without Keras
+- tflite: tflite_runtime, or tf.lite when only TensorFlow is installed
+- onnx: onnxruntime on the CPU
+"""
+import abc
+import os
+from typing import Any, Dict, Optional, Tuple, Type
+
+import numpy as np
+
+from config import MODEL_CONFIG
+
+def _require(module: str, backend: str, package: str) -> Any:
+    """Import a runtime, naming the package to install when it is missing"""
+    import importlib
+    try:
+        return importlib.import_module(module)
+    except ImportError as e:
+        raise ImportError(
+            f"The '{backend}' inference backend needs {package} (pip install {package})"
+        ) from e
+
+def _inference_threads() -> Tuple[int, int]:
+    """(intra-op, inter-op) threads from the threading policy"""
+    from .threading_policy import active_policy, configured_policy
+    policy = active_policy() or configured_policy()
+    return policy.tf_intra_op_threads, policy.tf_inter_op_threads
+
+def to_float(batch: np.ndarray) -> np.ndarray:
+    """A pipeline batch as float32 in [0, 1]"""
+    if batch.dtype == np.uint8:
+        return batch.astype(np.float32) / np.float32(255.0)
+    return batch.astype(np.float32, copy=False)
+
+def quantize(batch: np.ndarray, scale: float, zero_point: int, dtype: Any) -> np.ndarray:
+    """
+    A pipeline batch in a quantized model's input encoding (q = x / scale + zero_point)
+
+    Models quantized for [0, 1] inputs use scale 1/255, so uint8 pixels map
+    to q = pixel + zero_point with integer arithmetic only.
+    """
+    dtype = np.dtype(dtype)
+    limits = np.iinfo(dtype)
+    if batch.dtype == np.uint8 and np.isclose(scale * 255.0, 1.0):
+        if zero_point == 0 and dtype == np.uint8:
+            return batch
+        values = batch.astype(np.int16) + np.int16(zero_point)
+    else:
+        values = np.round(to_float(batch) / np.float32(scale)) + zero_point
+    return np.clip(values, limits.min, limits.max).astype(dtype)
+
+def dequantize(output: np.ndarray, scale: float, zero_point: int) -> np.ndarray:
+    """Quantized model output back to real values; float outputs pass through"""
+    if not scale or output.dtype.kind == 'f':
+        return output
+    return (output.astype(np.float32) - np.float32(zero_point)) * np.float32(scale)
+
+class InferenceBackend(abc.ABC):
+    """Runs one loaded model; subclasses wrap a specific runtime"""
+
+    name = 'base'
+    # What the preprocessor should produce for this model
+    input_dtype = np.dtype(np.float32)
+
+    @classmethod
+    @abc.abstractmethod
+    def load(cls, model_path: str) -> 'InferenceBackend':
+        """Load the model at model_path into this runtime"""
+
+    @abc.abstractmethod
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        """
+        Class probabilities for a batch
+
+        Args:
+            batch: (N, H, W, 3) RGB, float32 in [0, 1] or uint8 pixels
+
+        Returns:
+            (N, num_classes) array
+        """
+
+    def info(self) -> Dict[str, Any]:
+        """Summary for health reporting"""
+        return {'backend': self.name, 'input_dtype': self.input_dtype.name}
+
+class KerasBackend(InferenceBackend):
+    """Any model called as model(batch, training=False), e.g. a Keras model"""
+
+    name = 'keras'
+
+    def __init__(self, model: Any):
+        self.model = model
+
+    @classmethod
+    def load(cls, model_path: str) -> 'KerasBackend':
+        tf = _require('tensorflow', cls.name, 'tensorflow')
+        from .threading_policy import configure_tensorflow
+        configure_tensorflow(tf)
+        return cls(tf.keras.models.load_model(model_path, compile=False))
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        return np.asarray(self.model(to_float(batch), training=False))
+
+class SavedModelBackend(InferenceBackend):
+    """The serving_default signature of a TensorFlow SavedModel"""
+
+    name = 'savedmodel'
+
+    def __init__(self, signature: Any, input_name: str, input_dtype: Any = np.float32):
+        """
+        Args:
+            signature: Concrete function taking the input as a keyword argument
+            input_name: That keyword
+            input_dtype: Input dtype declared by the signature
+        """
+        self.signature = signature
+        self.input_name = input_name
+        self.input_dtype = np.dtype(input_dtype)
+
+    @classmethod
+    def load(cls, model_path: str) -> 'SavedModelBackend':
+        tf = _require('tensorflow', cls.name, 'tensorflow')
+        from .threading_policy import configure_tensorflow
+        configure_tensorflow(tf)
+        signature = tf.saved_model.load(model_path).signatures['serving_default']
+        input_name, spec = next(iter(signature.structured_input_signature[1].items()))
+        return cls(signature, input_name, spec.dtype.as_numpy_dtype)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if self.input_dtype != np.uint8:
+            batch = to_float(batch).astype(self.input_dtype, copy=False)
+        outputs = self.signature(**{self.input_name: batch})
+        return np.asarray(next(iter(outputs.values())))
+
+class TFLiteBackend(InferenceBackend):
+    """
+    A TensorFlow Lite interpreter, float or integer quantized
+
+    Quantized models (uint8 or int8 input) take uint8 pixels from the
+    preprocessor; their outputs are dequantized. The interpreter is resized
+    whenever the batch size changes, which the warm-up does for the
+    configured sizes ahead of time.
+    """
+
+    name = 'tflite'
+
+    def __init__(self, interpreter: Any):
+        self.interpreter = interpreter
+        self._input = interpreter.get_input_details()[0]
+        self._output = interpreter.get_output_details()[0]
+        self._batch_size: Optional[int] = None
+        self.input_scale, self.input_zero_point = self._input['quantization']
+        self.output_scale, self.output_zero_point = self._output['quantization']
+        self.quantized = np.dtype(self._input['dtype']).kind in 'ui'
+        self.input_dtype = np.dtype(np.uint8 if self.quantized else np.float32)
+
+    @classmethod
+    def load(cls, model_path: str) -> 'TFLiteBackend':
+        try:
+            from tflite_runtime.interpreter import Interpreter
+        except ImportError:
+            Interpreter = _require('tensorflow', cls.name, 'tflite-runtime').lite.Interpreter
+        threads, _ = _inference_threads()
+        interpreter = Interpreter(model_path=model_path, num_threads=threads)
+        interpreter.allocate_tensors()
+        return cls(interpreter)
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if len(batch) != self._batch_size:
+            self.interpreter.resize_tensor_input(self._input['index'], batch.shape)
+            self.interpreter.allocate_tensors()
+            self._batch_size = len(batch)
+
+        if self.quantized:
+            batch = quantize(batch, self.input_scale, self.input_zero_point, self._input['dtype'])
+        else:
+            batch = to_float(batch)
+        self.interpreter.set_tensor(self._input['index'], batch)
+        self.interpreter.invoke()
+        output = self.interpreter.get_tensor(self._output['index'])
+        return dequantize(output, self.output_scale, self.output_zero_point)
+
+    def info(self) -> Dict[str, Any]:
+        return dict(super().info(), quantized=self.quantized)
+
+class ONNXBackend(InferenceBackend):
+    """An ONNX Runtime session on the CPU execution provider"""
+
+    name = 'onnx'
+
+    # ONNX element types the pipeline can feed
+    _DTYPES = {'tensor(float)': np.float32, 'tensor(float16)': np.float16, 'tensor(uint8)': np.uint8}
+
+    def __init__(self, session: Any):
+        self.session = session
+        model_input = session.get_inputs()[0]
+        if model_input.type not in self._DTYPES:
+            raise ValueError(f"Unsupported ONNX input type {model_input.type}")
+        self.input_name = model_input.name
+        self.input_dtype = np.dtype(self._DTYPES[model_input.type])
+        # Models exported from PyTorch usually take NCHW
+        shape = model_input.shape
+        self.channels_first = len(shape) == 4 and shape[1] == 3 and shape[3] != 3
+
+    @classmethod
+    def load(cls, model_path: str) -> 'ONNXBackend':
+        ort = _require('onnxruntime', cls.name, 'onnxruntime')
+        options = ort.SessionOptions()
+        options.intra_op_num_threads, options.inter_op_num_threads = _inference_threads()
+        return cls(ort.InferenceSession(model_path, options, providers=['CPUExecutionProvider']))
+
+    def predict(self, batch: np.ndarray) -> np.ndarray:
+        if self.input_dtype != np.uint8:
+            batch = to_float(batch).astype(self.input_dtype, copy=False)
+        if self.channels_first:
+            batch = np.ascontiguousarray(batch.transpose(0, 3, 1, 2))
+        return np.asarray(self.session.run(None, {self.input_name: batch})[0])
+
+    def info(self) -> Dict[str, Any]:
+        return dict(super().info(), channels_first=self.channels_first)
+
+BACKENDS: Dict[str, Type[InferenceBackend]] = {
+    backend.name: backend for backend in (KerasBackend, SavedModelBackend, TFLiteBackend, ONNXBackend)
+}
+
+def backend_for(model_path: str, backend: str = 'auto') -> Type[InferenceBackend]:
+    """
+    Backend class for a model file
+
+    Args:
+        model_path: Model file or SavedModel directory
+        backend: A BACKENDS name, or 'auto' to go by the file extension
+            (.tflite, .onnx, anything else through Keras)
+
+    Raises:
+        ValueError: For an unknown backend name
+    """
+    if backend == 'auto':
+        extension = os.path.splitext(model_path.rstrip('/\\'))[1].lower()
+        backend = {'.tflite': 'tflite', '.onnx': 'onnx'}.get(extension, 'keras')
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown inference backend '{backend}', expected one of {sorted(BACKENDS)} or 'auto'")
+    return BACKENDS[backend]
+
+def load_backend(model_path: str, backend: Optional[str] = None) -> InferenceBackend:
+    """Load model_path into the configured (MODEL_CONFIG['backend']) or given backend"""
+    return backend_for(model_path, backend or MODEL_CONFIG['backend']).load(model_path)
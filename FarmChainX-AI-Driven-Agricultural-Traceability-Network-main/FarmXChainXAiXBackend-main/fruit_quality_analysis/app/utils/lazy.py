@@ -0,0 +1,43 @@
+import importlib
+import threading
+from types import ModuleType
+from typing import Any, Optional
+
+class LazyModule:
+    """
+    Stand-in for a module that is only imported on first attribute access
+
+    Keeps heavy dependencies (OpenCV, TensorFlow) out of the import path of
+    the API so workers start quickly; the cost is paid by the first caller or
+    by the background warm-up.
+    """
+
+    def __init__(self, name: str):
+        self._name = name
+        self._module: Optional[ModuleType] = None
+        self._lock = threading.Lock()
+
+    def load(self) -> ModuleType:
+        """Import the module now (no-op if already imported)"""
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self._name)
+        return self._module
+
+    @property
+    def loaded(self) -> bool:
+        """Whether the real module has been imported"""
+        return self._module is not None
+
+    def __getattr__(self, attr: str) -> Any:
+        # Only called for names not found on the proxy itself
+        return getattr(self.load(), attr)
+
+    def __repr__(self) -> str:
+        state = 'loaded' if self.loaded else 'not loaded'
+        return f"<lazy module '{self._name}' ({state})>"
+
+def lazy_import(name: str) -> LazyModule:
+    """Return a proxy that imports module name on first use"""
+    return LazyModule(name)
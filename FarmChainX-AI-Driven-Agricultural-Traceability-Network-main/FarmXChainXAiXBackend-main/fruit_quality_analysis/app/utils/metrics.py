@@ -0,0 +1,518 @@
+import bisect
+import contextvars
+import json
+import logging
+import os
+import tempfile
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from typing import Any, Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+from config import METRICS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Default buckets, in seconds, for pipeline stage latencies
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Upload sizes, in bytes (16 KB .. 32 MB)
+SIZE_BUCKETS = tuple(16 * 1024 * 2 ** i for i in range(12))
+
+# Decoded image sizes, in megapixels
+PIXEL_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.0, 4.0, 8.0, 12.0, 16.0, 24.0, 48.0)
+
+LabelValues = Tuple[str, ...]
+
+def _format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    """Render {name="value",...} for the text exposition format"""
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def _escape(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('\n', '\\n').replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+class _Metric:
+    """Shared bookkeeping for labelled metrics"""
+
+    kind = ''
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, Any]) -> LabelValues:
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+    def _header(self) -> List[str]:
+        return [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.kind}"]
+
+    def samples(self) -> Dict[LabelValues, Any]:
+        """Copy of the current values per label set"""
+        with self._lock:
+            return dict(self._values)
+
+    @staticmethod
+    def merge(samples: Dict[LabelValues, Any], other: Dict[LabelValues, Any]) -> None:
+        """Add another process's samples into samples"""
+        for key, value in other.items():
+            samples[key] = samples.get(key, 0.0) + value
+
+class Counter(_Metric):
+    """Monotonically increasing count"""
+
+    kind = 'counter'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    def render(self, samples: Optional[Dict[LabelValues, float]] = None) -> List[str]:
+        items = sorted((self.samples() if samples is None else samples).items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Gauge(_Metric):
+    """Value that goes up and down"""
+
+    kind = 'gauge'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        super().__init__(name, documentation, labelnames)
+        self._values: Dict[LabelValues, float] = {}
+
+    def inc(self, amount: float = 1.0, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def dec(self, amount: float = 1.0, **labels: Any) -> None:
+        self.inc(-amount, **labels)
+
+    def set(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = value
+
+    def value(self, **labels: Any) -> float:
+        return self._values.get(self._key(labels), 0.0)
+
+    @contextmanager
+    def track_inprogress(self, **labels: Any) -> Iterator[None]:
+        """Count the enclosed block as in flight"""
+        self.inc(**labels)
+        try:
+            yield
+        finally:
+            self.dec(**labels)
+
+    def render(self, samples: Optional[Dict[LabelValues, float]] = None) -> List[str]:
+        items = sorted((self.samples() if samples is None else samples).items())
+        return self._header() + [
+            f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}"
+            for key, value in items
+        ]
+
+class Histogram(_Metric):
+    """Distribution of observations over fixed buckets"""
+
+    kind = 'histogram'
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = LATENCY_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # Per label set: [count per bucket..., count in +Inf], sum
+        self._values: Dict[LabelValues, Tuple[List[int], List[float]]] = {}
+
+    def observe(self, value: float, **labels: Any) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.setdefault(key, ([0] * (len(self.buckets) + 1), [0.0]))
+            counts[index] += 1
+            total[0] += value
+
+    def count(self, **labels: Any) -> int:
+        entry = self._values.get(self._key(labels))
+        return sum(entry[0]) if entry else 0
+
+    def samples(self) -> Dict[LabelValues, Tuple[List[int], float]]:
+        """Copy of the bucket counts and sum per label set"""
+        with self._lock:
+            return {key: (list(counts), total[0]) for key, (counts, total) in self._values.items()}
+
+    @staticmethod
+    def merge(samples: Dict[LabelValues, Tuple[List[int], float]],
+              other: Dict[LabelValues, Tuple[List[int], float]]) -> None:
+        for key, (counts, total) in other.items():
+            mine = samples.get(key)
+            if mine is None:
+                samples[key] = (list(counts), total)
+            else:
+                samples[key] = ([a + b for a, b in zip(mine[0], counts)], mine[1] + total)
+
+    def render(self, samples: Optional[Dict[LabelValues, Tuple[List[int], float]]] = None) -> List[str]:
+        items = sorted((self.samples() if samples is None else samples).items())
+        lines = self._header()
+        for key, (counts, total) in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                cumulative += count
+                le = f'le="{_format_value(bound)}"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labelnames, key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(self.labelnames, key)} {cumulative}")
+        return lines
+
+def _alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class MetricsRegistry:
+    """
+    Holds metrics and renders them in the Prometheus text format
+
+    Values live in the process that records them. With pre-forked workers
+    a scrape reaches one worker at random, so each worker also writes a
+    snapshot of its values to a shared directory (start_sync()), and
+    render() given that directory adds up every worker's: counters and
+    histograms over all workers that ever ran (an exited worker's requests
+    still happened), gauges over the live ones. Gauges from callbacks
+    describe one worker's own pool, cache or queue and get a worker label.
+    """
+
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+        self._callbacks: List[Tuple[str, str, Sequence[str], Callable[[], Dict[LabelValues, float]]]] = []
+        self._sync_stop = threading.Event()
+        self._sync_thread: Optional[threading.Thread] = None
+
+    def register(self, metric: _Metric) -> _Metric:
+        self._metrics.append(metric)
+        return metric
+
+    def register_callback(self, name: str, documentation: str, labelnames: Sequence[str],
+                          callback: Callable[[], Dict[LabelValues, float]]) -> None:
+        """
+        Add a gauge whose values are read at scrape time
+
+        Args:
+            name: Metric name
+            documentation: Help text
+            labelnames: Label names for the keys returned by callback
+            callback: Returns {label values tuple: value}
+        """
+        self._callbacks.append((name, documentation, tuple(labelnames), callback))
+
+    def render(self, directory: Optional[str] = None) -> str:
+        """
+        Text exposition of every metric
+
+        Args:
+            directory: Shared snapshot directory of the pre-forked workers;
+                None renders this process's values only
+        """
+        if directory is None:
+            lines = []
+            for metric in self._metrics:
+                lines.extend(metric.render())
+            for name, documentation, labelnames, callback in self._callbacks:
+                lines.extend(self._render_callback(name, documentation, labelnames, callback().items()))
+            return '\n'.join(lines) + '\n'
+
+        own = self.snapshot()
+        peers = [snapshot for snapshot in self._load(directory) if snapshot['pid'] != own['pid']]
+        live = [own] + [snapshot for snapshot in peers if _alive(snapshot['pid'])]
+        lines = []
+        for metric in self._metrics:
+            samples = metric.samples()
+            for snapshot in (peers if not isinstance(metric, Gauge) else live[1:]):
+                metric.merge(samples, self._decode(metric, snapshot['metrics'].get(metric.name, [])))
+            lines.extend(metric.render(samples))
+        for name, documentation, labelnames, _ in self._callbacks:
+            items = [((*key, str(snapshot['pid'])), value)
+                     for snapshot in live for key, value in self._decode(None, snapshot['callbacks'].get(name, [])).items()]
+            lines.extend(self._render_callback(name, documentation, labelnames + ('worker',), items))
+        return '\n'.join(lines) + '\n'
+
+    @staticmethod
+    def _render_callback(name: str, documentation: str, labelnames: Sequence[str], items) -> List[str]:
+        lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+        for key, value in sorted(items):
+            lines.append(f"{name}{_format_labels(labelnames, key)} {_format_value(value)}")
+        return lines
+
+    def snapshot(self) -> Dict[str, Any]:
+        """This process's values in a JSON-serializable form"""
+        return {
+            'pid': os.getpid(),
+            'metrics': {metric.name: [[list(key), value] for key, value in metric.samples().items()]
+                        for metric in self._metrics},
+            'callbacks': {name: [[list(key), value] for key, value in callback().items()]
+                          for name, _, _, callback in self._callbacks},
+        }
+
+    @staticmethod
+    def _decode(metric: Optional[_Metric], items: List[List[Any]]) -> Dict[LabelValues, Any]:
+        if isinstance(metric, Histogram):
+            return {tuple(key): (value[0], value[1]) for key, value in items}
+        return {tuple(key): value for key, value in items}
+
+    @staticmethod
+    def _load(directory: str) -> List[Dict[str, Any]]:
+        """Every worker's last snapshot"""
+        snapshots = []
+        for entry in os.scandir(directory):
+            if not entry.name.endswith('.json'):
+                continue
+            try:
+                with open(entry.path) as f:
+                    snapshots.append(json.load(f))
+            except (OSError, ValueError):
+                # Removed meanwhile; writes are atomic, so never half-written
+                continue
+        return snapshots
+
+    def dump(self, directory: str) -> None:
+        """Write this process's snapshot to directory/<pid>.json (atomically)"""
+        descriptor, temp_path = tempfile.mkstemp(dir=directory, prefix='.', suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'w') as f:
+                json.dump(self.snapshot(), f)
+            os.replace(temp_path, os.path.join(directory, f"{os.getpid()}.json"))
+        except BaseException:
+            try:
+                os.unlink(temp_path)
+            except OSError:
+                pass
+            raise
+
+    def start_sync(self, directory: str, interval: float = 1.0) -> None:
+        """Dump a snapshot every interval seconds from a background thread"""
+        if self._sync_thread is not None:
+            return
+        self._sync_stop.clear()
+        self._sync_thread = threading.Thread(
+            target=self._sync, args=(directory, interval), name='metrics-sync', daemon=True
+        )
+        self._sync_thread.start()
+
+    def stop_sync(self, directory: str) -> None:
+        """Stop the background thread and write a last snapshot"""
+        self._sync_stop.set()
+        if self._sync_thread is not None:
+            self._sync_thread.join()
+            self._sync_thread = None
+        self.dump(directory)
+
+    def _sync(self, directory: str, interval: float) -> None:
+        while True:
+            try:
+                self.dump(directory)
+            except Exception:
+                logger.exception("Could not write metrics snapshot")
+            if self._sync_stop.wait(interval):
+                return
+
+def prepare_multiprocess_dir(directory: Optional[str] = None) -> str:
+    """
+    Empty (or create) the directory pre-forked workers share their metrics through
+
+    Args:
+        directory: Directory to use; a new temporary one when None
+
+    Returns:
+        str: The directory
+    """
+    if directory is None:
+        return tempfile.mkdtemp(prefix='fruit-metrics-')
+    os.makedirs(directory, exist_ok=True)
+    for entry in os.scandir(directory):
+        if entry.name.endswith('.json'):
+            os.unlink(entry.path)
+    return directory
+
+class StageTimer:
+    """
+    Per-request record of time spent in each pipeline stage
+
+    Activated in the task, thread or process running the request; code deep
+    in the pipeline reports into it through stage() without it being passed
+    around. Plain data, so it pickles back from process-pool workers.
+    """
+
+    __slots__ = ('stages', 'image_sizes')
+
+    def __init__(self):
+        self.stages: Dict[str, float] = {}
+        self.image_sizes: List[Tuple[int, int]] = []
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[None]:
+        """Time the enclosed block; repeated stages (batches) accumulate"""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages[name] = self.stages.get(name, 0.0) + time.perf_counter() - started
+
+    @contextmanager
+    def activate(self) -> Iterator['StageTimer']:
+        """Make this the timer stage() reports to in the current context"""
+        token = _current_timer.set(self)
+        try:
+            yield self
+        finally:
+            _current_timer.reset(token)
+
+    def merge(self, other: 'StageTimer') -> None:
+        """Fold in the timings recorded by a worker"""
+        for name, seconds in other.stages.items():
+            self.stages[name] = self.stages.get(name, 0.0) + seconds
+        self.image_sizes.extend(other.image_sizes)
+
+_current_timer: contextvars.ContextVar[Optional[StageTimer]] = contextvars.ContextVar('stage_timer', default=None)
+_NO_TIMING = nullcontext()
+
+def current_timer() -> Optional[StageTimer]:
+    """The StageTimer active in this context, if any"""
+    return _current_timer.get()
+
+def stage(name: str):
+    """
+    Time a pipeline stage against the active StageTimer, if any
+
+    Without an active timer this returns a shared no-op context manager, so
+    instrumented code costs one context-variable lookup.
+    """
+    timer = _current_timer.get()
+    if timer is None:
+        return _NO_TIMING
+    return timer.stage(name)
+
+def record_image_size(size: Tuple[int, int]) -> None:
+    """Note a decoded image's (width, height) on the active timer"""
+    timer = _current_timer.get()
+    if timer is not None:
+        timer.image_sizes.append(size)
+
+def timed_call(fn: Callable[..., Any], *args: Any) -> Tuple[Any, StageTimer]:
+    """
+    Call fn with a fresh StageTimer active and return both
+
+    Executor threads and processes do not inherit the caller's context, so
+    pool work is wrapped in this and the timer merged back afterwards.
+    """
+    timer = StageTimer()
+    with timer.activate():
+        result = fn(*args)
+    return result, timer
+
+# Metrics exported by the API
+REGISTRY = MetricsRegistry()
+
+REQUESTS = REGISTRY.register(Counter(
+    'fruit_analysis_requests_total', 'Analysis requests by endpoint and HTTP status',
+    ('endpoint', 'status')
+))
+IN_FLIGHT = REGISTRY.register(Gauge(
+    'fruit_analysis_in_flight_requests', 'Analysis requests currently being handled',
+    ('endpoint',)
+))
+STAGE_SECONDS = REGISTRY.register(Histogram(
+    'fruit_analysis_stage_seconds', 'Time spent in each stage of the analysis pipeline',
+    ('stage',), buckets=LATENCY_BUCKETS
+))
+RESULTS = REGISTRY.register(Counter(
+    'fruit_analysis_results_total', 'Analysis results by fruit type and overall condition',
+    ('fruit_type', 'overall_condition')
+))
+UPLOAD_BYTES = REGISTRY.register(Histogram(
+    'fruit_analysis_upload_bytes', 'Size of uploaded image files', buckets=SIZE_BUCKETS
+))
+IMAGE_MEGAPIXELS = REGISTRY.register(Histogram(
+    'fruit_analysis_image_megapixels', 'Size of decoded images', buckets=PIXEL_BUCKETS
+))
+
+def enabled() -> bool:
+    """Whether metrics are being collected"""
+    return METRICS_CONFIG['enabled']
+
+@contextmanager
+def track_request(endpoint: str) -> Iterator[Optional[StageTimer]]:
+    """
+    Instrument one API request
+
+    Counts the request by status, keeps the in-flight gauge and activates a
+    StageTimer whose stages are recorded when the request finishes. With
+    metrics disabled this does nothing and yields None.
+
+    Args:
+        endpoint: Route label, e.g. '/analyze'
+    """
+    if not METRICS_CONFIG['enabled']:
+        yield None
+        return
+
+    timer = StageTimer()
+    status = 500
+    IN_FLIGHT.inc(endpoint=endpoint)
+    try:
+        with timer.activate():
+            yield timer
+        status = 200
+    except Exception as e:
+        status = getattr(e, 'status_code', 500)
+        raise
+    finally:
+        IN_FLIGHT.dec(endpoint=endpoint)
+        REQUESTS.inc(endpoint=endpoint, status=status)
+        for name, seconds in timer.stages.items():
+            STAGE_SECONDS.observe(seconds, stage=name)
+        for width, height in timer.image_sizes:
+            IMAGE_MEGAPIXELS.observe(width * height / 1e6)
+
+def observe_upload(size: int) -> None:
+    """Record the size of an accepted upload"""
+    if METRICS_CONFIG['enabled']:
+        UPLOAD_BYTES.observe(size)
+
+def observe_result(result: Any) -> None:
+    """Count an AnalysisResult by fruit type and overall condition"""
+    if METRICS_CONFIG['enabled']:
+        RESULTS.inc(
+            fruit_type=result.fruit_type.value,
+            overall_condition=result.overall_condition.value
+        )
+
+def observe_stage(name: str, seconds: float) -> None:
+    """Record a stage that runs outside any request, e.g. a background task"""
+    if METRICS_CONFIG['enabled']:
+        STAGE_SECONDS.observe(seconds, stage=name)
@@ -0,0 +1,176 @@
+import os
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import MODEL_CONFIG
+from .inference import InferenceBackend, KerasBackend, load_backend
+
+class ModelHandle:
+    """Shared, thread-safe handle on a loaded model"""
+
+    def __init__(self, model: Any = None, model_path: Optional[str] = None,
+                 input_shape: Tuple[int, ...] = MODEL_CONFIG['input_shape']):
+        """
+        Args:
+            model: Inference backend, or a model called as
+                model(batch, training=False) (wrapped in KerasBackend), or
+                None when no trained model is configured
+            model_path: Where the model was loaded from
+            input_shape: Expected (H, W, C) of a single input
+        """
+        if model is not None and not isinstance(model, InferenceBackend):
+            model = KerasBackend(model)
+        self.model: Optional[InferenceBackend] = model
+        self.model_path = model_path
+        self.input_shape = tuple(input_shape)
+        self.warmup_seconds: Optional[float] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        """Whether a trained model is available"""
+        return self.model is not None
+    
+    @property
+    def input_dtype(self) -> np.dtype:
+        """Dtype the preprocessor should produce (uint8 pixels for quantized models)"""
+        return self.model.input_dtype if self.model is not None else np.dtype(np.float32)
+
+    def predict(self, batch: np.ndarray) -> Optional[np.ndarray]:
+        """
+        Run inference on a batch of preprocessed images
+
+        Args:
+            batch: Tensor of shape (N,) + input_shape, float32 in [0, 1] or uint8 pixels
+
+        Returns:
+            (N, num_classes) class probabilities, or None without a model
+        """
+        if self.model is None:
+            return None
+        # Inference is serialized; the framework already parallelizes each call
+        with self._lock:
+            return self.model.predict(batch)
+
+    def warm_up(self, batch_sizes: Sequence[int] = (1,)) -> None:
+        """
+        Run dummy batches so graph tracing and allocation happen before the
+        first real request
+
+        Args:
+            batch_sizes: Batch sizes to trace
+        """
+        started = time.perf_counter()
+        for batch_size in batch_sizes:
+            self.predict(np.zeros((batch_size,) + self.input_shape, dtype=self.input_dtype))
+        self.warmup_seconds = time.perf_counter() - started
+
+    def info(self) -> Dict[str, Any]:
+        """Summary for health reporting"""
+        return {
+            'loaded': self.loaded,
+            'model_path': self.model_path,
+            'input_shape': list(self.input_shape),
+            'warmup_seconds': self.warmup_seconds,
+            **(self.model.info() if self.model is not None else {'backend': None}),
+        }
+
+class ModelRegistry:
+    """Loads models once per process and hands out shared handles"""
+
+    def __init__(self):
+        self._handles: Dict[str, ModelHandle] = {}
+        # Held for the whole of a load, so concurrent callers wait for one
+        # load instead of each loading a copy
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _load_model(model_path: str) -> InferenceBackend:
+        """Load a model from disk into the backend selected by MODEL_CONFIG['backend']"""
+        if not os.path.exists(model_path):
+            raise FileNotFoundError(f"Model not found at {model_path}")
+
+        # Runtimes are imported here, so the API starts without any of them
+        # when no model is configured
+        return load_backend(model_path)
+
+    def load(self, name: str = 'default', model_path: Optional[str] = None,
+             input_shape: Tuple[int, ...] = MODEL_CONFIG['input_shape']) -> ModelHandle:
+        """
+        Load a model and register it under name, replacing any previous one
+
+        Args:
+            name: Registry key
+            model_path: Path to the model; None registers an empty handle
+                (the analyzer then falls back to its simulated scoring)
+            input_shape: Expected (H, W, C) of a single input
+
+        Returns:
+            ModelHandle: The registered handle
+        """
+        with self._lock:
+            return self._load_locked(name, model_path, input_shape)
+
+    def _load_locked(self, name: str, model_path: Optional[str],
+                     input_shape: Tuple[int, ...] = MODEL_CONFIG['input_shape']) -> ModelHandle:
+        model = self._load_model(model_path) if model_path else None
+        handle = ModelHandle(model, model_path=model_path, input_shape=input_shape)
+        self._handles[name] = handle
+        return handle
+
+    def ensure(self, name: str = 'default', model_path: Optional[str] = None) -> ModelHandle:
+        """
+        Return the handle registered under name if it was loaded from
+        model_path, loading it otherwise
+        
+        Lets pre-forked workers keep the model their supervisor loaded (and
+        share its memory) instead of loading their own copy.
+        """
+        handle = self._handles.get(name)
+        if handle is not None and handle.model_path == model_path:
+            return handle
+        with self._lock:
+            # Someone else may have loaded it while we waited
+            handle = self._handles.get(name)
+            if handle is not None and handle.model_path == model_path:
+                return handle
+            return self._load_locked(name, model_path)
+
+    def get(self, name: str = 'default') -> ModelHandle:
+        """
+        Return the handle registered under name
+
+        The default model is loaded from MODEL_CONFIG on first use, which
+        covers worker processes that did not run the startup hook.
+        """
+        handle = self._handles.get(name)
+        if handle is not None:
+            return handle
+        if name != 'default':
+            raise KeyError(f"No model registered as '{name}'")
+
+        with self._lock:
+            handle = self._handles.get(name)
+            if handle is None:
+                handle = self._load_locked(name, MODEL_CONFIG['model_path'])
+        return handle
+
+    def peek(self, name: str = 'default') -> Dict[str, Any]:
+        """
+        Health summary of the model registered under name, never loading it
+
+        Safe on the event loop while the warm-up is still loading the model.
+        """
+        handle = self._handles.get(name)
+        return handle.info() if handle is not None else {'loaded': False}
+
+    def clear(self) -> None:
+        """Drop all registered models"""
+        with self._lock:
+            self._handles.clear()
+
+# Process-wide registry shared by the API and the analysis pipeline
+registry = ModelRegistry()
@@ -0,0 +1,88 @@
+from typing import Dict, List, Optional, Sequence, Union
+import os
+
+import numpy as np
+
+from .image_processor import process_image, process_images, ImageBuffer, ProcessedImage
+from .analysis import analyze_fruit_quality, analyze_fruit_quality_batch
+from .model_registry import registry
+from .settings import Settings, current_settings
+from ..models.fruit_analysis import AnalysisResult
+
+def run_analysis(source: Union[str, os.PathLike, ImageBuffer],
+                 settings: Optional[Settings] = None) -> AnalysisResult:
+    """
+    Run the full decode -> feature extraction -> analysis pipeline
+    
+    This is the unit of work handed to the analysis executor, so it must stay
+    a picklable module-level function.
+    
+    Args:
+        source: Path to the image file, or the encoded image bytes
+        settings: Settings snapshot for the whole pipeline, defaults to the
+            current one (pass it explicitly to executor processes, whose own
+            snapshot is not swapped at runtime)
+        
+    Returns:
+        AnalysisResult: Results of the fruit quality analysis
+    """
+    settings = settings or current_settings()
+    model = registry.get()
+    processed_image = process_image(source, settings, model.input_dtype)
+    return analyze_fruit_quality(processed_image, model, settings)
+
+def run_batch_analysis(sources: Sequence[Union[str, os.PathLike, ImageBuffer]],
+                       settings: Optional[Settings] = None) -> List[AnalysisResult]:
+    """
+    Run the pipeline over many images, stacking them into one model batch
+    
+    Args:
+        sources: Paths to image files and/or encoded image bytes
+        settings: Settings snapshot for the whole pipeline, defaults to the current one
+        
+    Returns:
+        List[AnalysisResult]: One result per image, in input order
+    """
+    settings = settings or current_settings()
+    model = registry.get()
+    batch_data = process_images(sources, settings, model.input_dtype)
+    return analyze_fruit_quality_batch(batch_data, model, settings)
+
+def analyze_processed_batch(image_datas: List[ProcessedImage]) -> List[AnalysisResult]:
+    """
+    Run one batched inference over images that were processed separately
+    
+    Used by the micro-batcher to coalesce concurrent single-image requests.
+    Each image is scored with the settings snapshot it was processed with
+    (the one its request caches the result under), so when a settings or
+    model change lands between requests the batch is split into groups
+    sharing a snapshot and tensor layout, and each group is run on its own.
+    
+    Args:
+        image_datas: process_image() outputs, one per request
+        
+    Returns:
+        List[AnalysisResult]: One result per input, in the same order
+    """
+    groups: Dict[tuple, List[int]] = {}
+    for index, data in enumerate(image_datas):
+        snapshot = data.settings or current_settings()
+        key = (snapshot.fingerprint, data.color_histogram.shape, data.processed_image.dtype)
+        groups.setdefault(key, []).append(index)
+    
+    results: List[Optional[AnalysisResult]] = [None] * len(image_datas)
+    for indices in groups.values():
+        members = [image_datas[index] for index in indices]
+        snapshot = members[0].settings or current_settings()
+        if len(members) == 1:
+            group_results = [analyze_fruit_quality(members[0], settings=snapshot)]
+        else:
+            batch_data = {
+                'processed_images': np.concatenate([data.processed_image for data in members]),
+                'color_histograms': np.stack([data.color_histogram for data in members]),
+                'image_paths': [data.image_path for data in members]
+            }
+            group_results = analyze_fruit_quality_batch(batch_data, settings=snapshot)
+        for index, result in zip(indices, group_results):
+            results[index] = result
+    return results
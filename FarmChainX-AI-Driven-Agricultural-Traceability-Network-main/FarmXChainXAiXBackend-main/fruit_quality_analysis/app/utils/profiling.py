@@ -0,0 +1,269 @@
+import cProfile
+import contextvars
+import heapq
+import itertools
+import marshal
+import pstats
+import secrets
+import threading
+import time
+import uuid
+from contextlib import contextmanager, nullcontext
+from datetime import datetime
+from typing import Any, Callable, Dict, Iterator, List, Mapping, Optional, Tuple
+
+from config import PROFILING_CONFIG
+from .metrics import StageTimer, current_timer
+
+# cProfile's raw stats: {(file, line, function): (cc, nc, tt, ct, callers)}
+RawStats = Dict[Tuple[str, int, str], Tuple[int, int, float, float, Dict[Any, Any]]]
+
+def profiled_call(fn: Callable[..., Any], *args: Any) -> Tuple[Any, StageTimer, RawStats]:
+    """
+    Call fn under cProfile with a fresh StageTimer active
+
+    Runs on the analysis executor; the profile covers everything fn does in
+    the worker (process_image and FruitQualityAnalyzer.analyze for the
+    standard pipeline). The returned stats are plain data, so they pickle
+    back from process-pool workers.
+
+    Returns:
+        (fn's result, stage timings, raw cProfile stats)
+    """
+    timer = StageTimer()
+    profiler = cProfile.Profile()
+    with timer.activate():
+        profiler.enable()
+        try:
+            result = fn(*args)
+        finally:
+            profiler.disable()
+    profiler.create_stats()
+    return result, timer, profiler.stats
+
+class _RawStatsHolder:
+    """Lets pstats.Stats load an in-memory stats dict"""
+
+    def __init__(self, stats: RawStats):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+class RequestProfile:
+    """Stage breakdown and cProfile data for one request"""
+
+    def __init__(self, endpoint: str):
+        self.id = uuid.uuid4().hex[:12]
+        self.endpoint = endpoint
+        self.timestamp = datetime.utcnow()
+        self.status: Optional[int] = None
+        self.duration: float = 0.0
+        self.stages: Dict[str, float] = {}
+        self.image_sizes: List[Tuple[int, int]] = []
+        self._raw_stats: List[RawStats] = []
+
+    def add_stats(self, stats: RawStats) -> None:
+        """Attach the cProfile output of one worker call"""
+        self._raw_stats.append(stats)
+
+    def stats(self) -> Optional[pstats.Stats]:
+        """All worker profiles of the request merged into one pstats.Stats"""
+        if not self._raw_stats:
+            return None
+        # pstats merges into the first dict in place, so start from a copy
+        merged = pstats.Stats(_RawStatsHolder(dict(self._raw_stats[0])))
+        for stats in self._raw_stats[1:]:
+            merged.add(_RawStatsHolder(stats))
+        return merged
+
+    def summary(self) -> Dict[str, Any]:
+        """JSON-friendly description without the profile data"""
+        return {
+            'id': self.id,
+            'endpoint': self.endpoint,
+            'timestamp': self.timestamp.isoformat(),
+            'status': self.status,
+            'duration_seconds': self.duration,
+            'stages': dict(self.stages),
+            'image_sizes': [list(size) for size in self.image_sizes],
+            'has_profile': bool(self._raw_stats),
+        }
+
+    def to_pstats(self) -> bytes:
+        """Profile in the binary format written by pstats.Stats.dump_stats"""
+        stats = self.stats()
+        return marshal.dumps(stats.stats if stats is not None else {})
+
+    def to_speedscope(self) -> Dict[str, Any]:
+        """
+        Profile as a speedscope (https://www.speedscope.app) sampled profile
+
+        cProfile keeps caller -> callee edges rather than full stacks, so the
+        flame graph is rebuilt by walking from the root functions and sharing
+        each function's time out over its callers in proportion to the time
+        spent along each edge.
+        """
+        stats = self.stats()
+        raw = stats.stats if stats is not None else {}
+
+        frames: List[Dict[str, Any]] = []
+        frame_index: Dict[Any, int] = {}
+
+        def frame(func) -> int:
+            if func not in frame_index:
+                filename, line, name = func
+                frame_index[func] = len(frames)
+                frames.append({'name': name, 'file': filename, 'line': line})
+            return frame_index[func]
+
+        callees: Dict[Any, Dict[Any, float]] = {}
+        for func, (_, _, _, _, callers) in raw.items():
+            for caller, edge in callers.items():
+                callees.setdefault(caller, {})[func] = edge[3]
+
+        samples: List[List[int]] = []
+        weights: List[float] = []
+
+        def walk(func, share: float, stack: List[int], seen: frozenset) -> None:
+            _, _, self_time, total_time, _ = raw[func]
+            if total_time <= 0 or share <= 0:
+                return
+            stack = stack + [frame(func)]
+            scale = share / total_time
+            if self_time > 0:
+                samples.append(stack)
+                weights.append(self_time * scale)
+            for callee, edge_time in callees.get(func, {}).items():
+                # Recursion is already counted in the outermost call
+                if callee in seen or callee not in raw:
+                    continue
+                walk(callee, edge_time * scale, stack, seen | {callee})
+
+        roots = [func for func, (_, _, _, _, callers) in raw.items() if not callers]
+        for root in roots:
+            walk(root, raw[root][3], [], frozenset([root]))
+
+        return {
+            '$schema': 'https://www.speedscope.app/file-format-schema.json',
+            'name': f"{self.endpoint} {self.id}",
+            'exporter': 'fruit-quality-analysis',
+            'shared': {'frames': frames},
+            'profiles': [{
+                'type': 'sampled',
+                'name': f"{self.endpoint} ({self.duration * 1000:.1f} ms)",
+                'unit': 'seconds',
+                'startValue': 0,
+                'endValue': sum(weights),
+                'samples': samples,
+                'weights': weights,
+            }],
+        }
+
+class SlowRequestLog:
+    """Keeps the slowest N profiled requests"""
+
+    def __init__(self, capacity: int = 20):
+        self.capacity = capacity
+        self._heap: List[Tuple[float, int, RequestProfile]] = []
+        self._counter = itertools.count()
+        self._lock = threading.Lock()
+
+    def offer(self, profile: RequestProfile) -> None:
+        """Keep the profile if it is among the slowest seen"""
+        entry = (profile.duration, next(self._counter), profile)
+        with self._lock:
+            if len(self._heap) < self.capacity:
+                heapq.heappush(self._heap, entry)
+            elif self.capacity and profile.duration > self._heap[0][0]:
+                heapq.heapreplace(self._heap, entry)
+
+    def entries(self) -> List[RequestProfile]:
+        """Kept profiles, slowest first"""
+        with self._lock:
+            return [profile for _, _, profile in sorted(self._heap, key=lambda entry: entry[0], reverse=True)]
+
+    def get(self, profile_id: str) -> Optional[RequestProfile]:
+        with self._lock:
+            for _, _, profile in self._heap:
+                if profile.id == profile_id:
+                    return profile
+        return None
+
+    def clear(self) -> None:
+        with self._lock:
+            self._heap.clear()
+
+# Process-wide log read by the admin endpoints
+slow_requests = SlowRequestLog(PROFILING_CONFIG['keep_slowest'])
+
+_current_profile: contextvars.ContextVar[Optional[RequestProfile]] = contextvars.ContextVar(
+    'request_profile', default=None
+)
+
+def current_profile() -> Optional[RequestProfile]:
+    """The RequestProfile being recorded in this context, if any"""
+    return _current_profile.get()
+
+def check_token(token: Optional[str], expected: Optional[str]) -> bool:
+    """Whether token matches expected (never when no token is configured)"""
+    if expected is None:
+        return False
+    return token is not None and secrets.compare_digest(token, expected)
+
+def check_admin_token(token: Optional[str]) -> bool:
+    """Whether token grants admin access (never when no token is configured)"""
+    return check_token(token, PROFILING_CONFIG['admin_token'])
+
+def should_profile(headers: Mapping[str, str]) -> bool:
+    """
+    Decide whether a request is profiled
+
+    'always' profiles every request; 'header' only those sending the
+    profiling header along with the admin token.
+    """
+    mode = PROFILING_CONFIG['mode']
+    if mode == 'always':
+        return True
+    if mode == 'header' and headers.get(PROFILING_CONFIG['header']):
+        return check_admin_token(headers.get('x-admin-token'))
+    return False
+
+@contextmanager
+def profile_request(endpoint: str, headers: Mapping[str, str]) -> Iterator[Optional[RequestProfile]]:
+    """
+    Profile one API request if profiling applies to it
+
+    Pool work started through the API's run_in_pool() is run under cProfile
+    while this is active. Stage timings come from the active StageTimer (the
+    metrics one, or a private one when metrics are off). The finished
+    profile is offered to slow_requests.
+
+    Args:
+        endpoint: Route label, e.g. '/analyze'
+        headers: Request headers
+    """
+    if not should_profile(headers):
+        yield None
+        return
+
+    profile = RequestProfile(endpoint)
+    timer = current_timer()
+    activation = nullcontext(timer) if timer is not None else StageTimer().activate()
+    token = _current_profile.set(profile)
+    started = time.perf_counter()
+    status = 500
+    try:
+        with activation as timer:
+            yield profile
+        status = 200
+    except Exception as e:
+        status = getattr(e, 'status_code', 500)
+        raise
+    finally:
+        _current_profile.reset(token)
+        profile.duration = time.perf_counter() - started
+        profile.status = status
+        profile.stages = dict(timer.stages)
+        profile.image_sizes = list(timer.image_sizes)
+        slow_requests.offer(profile)
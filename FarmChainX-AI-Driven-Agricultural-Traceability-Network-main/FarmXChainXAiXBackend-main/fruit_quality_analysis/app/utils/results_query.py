@@ -0,0 +1,173 @@
+"""
+Read side of the results store: filtered result listings and rollup series.
+
+Listings walk the composite (filter, created_at) indexes newest first with
+a keyset cursor, so a page costs the same however deep it is. Aggregates
+read the hourly or daily rollup tables, one row per bucket, fruit type,
+condition and lot, and never touch analysis_results.
+"""
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy import and_, func, or_, select
+
+from ..models.records import ROLLUP_MEASURES, ROLLUP_TABLES, SHELF_LIFE_BUCKETS, analysis_results, shelf_life_column
+from .rollups import as_utc, bucket_start
+
+# Dimensions GET /results/rollups can group by
+GROUP_BY = ('fruit_type', 'overall_condition', 'lot')
+
+def encode_cursor(created_at: datetime, result_id: int) -> str:
+    return f"{as_utc(created_at).isoformat()}~{result_id}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, int]:
+    """
+    Raises:
+        ValueError: For a cursor that was not produced by encode_cursor()
+    """
+    created_at, separator, result_id = cursor.rpartition('~')
+    if not separator:
+        raise ValueError(f"Invalid cursor '{cursor}'")
+    return as_utc(datetime.fromisoformat(created_at)), int(result_id)
+
+def find_results(connection, fruit_types: Sequence[str] = (), conditions: Sequence[str] = (),
+                 lot: Optional[str] = None, start: Optional[datetime] = None, end: Optional[datetime] = None,
+                 limit: int = 100, cursor: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Stored results matching every given filter, newest first
+
+    Args:
+        connection: Connection to the results database
+        fruit_types: Any of these fruit types (all when empty)
+        conditions: Any of these overall conditions (all when empty)
+        lot: Only this lot
+        start: Produced at or after (UTC when naive)
+        end: Produced before (UTC when naive)
+        limit: Page size
+        cursor: 'next' value of the previous page
+
+    Returns:
+        {'results': [...], 'next': cursor for the following page or None}
+
+    Raises:
+        ValueError: For an invalid cursor
+    """
+    table = analysis_results
+    query = select(table)
+    if fruit_types:
+        query = query.where(table.c.fruit_type.in_(fruit_types))
+    if conditions:
+        query = query.where(table.c.overall_condition.in_(conditions))
+    if lot is not None:
+        query = query.where(table.c.lot == lot)
+    if start is not None:
+        query = query.where(table.c.created_at >= as_utc(start))
+    if end is not None:
+        query = query.where(table.c.created_at < as_utc(end))
+    if cursor is not None:
+        created_at, result_id = decode_cursor(cursor)
+        query = query.where(or_(
+            table.c.created_at < created_at,
+            and_(table.c.created_at == created_at, table.c.id < result_id)
+        ))
+    # One extra row tells whether there is a next page
+    query = query.order_by(table.c.created_at.desc(), table.c.id.desc()).limit(limit + 1)
+
+    rows = [dict(row) for row in connection.execute(query).mappings()]
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['created_at'], rows[-1]['id'])
+    for row in rows:
+        row['created_at'] = as_utc(row['created_at'])
+    return {'results': rows, 'next': next_cursor}
+
+def rollup_series(connection, granularity: str = 'day', fruit_types: Sequence[str] = (),
+                  conditions: Sequence[str] = (), lot: Optional[str] = None,
+                  start: Optional[datetime] = None, end: Optional[datetime] = None,
+                  group_by: Sequence[str] = ()) -> List[Dict[str, Any]]:
+    """
+    Per-bucket aggregates of the matching results
+
+    The condition filter selects what is counted, while share is that
+    count over all conditions of the same bucket and group, so
+    conditions=['Poor', 'Spoiled'] with fruit_types=['Mango'] gives the
+    share of poor or spoiled mangoes per bucket.
+
+    Args:
+        connection: Connection to the results database
+        granularity: 'hour' or 'day'
+        fruit_types, conditions, lot: As for find_results()
+        start: First bucket is the one containing start
+        end: Buckets starting before end
+        group_by: Subset of GROUP_BY to split each bucket by
+
+    Returns:
+        One dict per bucket and group, in time order: bucket_start, the
+        group_by values, results, share, mean freshness, ripeness and shelf
+        life, and the shelf-life histogram
+
+    Raises:
+        ValueError: For an unknown granularity or group_by dimension
+    """
+    if granularity not in ROLLUP_TABLES:
+        raise ValueError(f"granularity must be one of {sorted(ROLLUP_TABLES)}")
+    unknown = set(group_by) - set(GROUP_BY)
+    if unknown:
+        raise ValueError(f"Cannot group by {sorted(unknown)}, expected any of {list(GROUP_BY)}")
+    group_by = [name for name in GROUP_BY if name in group_by]
+
+    table = ROLLUP_TABLES[granularity]
+    # Always split by condition, so the share's denominator comes from the same rows
+    dimensions = [table.c.bucket_start, *(table.c[name] for name in group_by if name != 'overall_condition'),
+                  table.c.overall_condition]
+    query = select(*dimensions, *(func.sum(table.c[name]).label(name) for name in ROLLUP_MEASURES))
+    if fruit_types:
+        query = query.where(table.c.fruit_type.in_(fruit_types))
+    if lot is not None:
+        query = query.where(table.c.lot == lot)
+    if start is not None:
+        query = query.where(table.c.bucket_start >= bucket_start(start, granularity))
+    if end is not None:
+        query = query.where(table.c.bucket_start < as_utc(end))
+    query = query.group_by(*dimensions).order_by(*dimensions)
+
+    selected = set(conditions)
+    by_condition = 'overall_condition' in group_by
+    series: Dict[Tuple[Any, ...], Dict[str, Any]] = {}
+    totals: Dict[Tuple[Any, ...], int] = {}
+    for row in connection.execute(query).mappings():
+        group = {name: row[name] for name in group_by}
+        shared_key = (row['bucket_start'], *(group[name] for name in group_by if name != 'overall_condition'))
+        totals[shared_key] = totals.get(shared_key, 0) + row['results']
+
+        counted = not selected or row['overall_condition'] in selected
+        key = (row['bucket_start'], *group.values()) if by_condition else shared_key
+        entry = series.get(key)
+        if entry is None:
+            if by_condition and not counted:
+                continue
+            # Without a condition split, buckets with none of the selected
+            # conditions are kept, with a share of 0
+            entry = series[key] = {'shared_key': shared_key, 'group': group,
+                                   **dict.fromkeys(ROLLUP_MEASURES, 0)}
+        if counted:
+            for name in ROLLUP_MEASURES:
+                entry[name] += row[name]
+
+    output = []
+    for entry in series.values():
+        count = entry['results']
+        item = {'bucket_start': as_utc(entry['shared_key'][0])}
+        for name, value in entry['group'].items():
+            item[name] = value if name != 'lot' else (value or None)
+        item.update({
+            'results': count,
+            'share': count / totals[entry['shared_key']],
+            'mean_freshness': entry['freshness_sum'] / count if count else None,
+            'mean_ripeness': entry['ripeness_sum'] / count if count else None,
+            'mean_shelf_life_days': entry['shelf_life_sum'] / count if count else None,
+            'shelf_life_days': {label: entry[shelf_life_column(label)] for label, _, _ in SHELF_LIFE_BUCKETS},
+        })
+        output.append(item)
+    return output
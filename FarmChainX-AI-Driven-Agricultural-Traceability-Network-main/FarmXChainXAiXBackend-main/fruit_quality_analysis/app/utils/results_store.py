@@ -0,0 +1,314 @@
+import logging
+import os
+import queue
+import threading
+import time
+import weakref
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+from config import BASE_DIR
+from . import metrics
+from ..models.fruit_analysis import AnalysisResult
+
+logger = logging.getLogger(__name__)
+
+MIGRATIONS_DIR = BASE_DIR / 'migrations'
+
+# Queue markers for the writer thread
+_STOP = object()
+
+def create_engine(url: str, pool_size: int = 5, max_overflow: int = 10, echo: bool = False):
+    """
+    Pooled SQLAlchemy engine for the results database
+
+    File-backed SQLite gets write-ahead logging so readers do not wait for
+    the writer's transactions.
+    """
+    import sqlalchemy
+    from sqlalchemy.engine import make_url
+
+    options: Dict[str, Any] = {'echo': echo, 'pool_pre_ping': True}
+    database_url = make_url(url)
+    sqlite = database_url.get_backend_name() == 'sqlite'
+    in_memory = sqlite and database_url.database in (None, '', ':memory:')
+    if sqlite:
+        # The writer thread and request threads share connections from the pool
+        options['connect_args'] = {'check_same_thread': False}
+    if in_memory:
+        # Every connection would otherwise get its own empty database
+        options['poolclass'] = sqlalchemy.pool.StaticPool
+    else:
+        options.update(pool_size=pool_size, max_overflow=max_overflow)
+
+    engine = sqlalchemy.create_engine(url, **options)
+    if sqlite and not in_memory:
+        @sqlalchemy.event.listens_for(engine, 'connect')
+        def _sqlite_pragmas(connection, record):
+            cursor = connection.cursor()
+            cursor.execute('PRAGMA journal_mode=WAL')
+            cursor.execute('PRAGMA synchronous=NORMAL')
+            cursor.close()
+    return engine
+
+def migrate(engine) -> None:
+    """Apply the alembic migrations in migrations/ up to head"""
+    from alembic import command
+    from alembic.config import Config
+
+    alembic_config = Config()
+    alembic_config.set_main_option('script_location', str(MIGRATIONS_DIR))
+    with engine.begin() as connection:
+        # env.py runs on this connection instead of opening its own
+        alembic_config.attributes['connection'] = connection
+        command.upgrade(alembic_config, 'head')
+
+class ResultStore:
+    """
+    Persists analysis results without putting the database on the request path
+
+    record() only appends a row to a bounded queue. A writer thread drains
+    it and inserts the rows in one executemany transaction per batch, once
+    batch_size rows have accumulated or the oldest has waited
+    flush_interval_ms. When the queue is full (the database is slower than
+    the traffic), new rows are dropped and counted rather than blocking
+    requests; stats() exposes queue depth, drops and flush timings.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        queue_size: int = 10000,
+        batch_size: int = 500,
+        flush_interval_ms: float = 1000.0,
+        pool_size: int = 5,
+        max_overflow: int = 10,
+        echo: bool = False,
+        auto_migrate: bool = True
+    ):
+        """
+        Args:
+            url: SQLAlchemy database URL
+            queue_size: Rows waiting to be written before new ones are dropped
+            batch_size: Rows per INSERT transaction
+            flush_interval_ms: Longest a row waits for its batch to fill up
+            pool_size: Connections kept open (shared with readers of the store)
+            max_overflow: Extra connections opened under load
+            echo: Log every statement
+            auto_migrate: Bring the schema to the latest migration before the
+                first write
+        """
+        if queue_size < 1 or batch_size < 1:
+            raise ValueError("queue_size and batch_size must be at least 1")
+
+        self.url = url
+        self.queue_size = queue_size
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval_ms / 1000.0
+        self.auto_migrate = auto_migrate
+        self.engine = create_engine(url, pool_size=pool_size, max_overflow=max_overflow, echo=echo)
+
+        self._reset()
+        # Threads do not survive fork(); pre-forked workers start their own
+        # writer and must not reuse the parent's pooled connections
+        if hasattr(os, 'register_at_fork'):
+            store = weakref.ref(self)
+            os.register_at_fork(after_in_child=lambda: store() is not None and store()._after_fork())
+
+    def _reset(self) -> None:
+        self._queue: "queue.Queue[Any]" = queue.Queue(maxsize=self.queue_size)
+        self._lock = threading.Lock()
+        self._thread: Optional[threading.Thread] = None
+        self._closed = False
+
+        self._enqueued = 0
+        self._dropped = 0
+        self._written = 0
+        self._failed = 0
+        self._flushes = 0
+        self._largest_batch = 0
+        self._flush_seconds = 0.0
+        self._last_flush_at: Optional[float] = None
+
+    def _after_fork(self) -> None:
+        """Forget the parent's queue, writer and connections"""
+        self._reset()
+        self.engine.dispose(close=False)
+
+    def _ensure_writer(self) -> None:
+        """Start the writer thread on first use"""
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name='results-writer', daemon=True)
+                self._thread.start()
+
+    def record(self, result: AnalysisResult, endpoint: str, filename: Optional[str] = None,
+               upload_bytes: Optional[int] = None, cached: bool = False,
+               analyzer_version: str = '', settings_fingerprint: Optional[str] = None,
+               lot: Optional[str] = None) -> bool:
+        """
+        Queue a result to be written
+
+        Args:
+            result: The analysis returned to the client
+            endpoint: Route that produced it
+            filename: Client-side file name of the upload
+            upload_bytes: Size of the upload
+            cached: Whether it was answered from the result cache
+            analyzer_version: FruitQualityAnalyzer.VERSION
+            settings_fingerprint: Settings snapshot it was scored with
+            lot: Production lot the fruit belongs to
+
+        Returns:
+            bool: False when the row was dropped because the queue is full
+                or the store is closed
+        """
+        return self.put({
+            'created_at': datetime.now(timezone.utc),
+            'endpoint': endpoint,
+            'filename': filename[:255] if filename else None,
+            'upload_bytes': upload_bytes,
+            'lot': lot or None,
+            'cached': cached,
+            'fruit_type': result.fruit_type.value,
+            'overall_condition': result.overall_condition.value,
+            'confidence': result.confidence,
+            'freshness': result.freshness,
+            'ripeness': result.ripeness,
+            'shelf_life_days': result.shelf_life_days,
+            'recommendations': list(result.recommendations),
+            'analyzer_version': analyzer_version,
+            'settings_fingerprint': settings_fingerprint,
+        })
+
+    def put(self, row: Dict[str, Any]) -> bool:
+        """Queue a prepared analysis_results row; never blocks"""
+        if self._closed:
+            self._dropped += 1
+            return False
+        self._ensure_writer()
+        try:
+            self._queue.put_nowait(row)
+        except queue.Full:
+            self._dropped += 1
+            # One warning per 1000 drops is enough to notice
+            if self._dropped % 1000 == 1:
+                logger.warning("Results queue full (%d rows); %d results dropped so far",
+                               self.queue_size, self._dropped)
+            return False
+        self._enqueued += 1
+        return True
+
+    def flush(self, timeout: float = 10.0) -> bool:
+        """
+        Wait until everything queued so far has been written
+
+        Returns:
+            bool: False on timeout
+        """
+        if self._thread is None:
+            return True
+        done = threading.Event()
+        try:
+            self._queue.put(done, timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    def close(self, timeout: float = 10.0) -> None:
+        """Write what is still queued, stop the writer and close the connections"""
+        self._closed = True
+        thread = self._thread
+        if thread is not None:
+            try:
+                self._queue.put(_STOP, timeout=timeout)
+            except queue.Full:
+                logger.error("Results writer did not drain in %.1fs; %d rows lost", timeout, self._queue.qsize())
+            thread.join(timeout)
+        self.engine.dispose()
+
+    def _run(self) -> None:
+        """Writer thread: collect rows into batches and write them"""
+        if self.auto_migrate:
+            try:
+                migrate(self.engine)
+            except Exception:
+                # Writes will fail and be counted until the database is fixed
+                logger.exception("Results database migration failed")
+
+        rows: List[Dict[str, Any]] = []
+        deadline = 0.0
+        while True:
+            timeout = max(0.0, deadline - time.monotonic()) if rows else None
+            try:
+                item = self._queue.get(timeout=timeout)
+            except queue.Empty:
+                # The oldest row has waited flush_interval
+                self._write(rows)
+                rows = []
+                continue
+
+            if isinstance(item, dict):
+                if not rows:
+                    deadline = time.monotonic() + self.flush_interval
+                rows.append(item)
+                if len(rows) >= self.batch_size:
+                    self._write(rows)
+                    rows = []
+                continue
+
+            # flush() or close(): write what has been collected first
+            self._write(rows)
+            rows = []
+            if item is _STOP:
+                return
+            item.set()
+
+    def _write(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert rows and add them to the rollups in one transaction, retrying briefly on errors"""
+        if not rows:
+            return
+        from ..models.records import analysis_results
+        from .rollups import apply_rollups
+
+        started = time.perf_counter()
+        for attempt in range(3):
+            try:
+                with self.engine.begin() as connection:
+                    # A list of parameter sets runs as one executemany
+                    connection.execute(analysis_results.insert(), rows)
+                    apply_rollups(connection, rows)
+                break
+            except Exception as e:
+                if attempt == 2:
+                    self._failed += len(rows)
+                    logger.error("Dropping %d results after failed writes: %s", len(rows), e)
+                    return
+                time.sleep(0.1 * 2 ** attempt)
+
+        elapsed = time.perf_counter() - started
+        self._written += len(rows)
+        self._flushes += 1
+        self._largest_batch = max(self._largest_batch, len(rows))
+        self._flush_seconds += elapsed
+        self._last_flush_at = time.time()
+        metrics.observe_stage('results_flush', elapsed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Queue and writer state, for /health and /metrics"""
+        return {
+            'queue_depth': self._queue.qsize(),
+            'queue_capacity': self.queue_size,
+            'queue_utilization': self._queue.qsize() / self.queue_size,
+            'enqueued': self._enqueued,
+            'dropped': self._dropped,
+            'written': self._written,
+            'failed': self._failed,
+            'flushes': self._flushes,
+            'avg_batch_size': self._written / self._flushes if self._flushes else 0.0,
+            'largest_batch': self._largest_batch,
+            'flush_seconds_total': self._flush_seconds,
+            'last_flush_at': self._last_flush_at,
+        }
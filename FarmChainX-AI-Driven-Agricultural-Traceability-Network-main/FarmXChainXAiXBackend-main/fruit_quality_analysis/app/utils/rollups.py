@@ -0,0 +1,150 @@
+"""
+Hourly and daily rollups of the stored analysis results.
+
+Each rollup row holds additive totals (result count, freshness, ripeness
+and shelf-life sums, shelf-life histogram) for one time bucket, fruit type,
+condition and lot. The results writer adds every batch's totals in the same
+transaction that inserts the batch, so the rollups always match the rows
+and aggregate queries read one row per bucket and group instead of
+scanning results.
+
+Results answered from the result cache (cached=True) are re-uploads of an
+image analyzed before, not new fruit, and are left out of the rollups.
+"""
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, List, Mapping, Optional, Tuple
+
+from ..models.records import (ROLLUP_KEYS, ROLLUP_MEASURES, ROLLUP_TABLES, SHELF_LIFE_BUCKETS,
+                              analysis_results, shelf_life_column)
+
+# Rows read at a time when rebuilding
+_REBUILD_CHUNK = 10000
+
+def as_utc(value: datetime) -> datetime:
+    """Aware UTC datetime; naive values (as SQLite returns them) are taken as UTC"""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def bucket_start(value: datetime, granularity: str) -> datetime:
+    """Start of the hour or day (UTC) that value falls in"""
+    value = as_utc(value).replace(minute=0, second=0, microsecond=0)
+    return value.replace(hour=0) if granularity == 'day' else value
+
+def _shelf_life_column(days: int) -> str:
+    for label, low, high in SHELF_LIFE_BUCKETS:
+        if days >= low and (high is None or days <= high):
+            return shelf_life_column(label)
+    return shelf_life_column(SHELF_LIFE_BUCKETS[0][0])
+
+RollupKey = Tuple[datetime, str, str, str]
+
+def rollup_deltas(rows: Iterable[Mapping[str, Any]],
+                  totals: Optional[Dict[str, Dict[RollupKey, Dict[str, Any]]]] = None
+                  ) -> Dict[str, Dict[RollupKey, Dict[str, Any]]]:
+    """
+    Totals of rows per granularity and rollup key
+
+    Args:
+        rows: analysis_results rows (created_at, cached, fruit_type,
+            overall_condition, lot, freshness, ripeness, shelf_life_days);
+            cached ones are skipped
+        totals: Earlier output to add to
+
+    Returns:
+        {granularity: {(bucket_start, fruit_type, overall_condition, lot): measures}}
+    """
+    totals = totals if totals is not None else {granularity: {} for granularity in ROLLUP_TABLES}
+    for row in rows:
+        if row.get('cached'):
+            continue
+        shelf_life = int(row['shelf_life_days'])
+        histogram_column = _shelf_life_column(shelf_life)
+        for granularity, buckets in totals.items():
+            key = (bucket_start(row['created_at'], granularity), row['fruit_type'],
+                   row['overall_condition'], row['lot'] or '')
+            measures = buckets.get(key)
+            if measures is None:
+                measures = buckets[key] = dict.fromkeys(ROLLUP_MEASURES, 0)
+            measures['results'] += 1
+            measures['freshness_sum'] += row['freshness']
+            measures['ripeness_sum'] += row['ripeness']
+            measures['shelf_life_sum'] += shelf_life
+            measures[histogram_column] += 1
+    return totals
+
+def _upsert(connection, table, rows: List[Dict[str, Any]]) -> None:
+    """Add rows' measures to existing rollup rows, creating missing ones"""
+    dialect = connection.dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        if dialect == 'sqlite':
+            from sqlalchemy.dialects.sqlite import insert
+        else:
+            from sqlalchemy.dialects.postgresql import insert
+        statement = insert(table)
+        statement = statement.on_conflict_do_update(
+            index_elements=list(ROLLUP_KEYS),
+            set_={name: table.c[name] + statement.excluded[name] for name in ROLLUP_MEASURES}
+        )
+        connection.execute(statement, rows)
+    elif dialect in ('mysql', 'mariadb'):
+        from sqlalchemy.dialects.mysql import insert
+        statement = insert(table)
+        statement = statement.on_duplicate_key_update(
+            {name: table.c[name] + statement.inserted[name] for name in ROLLUP_MEASURES}
+        )
+        connection.execute(statement, rows)
+    else:
+        # Portable fallback: update, and insert the keys that did not exist yet
+        from sqlalchemy import and_, bindparam
+        update = table.update().where(and_(
+            *(table.c[name] == bindparam(f'key_{name}') for name in ROLLUP_KEYS)
+        )).values({name: table.c[name] + bindparam(name) for name in ROLLUP_MEASURES})
+        for row in rows:
+            parameters = {**{f'key_{name}': row[name] for name in ROLLUP_KEYS},
+                          **{name: row[name] for name in ROLLUP_MEASURES}}
+            if connection.execute(update, parameters).rowcount == 0:
+                connection.execute(table.insert(), row)
+
+def apply_rollups(connection, rows: Iterable[Mapping[str, Any]]) -> None:
+    """Add rows to the rollups, in the caller's transaction"""
+    write_rollups(connection, rollup_deltas(rows))
+
+def write_rollups(connection, totals: Mapping[str, Mapping[RollupKey, Mapping[str, Any]]]) -> None:
+    """Merge rollup_deltas() output into the rollup tables"""
+    for granularity, buckets in totals.items():
+        if buckets:
+            _upsert(connection, ROLLUP_TABLES[granularity], [
+                dict(zip(ROLLUP_KEYS, key), **measures) for key, measures in buckets.items()
+            ])
+
+def rebuild_rollups(connection) -> int:
+    """
+    Recompute the rollups from every stored result that was not a cache hit
+
+    Needed when the rollup tables are created for existing results, or
+    after rows were changed by hand.
+
+    Returns:
+        int: Results rolled up
+    """
+    from sqlalchemy import select
+
+    for table in ROLLUP_TABLES.values():
+        connection.execute(table.delete())
+
+    columns = [analysis_results.c[name] for name in (
+        'created_at', 'fruit_type', 'overall_condition', 'lot', 'freshness', 'ripeness', 'shelf_life_days'
+    )]
+    totals = None
+    count = 0
+    rows = connection.execute(select(*columns).where(analysis_results.c.cached.is_(False))).mappings()
+    while True:
+        chunk = rows.fetchmany(_REBUILD_CHUNK)
+        if not chunk:
+            break
+        totals = rollup_deltas(chunk, totals)
+        count += len(chunk)
+    if totals is not None:
+        write_rollups(connection, totals)
+    return count
@@ -0,0 +1,247 @@
+"""
+Runtime-tunable image processing and analysis settings.
+
+IMAGE_PROCESSING and ANALYSIS_CONFIG are read once into a Settings
+snapshot. Each request takes current_settings() once and passes that
+snapshot down the pipeline, so a swap never mixes old and new values
+within one request. update() validates overrides and replaces the snapshot
+with a single assignment; reload() re-reads config.py defaults plus the
+overrides file (SETTINGS_CONFIG['overrides_path']) and is wired to SIGHUP.
+"""
+import hashlib
+import json
+import logging
+import os
+import signal
+import threading
+from typing import Any, Dict, Mapping, Optional
+
+from config import ANALYSIS_CONFIG, IMAGE_PROCESSING, MODEL_CONFIG, SETTINGS_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Settings that can change at runtime, per section
+TUNABLE = {
+    'image_processing': ('target_size', 'hist_bins', 'reduced_decode'),
+    'analysis': ('condition_weights', 'condition_thresholds', 'ripeness_thresholds'),
+}
+
+class Settings:
+    """
+    Snapshot of the tunable settings
+
+    Never modified after construction (changes build a new snapshot), so
+    it can be shared between threads and pickled to executor processes.
+    """
+
+    def __init__(self, image_processing: Mapping[str, Any], analysis: Mapping[str, Any]):
+        """
+        Args:
+            image_processing: IMAGE_PROCESSING-shaped dict
+            analysis: ANALYSIS_CONFIG-shaped dict
+
+        Raises:
+            ValueError: If a value is missing or out of range
+        """
+        try:
+            width, height = image_processing['target_size']
+            self.target_size = (int(width), int(height))
+            self.hist_bins = int(image_processing['hist_bins'])
+            self.reduced_decode = bool(image_processing['reduced_decode'])
+            self.condition_weights = {
+                name: float(analysis['condition_weights'][name])
+                for name in ('freshness', 'ripeness', 'shelf_life')
+            }
+            self.condition_thresholds = {
+                name: float(analysis['condition_thresholds'][name])
+                for name in ('poor', 'fair', 'good', 'excellent')
+            }
+            self.ripeness_thresholds = {
+                name: float(analysis['ripeness_thresholds'][name])
+                for name in ('underripe', 'optimal', 'overripe')
+            }
+        except (KeyError, TypeError, ValueError) as e:
+            raise ValueError(f"Invalid settings: {e!r}")
+
+        if min(self.target_size) < 1:
+            raise ValueError(f"target_size must be positive, got {self.target_size}")
+        if not 1 <= self.hist_bins <= 256:
+            raise ValueError(f"hist_bins must be between 1 and 256, got {self.hist_bins}")
+        if min(self.condition_weights.values()) < 0:
+            raise ValueError("condition_weights must not be negative")
+        if list(self.condition_thresholds.values()) != sorted(self.condition_thresholds.values()):
+            raise ValueError("condition_thresholds must increase from poor to excellent")
+        if list(self.ripeness_thresholds.values()) != sorted(self.ripeness_thresholds.values()):
+            raise ValueError("ripeness_thresholds must increase from underripe to overripe")
+
+        # Identifies the scoring settings, e.g. in result cache keys
+        canonical = json.dumps(self.as_dict(), sort_keys=True).encode()
+        self.fingerprint = hashlib.blake2b(canonical, digest_size=8).hexdigest()
+
+    def as_dict(self) -> Dict[str, Dict[str, Any]]:
+        """Nested dict in the shape accepted by merged() and the overrides file"""
+        return {
+            'image_processing': {
+                'target_size': list(self.target_size),
+                'hist_bins': self.hist_bins,
+                'reduced_decode': self.reduced_decode,
+            },
+            'analysis': {
+                'condition_weights': dict(self.condition_weights),
+                'condition_thresholds': dict(self.condition_thresholds),
+                'ripeness_thresholds': dict(self.ripeness_thresholds),
+            },
+        }
+
+    def merged(self, overrides: Mapping[str, Any]) -> 'Settings':
+        """
+        New snapshot with overrides applied on top of this one
+
+        Args:
+            overrides: Same shape as as_dict(); nested dicts are merged
+                key by key, so {'analysis': {'condition_weights': {'freshness': 0.5}}}
+                only changes that one weight
+
+        Raises:
+            ValueError: For unknown sections or settings, or invalid values
+        """
+        values = self.as_dict()
+        for section, changes in overrides.items():
+            if section not in TUNABLE or not isinstance(changes, Mapping):
+                raise ValueError(f"Unknown settings section '{section}'")
+            for name, value in changes.items():
+                if name not in TUNABLE[section]:
+                    raise ValueError(f"'{section}.{name}' cannot be changed at runtime")
+                current_value = values[section][name]
+                if isinstance(current_value, dict):
+                    if not isinstance(value, Mapping) or not set(value) <= set(current_value):
+                        raise ValueError(f"'{section}.{name}' takes keys {sorted(current_value)}")
+                    current_value.update(value)
+                else:
+                    values[section][name] = value
+        return Settings(values['image_processing'], values['analysis'])
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, Settings) and self.as_dict() == other.as_dict()
+
+    def __repr__(self) -> str:
+        return f"Settings({self.fingerprint})"
+
+def defaults() -> Settings:
+    """Snapshot of the values in config.py"""
+    return Settings(IMAGE_PROCESSING, ANALYSIS_CONFIG)
+
+def check_model_compatible(settings: Settings) -> None:
+    """A trained model only accepts its own input size"""
+    height, width = MODEL_CONFIG['input_shape'][:2]
+    if MODEL_CONFIG['model_path'] and settings.target_size != (width, height):
+        raise ValueError(
+            f"target_size must stay {[width, height]} while a model is configured "
+            f"(MODEL_CONFIG['input_shape'])"
+        )
+
+def load() -> Settings:
+    """Defaults plus the overrides file, if one is configured and present"""
+    settings = defaults()
+    path = SETTINGS_CONFIG['overrides_path']
+    if path and os.path.exists(path):
+        with open(path) as f:
+            settings = settings.merged(json.load(f))
+    check_model_compatible(settings)
+    return settings
+
+_current = load()
+
+def current_settings() -> Settings:
+    """The snapshot new requests should use"""
+    return _current
+
+def swap(settings: Settings) -> Settings:
+    """Make settings current (one reference assignment, so readers see old or new)"""
+    global _current
+    previous, _current = _current, settings
+    if previous != settings:
+        logger.info("Settings changed from %r to %r", previous, settings)
+    return previous
+
+# Updates run on threadpool threads; one at a time, so none is lost and
+# they never share the temporary file
+_update_lock = threading.Lock()
+
+def update(overrides: Mapping[str, Any], persist: bool = True) -> Settings:
+    """
+    Validate overrides against the current snapshot and swap them in
+
+    Args:
+        overrides: Same shape as Settings.as_dict(), possibly partial
+        persist: Also write the result to the overrides file, when one is
+            configured, so other workers and restarts pick it up
+
+    Returns:
+        Settings: The new current snapshot
+
+    Raises:
+        ValueError: If the overrides are invalid
+    """
+    with _update_lock:
+        settings = _current.merged(overrides)
+        check_model_compatible(settings)
+        path = SETTINGS_CONFIG['overrides_path']
+        if persist and path:
+            # Write then rename, so a concurrent reload never reads half a file
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(settings.as_dict(), f, indent=2, sort_keys=True)
+            os.replace(tmp_path, path)
+        swap(settings)
+        return settings
+
+def reload() -> Settings:
+    """Re-read config.py defaults and the overrides file; keeps the current snapshot on errors"""
+    try:
+        swap(load())
+    except (OSError, ValueError) as e:
+        logger.error("Settings reload failed, keeping %r: %s", _current, e)
+    return _current
+
+# Set by the pre-fork supervisor so any worker can ask it to reload all workers
+_supervisor_pid: Optional[int] = None
+
+def set_supervisor(pid: Optional[int]) -> None:
+    global _supervisor_pid
+    _supervisor_pid = pid
+
+def broadcast_reload() -> bool:
+    """
+    Ask every worker to reload, via SIGHUP to the pre-fork supervisor
+
+    Returns:
+        bool: False when there is no supervisor to signal
+    """
+    if _supervisor_pid is None or not hasattr(signal, 'SIGHUP'):
+        return False
+    os.kill(_supervisor_pid, signal.SIGHUP)
+    return True
+
+def install_reload_handler(loop) -> bool:
+    """
+    Reload on SIGHUP, on the given event loop
+
+    Returns:
+        bool: False where signal handlers cannot be installed (no SIGHUP,
+        or not on the main thread, e.g. under the test client)
+    """
+    if not hasattr(signal, 'SIGHUP'):
+        return False
+    try:
+        loop.add_signal_handler(signal.SIGHUP, reload)
+    except (NotImplementedError, RuntimeError, ValueError):
+        return False
+    return True
+
+def remove_reload_handler(loop) -> None:
+    if hasattr(signal, 'SIGHUP'):
+        try:
+            loop.remove_signal_handler(signal.SIGHUP)
+        except (NotImplementedError, RuntimeError, ValueError):
+            pass
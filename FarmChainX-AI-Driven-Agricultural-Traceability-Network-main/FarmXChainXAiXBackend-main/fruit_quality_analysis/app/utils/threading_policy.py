@@ -0,0 +1,162 @@
+import logging
+import os
+import sys
+from typing import Any, Dict, Optional
+
+from config import API_CONFIG, THREADING_CONFIG
+
+logger = logging.getLogger(__name__)
+
+# Thread pools sized by environment variables, read when the library loads
+NATIVE_THREAD_VARS = (
+    'OMP_NUM_THREADS',
+    'OPENBLAS_NUM_THREADS',
+    'MKL_NUM_THREADS',
+    'VECLIB_MAXIMUM_THREADS',
+    'NUMEXPR_NUM_THREADS',
+)
+
+class ThreadingPolicy:
+    """How the cores of the machine are split between workers and libraries"""
+
+    def __init__(self, cpu_count: int, workers: int, executor_workers: int, native_threads: int,
+                 tf_intra_op_threads: int, tf_inter_op_threads: int):
+        """
+        Args:
+            cpu_count: Cores available to the server
+            workers: Server worker processes sharing them
+            executor_workers: Analysis executor size per worker
+            native_threads: OpenCV/OpenMP/BLAS threads per pipeline call
+            tf_intra_op_threads: Threads TensorFlow may use inside one op
+            tf_inter_op_threads: TensorFlow ops run concurrently
+        """
+        self.cpu_count = cpu_count
+        self.workers = workers
+        self.executor_workers = executor_workers
+        self.native_threads = native_threads
+        self.tf_intra_op_threads = tf_intra_op_threads
+        self.tf_inter_op_threads = tf_inter_op_threads
+
+    def as_dict(self) -> Dict[str, Any]:
+        return dict(vars(self))
+
+    def __eq__(self, other: object) -> bool:
+        return isinstance(other, ThreadingPolicy) and vars(self) == vars(other)
+
+    def __repr__(self) -> str:
+        settings = ', '.join(f"{name}={value}" for name, value in vars(self).items())
+        return f"ThreadingPolicy({settings})"
+
+def available_cpus() -> int:
+    """Cores this process may run on (respects CPU affinity and cpusets)"""
+    if hasattr(os, 'sched_getaffinity'):
+        return len(os.sched_getaffinity(0)) or 1
+    return os.cpu_count() or 1
+
+def derive_policy(
+    cpu_count: Optional[int] = None,
+    workers: int = 1,
+    executor_workers: Optional[int] = None,
+    native_threads: Optional[int] = None,
+    tf_intra_op_threads: Optional[int] = None,
+    tf_inter_op_threads: Optional[int] = None
+) -> ThreadingPolicy:
+    """
+    Split the cores so the total thread count stays near the core count
+
+    Each server worker gets an equal share of the cores. By default its
+    executor gets one thread per core of that share, and each executor
+    thread gets native library threads for the cores left over (usually
+    one: the parallelism comes from the executor, not from inside OpenCV).
+    Inference is serialized per worker, so TensorFlow may use the whole
+    share for a single op. Explicit values override the derived ones.
+
+    Args:
+        cpu_count: Cores available, defaults to available_cpus()
+        workers: Server worker processes
+        executor_workers: Fixed executor size, None to derive it
+        native_threads: Fixed OpenCV/BLAS threads, None to derive them
+        tf_intra_op_threads: Fixed TensorFlow intra-op threads, None to derive them
+        tf_inter_op_threads: Fixed TensorFlow inter-op threads, None for 1
+
+    Returns:
+        ThreadingPolicy: The resulting split
+    """
+    cpu_count = cpu_count or available_cpus()
+    cores_per_worker = max(1, cpu_count // max(1, workers))
+    executor_workers = executor_workers or cores_per_worker
+    return ThreadingPolicy(
+        cpu_count=cpu_count,
+        workers=workers,
+        executor_workers=executor_workers,
+        native_threads=native_threads or max(1, cores_per_worker // executor_workers),
+        tf_intra_op_threads=tf_intra_op_threads or cores_per_worker,
+        tf_inter_op_threads=tf_inter_op_threads or 1,
+    )
+
+def configured_policy(workers: Optional[int] = None) -> ThreadingPolicy:
+    """
+    Policy for this process from API_CONFIG and THREADING_CONFIG
+
+    Args:
+        workers: Server worker processes; defaults to API_CONFIG['workers']
+            in production mode and 1 otherwise
+    """
+    if workers is None:
+        workers = API_CONFIG['workers'] if API_CONFIG['server_mode'] == 'production' else 1
+    return derive_policy(
+        workers=workers,
+        executor_workers=API_CONFIG['executor_workers'],
+        native_threads=THREADING_CONFIG['native_threads'],
+        tf_intra_op_threads=THREADING_CONFIG['tf_intra_op_threads'],
+        tf_inter_op_threads=THREADING_CONFIG['tf_inter_op_threads'],
+    )
+
+def set_native_env(threads: int) -> None:
+    """
+    Size the OpenMP/BLAS pools through their environment variables
+
+    Only effective before NumPy is first imported; values already set by
+    the operator are left alone.
+    """
+    for var in NATIVE_THREAD_VARS:
+        os.environ.setdefault(var, str(threads))
+
+_active: Optional[ThreadingPolicy] = None
+
+def active_policy() -> Optional[ThreadingPolicy]:
+    """The policy applied in this process, if any"""
+    return _active
+
+def apply_policy(policy: ThreadingPolicy) -> None:
+    """
+    Apply a policy to this process
+
+    Safe to call again, e.g. in a freshly forked worker or pool process;
+    OpenCV's pool is resized each time. TensorFlow is configured now if it
+    is already imported, otherwise when the model registry imports it.
+    """
+    global _active
+    _active = policy
+    set_native_env(policy.native_threads)
+
+    from .image_processor import cv2
+    cv2.setNumThreads(policy.native_threads)
+
+    if 'tensorflow' in sys.modules:
+        configure_tensorflow(sys.modules['tensorflow'])
+
+def apply_native_threads(threads: int) -> None:
+    """Executor process initializer: size OpenCV's pool in the new process"""
+    from .image_processor import cv2
+    cv2.setNumThreads(threads)
+
+def configure_tensorflow(tf: Any) -> None:
+    """Set TensorFlow's thread pools from the active (or configured) policy"""
+    policy = _active or configured_policy()
+    try:
+        tf.config.threading.set_intra_op_parallelism_threads(policy.tf_intra_op_threads)
+        tf.config.threading.set_inter_op_parallelism_threads(policy.tf_inter_op_threads)
+    except RuntimeError:
+        # Pools are fixed once TensorFlow has initialized its runtime
+        logger.warning("TensorFlow is already initialized; threading policy not applied to it")
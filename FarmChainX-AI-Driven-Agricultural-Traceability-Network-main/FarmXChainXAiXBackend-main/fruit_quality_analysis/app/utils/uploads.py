@@ -0,0 +1,126 @@
+from typing import Optional
+
+from fastapi import HTTPException, UploadFile
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+# Enough bytes to recognise every supported format
+SNIFF_BYTES = 12
+
+# Later reads are large to keep the number of thread-pool hops low
+CHUNK_SIZE = 1024 * 1024
+
+def sniff_image_type(head: bytes) -> Optional[str]:
+    """
+    Identify an image format from its leading magic bytes
+
+    Only formats OpenCV can decode are recognised.
+
+    Args:
+        head: First bytes of the upload (at least SNIFF_BYTES for WebP)
+
+    Returns:
+        Format name ('jpeg', 'png', 'webp', 'bmp', 'tiff') or None
+    """
+    if head.startswith(b'\xff\xd8\xff'):
+        return 'jpeg'
+    if head.startswith(b'\x89PNG\r\n\x1a\n'):
+        return 'png'
+    if head[:4] == b'RIFF' and head[8:12] == b'WEBP':
+        return 'webp'
+    if head.startswith(b'BM'):
+        return 'bmp'
+    if head[:4] in (b'II*\x00', b'MM\x00*'):
+        return 'tiff'
+    return None
+
+async def read_upload(file: UploadFile, max_bytes: int) -> bytearray:
+    """
+    Read a parsed upload into memory, checking its type and size
+
+    By now Starlette's multipart parser has received the whole request
+    body and spooled this file (RequestSizeLimitMiddleware is what bounds
+    that). Sniffing the first bytes and stopping at max_bytes only keep a
+    non-image or oversized file from being copied into memory as well.
+
+    Args:
+        file: Uploaded file
+        max_bytes: Largest accepted upload
+
+    Returns:
+        bytearray: The complete upload
+
+    Raises:
+        HTTPException: 400 for non-images, 413 for oversized uploads
+    """
+    too_large = HTTPException(
+        status_code=413,
+        detail=f"File '{file.filename}' exceeds the {max_bytes} byte upload limit"
+    )
+    if file.size is not None and file.size > max_bytes:
+        raise too_large
+
+    contents = bytearray(await file.read(SNIFF_BYTES))
+    if sniff_image_type(bytes(contents)) is None:
+        raise HTTPException(status_code=400, detail=f"File '{file.filename}' must be an image")
+
+    while True:
+        chunk = await file.read(CHUNK_SIZE)
+        if not chunk:
+            break
+        if len(contents) + len(chunk) > max_bytes:
+            raise too_large
+        contents += chunk
+
+    return contents
+
+class RequestSizeLimitMiddleware:
+    """
+    Rejects request bodies over a size limit before they are parsed
+
+    Requests declaring a larger Content-Length get a 413 straight away;
+    streamed bodies are counted and cut off once they cross the limit.
+    """
+
+    def __init__(self, app: ASGIApp, max_bytes: int):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        headers = dict(scope['headers'])
+        content_length = headers.get(b'content-length')
+        if content_length is not None and content_length.isdigit() and int(content_length) > self.max_bytes:
+            await self._reject(send)
+            return
+
+        received = 0
+
+        async def limited_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            if message['type'] == 'http.request':
+                received += len(message.get('body', b''))
+                if received > self.max_bytes:
+                    # Raised inside the endpoint's body parsing, so FastAPI
+                    # turns it into a normal 413 response
+                    raise HTTPException(status_code=413, detail="Request body too large")
+            return message
+
+        await self.app(scope, limited_receive, send)
+
+    async def _reject(self, send: Send) -> None:
+        """Send a 413 without reading the body"""
+        body = b'{"detail":"Request body too large"}'
+        await send({
+            'type': 'http.response.start',
+            'status': 413,
+            'headers': [
+                (b'content-type', b'application/json'),
+                (b'content-length', str(len(body)).encode()),
+                (b'connection', b'close'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': body})
@@ -0,0 +1,162 @@
+"""
+Timing, baseline and regression helpers shared by the benchmarks.
+
+Each case is timed timeit-style: calibrated so a round lasts long enough to
+measure, then repeated, and reported per call. Baselines are JSON files of
+median timings; a case regresses when its median exceeds the stored one by
+more than the threshold. Baselines are machine specific, so the machine
+they were recorded on is stored alongside and a mismatch is reported.
+"""
+import json
+import os
+import platform
+import statistics
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+BASELINE_DIR = Path(__file__).resolve().parent / 'baselines'
+
+def measure(fn: Callable[[], Any], min_round_time: float = 0.05, repeat: int = 7,
+            warmup: int = 1) -> Dict[str, float]:
+    """
+    Time fn per call
+
+    Args:
+        fn: Zero-argument callable to time
+        min_round_time: Calls per round are doubled until a round takes this long
+        repeat: Number of timed rounds
+        warmup: Untimed calls before calibration
+
+    Returns:
+        min, median, mean and stdev seconds per call, plus rounds and calls per round
+    """
+    for _ in range(warmup):
+        fn()
+
+    number = 1
+    while True:
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        elapsed = time.perf_counter() - started
+        if elapsed >= min_round_time or number >= 1 << 20:
+            break
+        number *= 2
+
+    timings = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        timings.append((time.perf_counter() - started) / number)
+
+    return {
+        'min': min(timings),
+        'median': statistics.median(timings),
+        'mean': statistics.fmean(timings),
+        'stdev': statistics.stdev(timings) if len(timings) > 1 else 0.0,
+        'rounds': repeat,
+        'number': number,
+    }
+
+def machine_info() -> Dict[str, Any]:
+    """What a baseline was recorded on"""
+    return {
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+    }
+
+def load_baseline(path: Path) -> Optional[Dict[str, Any]]:
+    """Read a stored baseline, or None if there is none yet"""
+    if not path.exists():
+        return None
+    with open(path) as f:
+        return json.load(f)
+
+def save_baseline(path: Path, results: Dict[str, Dict[str, float]]) -> None:
+    """
+    Store the median of every case as the baseline
+
+    Cases not in results keep their stored medians, unless the baseline
+    came from a different machine, in which case it is replaced entirely.
+    """
+    path.parent.mkdir(parents=True, exist_ok=True)
+    existing = load_baseline(path)
+    medians = {}
+    if existing is not None and existing.get('machine') == machine_info():
+        medians.update(existing['medians'])
+    medians.update({name: result['median'] for name, result in results.items()})
+    baseline = {
+        'machine': machine_info(),
+        'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'medians': medians,
+    }
+    with open(path, 'w') as f:
+        json.dump(baseline, f, indent=2, sort_keys=True)
+        f.write('\n')
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Any],
+            threshold: float) -> List[Dict[str, Any]]:
+    """
+    Compare medians against a baseline
+
+    Args:
+        results: measure() output per case
+        baseline: load_baseline() output
+        threshold: Allowed slowdown as a fraction (0.25 = 25% slower)
+
+    Returns:
+        One row per case with the baseline median, ratio and regression flag
+        (cases missing from the baseline are never flagged)
+    """
+    rows = []
+    for name, result in results.items():
+        base = baseline['medians'].get(name)
+        ratio = result['median'] / base if base else None
+        rows.append({
+            'name': name,
+            'median': result['median'],
+            'baseline': base,
+            'ratio': ratio,
+            'regressed': ratio is not None and ratio > 1 + threshold,
+        })
+    return rows
+
+def format_seconds(seconds: Optional[float]) -> str:
+    if seconds is None:
+        return '-'
+    if seconds < 1e-3:
+        return f"{seconds * 1e6:.1f} us"
+    if seconds < 1:
+        return f"{seconds * 1e3:.2f} ms"
+    return f"{seconds:.2f} s"
+
+def report(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Any]],
+           threshold: float) -> bool:
+    """
+    Print a results table, against the baseline when there is one
+
+    Returns:
+        True when any case regressed beyond the threshold
+    """
+    if baseline is not None and baseline.get('machine') != machine_info():
+        print("Note: baseline was recorded on a different machine or Python; "
+              "re-record it with --save-baseline before trusting the ratios")
+
+    rows = compare(results, baseline, threshold) if baseline is not None else [
+        {'name': name, 'median': result['median'], 'baseline': None, 'ratio': None, 'regressed': False}
+        for name, result in results.items()
+    ]
+    width = max(len(row['name']) for row in rows) + 2
+    print(f"{'case':<{width}} {'median':>12} {'min':>12} {'baseline':>12} {'ratio':>8}")
+    print('-' * (width + 48))
+    for row in rows:
+        ratio = f"{row['ratio']:.2f}x" if row['ratio'] is not None else '-'
+        flag = '  REGRESSED' if row['regressed'] else ''
+        print(f"{row['name']:<{width}} {format_seconds(row['median']):>12} "
+              f"{format_seconds(results[row['name']]['min']):>12} "
+              f"{format_seconds(row['baseline']):>12} {ratio:>8}{flag}")
+    return any(row['regressed'] for row in rows)
@@ -0,0 +1,121 @@
+"""
+Inference backend comparison on the same inputs.
+
+Each model is given as [BACKEND=]PATH (the backend defaults to 'auto', by
+file extension) and runs in a fresh interpreter, so runtimes do not share
+memory or thread pools. Every run preprocesses the same synthetic images,
+in the dtype its backend asks for (uint8 pixels for quantized models), and
+reports:
+
+- load time and resident memory added by loading the model
+- single-image latency (median and stdev per call)
+- throughput at the batch size given by --batch
+- peak resident memory
+- top-1 agreement with the first model, e.g. to see what int8
+  quantization costs against the float model
+
+Usage:
+    python -m benchmarks.inference models/fruit.keras tflite=models/fruit_int8.tflite \\
+                                   models/fruit.onnx [--batch 16] [--images 64]
+"""
+import argparse
+import json
+import subprocess
+import sys
+from pathlib import Path
+from typing import Tuple
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+CHILD_SCRIPT = r"""
+import json, resource, sys, time
+backend_name, model_path = sys.argv[1:3]
+batch_size, image_count = int(sys.argv[3]), int(sys.argv[4])
+
+def current_rss_mb():
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize() / 2**20
+
+import numpy as np
+from app.utils.image_processor import cv2, process_images
+from app.utils.inference import load_backend
+from benchmarks.harness import measure
+
+rng = np.random.default_rng(0)
+images = [
+    cv2.imencode('.png', cv2.GaussianBlur(rng.integers(0, 255, (480, 640, 3), dtype=np.uint8), (9, 9), 0))[1].tobytes()
+    for _ in range(image_count)
+]
+
+before_load = current_rss_mb()
+started = time.perf_counter()
+backend = load_backend(model_path, backend_name)
+load_seconds = time.perf_counter() - started
+after_load = current_rss_mb()
+
+inputs = process_images(images, input_dtype=backend.input_dtype)['processed_images']
+single = inputs[:1]
+batch = inputs[:batch_size]
+
+latency = measure(lambda: backend.predict(single))
+throughput = measure(lambda: backend.predict(batch))
+top1 = np.concatenate([
+    backend.predict(inputs[start:start + batch_size]).argmax(axis=1)
+    for start in range(0, len(inputs), batch_size)
+])
+
+print(json.dumps({
+    **backend.info(),
+    'load_seconds': load_seconds,
+    'model_rss_mb': after_load - before_load,
+    'latency_ms': latency['median'] * 1e3,
+    'latency_stdev_ms': latency['stdev'] * 1e3,
+    'images_per_second': len(batch) / throughput['median'],
+    'peak_rss_mb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+    'top1': top1.tolist(),
+}))
+"""
+
+def parse_model(value: str) -> Tuple[str, str]:
+    """[BACKEND=]PATH -> (backend, path)"""
+    backend, separator, path = value.partition('=')
+    return (backend, path) if separator else ('auto', value)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('models', nargs='+', type=parse_model, help='[BACKEND=]PATH of each model to compare')
+    parser.add_argument('--batch', type=int, default=16, help='Batch size for the throughput case')
+    parser.add_argument('--images', type=int, default=64, help='Distinct input images')
+    args = parser.parse_args()
+
+    results = []
+    for backend, path in args.models:
+        completed = subprocess.run(
+            [sys.executable, '-W', 'ignore', '-c', CHILD_SCRIPT, backend, path, str(args.batch), str(args.images)],
+            cwd=PROJECT_DIR, capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            error = completed.stderr.strip().splitlines()[-1] if completed.stderr.strip() else 'failed'
+            print(f"{path}: {error}", file=sys.stderr)
+            continue
+        result = json.loads(completed.stdout.strip().splitlines()[-1])
+        results.append((path, result))
+
+    if not results:
+        sys.exit(1)
+
+    reference = results[0][1]['top1']
+    print(f"{'Model':<32} {'backend':<11} {'input':<8} {'load s':>7} {'model MB':>9} "
+          f"{'ms/image':>9} {'+-':>6} {f'img/s @{args.batch}':>11} {'peak MB':>8} {'top-1 agree':>12}")
+    print("-" * 122)
+    for path, result in results:
+        agreement = sum(a == b for a, b in zip(result['top1'], reference)) / len(reference)
+        print(f"{Path(path).name:<32} {result['backend']:<11} {result['input_dtype']:<8} "
+              f"{result['load_seconds']:>7.2f} {result['model_rss_mb']:>9.1f} "
+              f"{result['latency_ms']:>9.2f} {result['latency_stdev_ms']:>6.2f} "
+              f"{result['images_per_second']:>11.1f} {result['peak_rss_mb']:>8.1f} {agreement:>12.1%}")
+    print("-" * 122)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,254 @@
+"""
+Load generator for /analyze.
+
+Starts `uvicorn app.main:app` locally (or targets --url) and replays a
+corpus of images against /analyze, either closed-loop at a fixed number of
+concurrent clients or open-loop at a fixed arrival rate. Reports latency
+percentiles, throughput and error rate.
+
+In rate mode latency is measured from each request's scheduled start, so a
+server that falls behind is charged for the queueing it causes (no
+coordinated omission).
+
+Usage:
+    python -m benchmarks.load --concurrency 16 --duration 30 [--workers 4]
+    python -m benchmarks.load --rate 50 --duration 30 [--poisson]
+    python -m benchmarks.load --corpus path/to/images --url http://host:8000
+"""
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import httpx
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+IMAGE_SUFFIXES = ('.jpg', '.jpeg', '.png', '.webp', '.bmp')
+
+# (filename, bytes, content type)
+Upload = Tuple[str, bytes, str]
+
+def load_corpus(corpus: Optional[Path], sizes: Sequence[Tuple[int, int]]) -> List[Upload]:
+    """Images to replay: every image under corpus, or synthetic JPEGs"""
+    if corpus is not None:
+        paths = sorted(path for path in corpus.rglob('*') if path.suffix.lower() in IMAGE_SUFFIXES)
+        if not paths:
+            raise SystemExit(f"No images found under {corpus}")
+        return [(path.name, path.read_bytes(), 'application/octet-stream') for path in paths]
+
+    import cv2
+    import numpy as np
+    rng = np.random.default_rng(0)
+    uploads = []
+    for width, height in sizes:
+        photo = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+        uploads.append((f"{width}x{height}.jpg", cv2.imencode('.jpg', photo)[1].tobytes(), 'image/jpeg'))
+    return uploads
+
+def percentile(sorted_values: Sequence[float], fraction: float) -> float:
+    """Nearest-rank percentile of pre-sorted values"""
+    if not sorted_values:
+        return 0.0
+    rank = max(0, min(len(sorted_values) - 1, math.ceil(fraction * len(sorted_values)) - 1))
+    return sorted_values[rank]
+
+def summarize(latencies: List[float], statuses: Counter, elapsed: float) -> Dict[str, Any]:
+    """
+    Summary of a run
+
+    Args:
+        latencies: Seconds per completed request (successful or not)
+        statuses: Count per HTTP status, or per exception name for failures
+        elapsed: Length of the measured window in seconds
+    """
+    total = sum(statuses.values())
+    ok = statuses.get(200, 0)
+    ordered = sorted(latencies)
+    return {
+        'requests': total,
+        'ok': ok,
+        'error_rate': (total - ok) / total if total else 0.0,
+        'throughput_rps': ok / elapsed if elapsed else 0.0,
+        'latency_ms': {
+            'p50': percentile(ordered, 0.50) * 1000,
+            'p95': percentile(ordered, 0.95) * 1000,
+            'p99': percentile(ordered, 0.99) * 1000,
+            'max': (ordered[-1] if ordered else 0.0) * 1000,
+        },
+        'statuses': {str(status): count for status, count in sorted(statuses.items(), key=str)},
+    }
+
+class LoadRun:
+    """Results collected while driving the server"""
+
+    def __init__(self, client: httpx.AsyncClient, uploads: List[Upload]):
+        self.client = client
+        self.uploads = uploads
+        self.latencies: List[float] = []
+        self.statuses: Counter = Counter()
+        self._next = 0
+
+    def next_upload(self) -> Upload:
+        upload = self.uploads[self._next % len(self.uploads)]
+        self._next += 1
+        return upload
+
+    async def request(self, started: float, record: bool) -> None:
+        """Send one upload; latency counts from started"""
+        try:
+            response = await self.client.post('/analyze', files={'file': self.next_upload()})
+            status: Any = response.status_code
+        except httpx.HTTPError as e:
+            status = type(e).__name__
+        if record:
+            self.latencies.append(time.perf_counter() - started)
+            self.statuses[status] += 1
+
+async def closed_loop(run: LoadRun, concurrency: int, warmup: float, duration: float) -> float:
+    """Keep concurrency requests in flight; returns the measured window length"""
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+
+    async def client_loop():
+        while True:
+            now = time.perf_counter()
+            if now >= deadline:
+                return
+            await run.request(now, record=now >= measure_from)
+
+    await asyncio.gather(*(client_loop() for _ in range(concurrency)))
+    return time.perf_counter() - measure_from
+
+async def open_loop(run: LoadRun, rate: float, poisson: bool, warmup: float, duration: float) -> float:
+    """Start requests at a fixed arrival rate; returns the measured window length"""
+    rng = random.Random(0)
+    start = time.perf_counter()
+    measure_from = start + warmup
+    deadline = measure_from + duration
+    tasks = []
+    scheduled = start
+
+    while scheduled < deadline:
+        delay = scheduled - time.perf_counter()
+        if delay > 0:
+            await asyncio.sleep(delay)
+        tasks.append(asyncio.create_task(run.request(scheduled, record=scheduled >= measure_from)))
+        scheduled += rng.expovariate(rate) if poisson else 1 / rate
+
+    await asyncio.gather(*tasks)
+    return deadline - measure_from
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+def start_server(port: int, workers: int, cache: bool) -> subprocess.Popen:
+    """Launch uvicorn app.main:app in the background"""
+    env = dict(
+        os.environ,
+        # Load-test uploads should not fill data/raw
+        ARCHIVE_UPLOADS='False',
+        # A replayed corpus would otherwise be served almost entirely from the cache
+        RESULT_CACHE='True' if cache else 'False',
+    )
+    return subprocess.Popen(
+        [sys.executable, '-m', 'uvicorn', 'app.main:app', '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(workers), '--log-level', 'warning', '--no-access-log'],
+        cwd=PROJECT_DIR, env=env
+    )
+
+def wait_until_ready(url: str, timeout: float = 120.0) -> None:
+    """Poll /health until the warm-up has finished"""
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            startup = httpx.get(f"{url}/health", timeout=5).json()['startup']
+            if startup['ready']:
+                return
+            if startup['error']:
+                raise SystemExit(f"Server failed to start: {startup['error']}")
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    raise SystemExit(f"Server at {url} was not ready after {timeout:.0f}s")
+
+def parse_sizes(value: str) -> List[Tuple[int, int]]:
+    return [tuple(int(part) for part in item.lower().split('x')) for item in value.split(',')]
+
+async def drive(args: argparse.Namespace, url: str, uploads: List[Upload]) -> Dict[str, Any]:
+    in_flight = args.concurrency if args.rate is None else None
+    limits = httpx.Limits(max_connections=in_flight, max_keepalive_connections=in_flight)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=args.timeout) as client:
+        run = LoadRun(client, uploads)
+        if args.rate is None:
+            elapsed = await closed_loop(run, args.concurrency, args.warmup, args.duration)
+        else:
+            elapsed = await open_loop(run, args.rate, args.poisson, args.warmup, args.duration)
+    return summarize(run.latencies, run.statuses, elapsed)
+
+def main():
+    from config import API_CONFIG
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument('--concurrency', type=int, default=8, help='Concurrent clients (closed loop)')
+    mode.add_argument('--rate', type=float, help='Arrivals per second (open loop)')
+    parser.add_argument('--poisson', action='store_true', help='Exponential inter-arrival times in rate mode')
+    parser.add_argument('--duration', type=float, default=20.0, help='Measured seconds')
+    parser.add_argument('--warmup', type=float, default=3.0, help='Unmeasured seconds before the window')
+    parser.add_argument('--timeout', type=float, default=30.0, help='Per-request timeout in seconds')
+    parser.add_argument('--corpus', type=Path, help='Directory of images to replay (default: synthetic)')
+    parser.add_argument('--sizes', default='640x480,1920x1080,4032x3024',
+                        help='Synthetic image sizes when no corpus is given')
+    parser.add_argument('--url', help='Target an already running server instead of starting one')
+    parser.add_argument('--workers', type=int, default=API_CONFIG['workers'], help='uvicorn worker processes')
+    parser.add_argument('--cache', action='store_true', help='Leave the result cache on')
+    parser.add_argument('--json', action='store_true', help='Print the summary as JSON')
+    args = parser.parse_args()
+
+    uploads = load_corpus(args.corpus, parse_sizes(args.sizes))
+
+    server = None
+    url = args.url
+    if url is None:
+        port = free_port()
+        url = f"http://127.0.0.1:{port}"
+        server = start_server(port, args.workers, args.cache)
+    try:
+        wait_until_ready(url)
+        summary = asyncio.run(drive(args, url, uploads))
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+
+    if args.json:
+        print(json.dumps(summary, indent=2))
+        return
+
+    load = f"{args.concurrency} concurrent clients" if args.rate is None else \
+        f"{args.rate:g} req/s ({'poisson' if args.poisson else 'constant'} arrivals)"
+    workers = f"{args.workers} worker(s)" if server is not None else url
+    print(f"/analyze at {load}, {workers}, {len(uploads)} image(s), {args.duration:g}s")
+    print("-" * 50)
+    print(f"{'Requests':<20} {summary['requests']:>12}")
+    print(f"{'Throughput':<20} {summary['throughput_rps']:>12.1f} req/s")
+    print(f"{'Error rate':<20} {summary['error_rate'] * 100:>11.2f}%")
+    for name, value in summary['latency_ms'].items():
+        print(f"{'Latency ' + name:<20} {value:>12.1f} ms")
+    print(f"{'Statuses':<20} {summary['statuses']}")
+    print("-" * 50)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,101 @@
+"""
+Peak-memory benchmark for concurrent /analyze requests.
+
+Fires N simultaneous uploads of a large synthetic photo at the in-process
+ASGI app and reports resident memory before and at the peak, plus what one
+in-flight request retains after feature extraction. Runs in a fresh
+interpreter so the peak is not polluted by earlier work.
+
+Usage:
+    python -m benchmarks.memory [--concurrency 50] [--width 4032 --height 3024]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+CHILD_SCRIPT = r"""
+import asyncio, json, resource, sys
+import numpy as np
+import httpx
+
+concurrency, width, height = (int(value) for value in sys.argv[1:4])
+
+def current_rss_mb():
+    with open('/proc/self/statm') as statm:
+        pages = int(statm.read().split()[1])
+    return pages * resource.getpagesize() / 2**20
+
+def peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+from app.main import app
+from app.utils.image_processor import cv2, process_image
+
+rng = np.random.default_rng(0)
+photo = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+payload = cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+frame_mb = photo.nbytes / 2**20
+retained_mb = process_image(payload).nbytes / 2**20
+del photo
+
+async def main():
+    transport = httpx.AsyncClient(app=app, base_url='http://bench')
+    async with transport as client:
+        # Warm up once so imports and pools are not counted
+        await client.post('/analyze', files={'file': ('w.jpg', payload + b'w', 'image/jpeg')})
+        baseline = current_rss_mb()
+        # A distinct trailing byte per request defeats the result cache
+        responses = await asyncio.gather(*(
+            client.post('/analyze', files={'file': (f'{i}.jpg', payload + bytes([i % 256]), 'image/jpeg')})
+            for i in range(concurrency)
+        ))
+    assert all(response.status_code == 200 for response in responses)
+    return baseline
+
+baseline = asyncio.run(main())
+print(json.dumps({
+    'upload_mb': len(payload) / 2**20,
+    'full_frame_mb': frame_mb,
+    'retained_per_request_mb': retained_mb,
+    'baseline_rss_mb': baseline,
+    'peak_rss_mb': peak_rss_mb(),
+}))
+"""
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--concurrency', type=int, default=50, help='Simultaneous requests')
+    parser.add_argument('--width', type=int, default=4032, help='Synthetic photo width')
+    parser.add_argument('--height', type=int, default=3024, help='Synthetic photo height')
+    args = parser.parse_args()
+
+    output = subprocess.run(
+        [sys.executable, '-W', 'ignore', '-c', CHILD_SCRIPT,
+         str(args.concurrency), str(args.width), str(args.height)],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True,
+        # Benchmark uploads should not fill data/raw
+        env=dict(os.environ, ARCHIVE_UPLOADS='False')
+    ).stdout
+    result = json.loads(output.strip().splitlines()[-1])
+
+    growth = result['peak_rss_mb'] - result['baseline_rss_mb']
+    print(f"{args.concurrency} concurrent /analyze requests, {args.width}x{args.height} JPEG")
+    print("-" * 50)
+    print(f"{'Upload size':<32} {result['upload_mb']:>10.1f} MB")
+    print(f"{'Full-resolution frame':<32} {result['full_frame_mb']:>10.1f} MB")
+    print(f"{'Retained per request':<32} {result['retained_per_request_mb']:>10.2f} MB")
+    print(f"{'RSS after warm-up':<32} {result['baseline_rss_mb']:>10.1f} MB")
+    print(f"{'Peak RSS':<32} {result['peak_rss_mb']:>10.1f} MB")
+    print(f"{'Growth per request':<32} {growth / args.concurrency:>10.2f} MB")
+    # The in-process client builds every request body and the server reads
+    # each upload once more, so part of the growth is just the uploads
+    print(f"{'  of which upload copies (est.)':<32} {2 * result['upload_mb']:>10.2f} MB")
+    print("-" * 50)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Micro-benchmarks for the image pipeline and the /analyze endpoint.
+
+Times every stage of the pipeline (ImageProcessor.load_image, resize_image,
+normalize_image, preprocess_for_model, extract_color_histogram and
+FruitQualityAnalyzer.analyze), batch scoring with
+FruitQualityAnalyzer.analyze_batch, plus end-to-end /analyze through an
+in-process ASGI client, on synthetic images from tests/create_test_image.py
+at several sizes. Results are compared with the stored baseline and the
+exit status is 1 when a case is slower than the baseline by more than the
+threshold.
+
+Runtime settings (e.g. a cheaper histogram or model input size) can be
+tried with --settings, in the shape PUT /admin/settings accepts; compare
+such runs against a separate --baseline file.
+
+Usage:
+    python -m benchmarks.pipeline [--sizes 320x240,1280x960,4032x3024]
+                                  [--filter resize] [--threshold 0.25]
+                                  [--save-baseline]
+    python -m benchmarks.pipeline --settings '{"image_processing": {"hist_bins": 64}}'
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+from pathlib import Path
+from typing import Callable, Dict, List, Tuple
+
+# Benchmark uploads should not fill data/raw or be answered from the cache
+os.environ.setdefault('ARCHIVE_UPLOADS', 'False')
+os.environ.setdefault('RESULT_CACHE', 'False')
+
+from .harness import BASELINE_DIR, load_baseline, measure, report, save_baseline
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+DEFAULT_SIZES = '320x240,1280x960,4032x3024'
+BATCH_SIZE = 64
+
+def parse_sizes(value: str) -> List[Tuple[int, int]]:
+    sizes = []
+    for item in value.split(','):
+        width, height = item.lower().split('x')
+        sizes.append((int(width), int(height)))
+    return sizes
+
+def build_cases(sizes: List[Tuple[int, int]], workdir: str) -> Dict[str, Callable[[], object]]:
+    """One zero-argument callable per (stage, image size)"""
+    sys.path.insert(0, str(PROJECT_DIR))
+    import httpx
+    from app.main import app
+    from app.utils.analysis import FruitQualityAnalyzer
+    from app.utils.image_processor import ImageProcessor, cv2, process_image
+    from app.utils.model_registry import registry
+    from tests.create_test_image import create_test_image
+
+    loop = asyncio.new_event_loop()
+    client = httpx.AsyncClient(app=app, base_url='http://bench')
+    analyzer = FruitQualityAnalyzer(registry.get())
+
+    import numpy as np
+    cases = {}
+    histograms = np.random.default_rng(0).random((BATCH_SIZE, 768), dtype=np.float32)
+    cases[f"analyze_batch[{BATCH_SIZE}]"] = lambda: analyzer.analyze_batch(histograms)
+    for width, height in sizes:
+        label = f"{width}x{height}"
+        path = os.path.join(workdir, f"apple_{label}.jpg")
+        with contextlib.redirect_stdout(io.StringIO()):
+            create_test_image(path, size=(width, height), text="Apple")
+        image = cv2.imread(path)
+        resized = ImageProcessor.resize_image(image)
+        processed = process_image(path)
+        with open(path, 'rb') as f:
+            payload = f.read()
+
+        def post(payload=payload):
+            response = loop.run_until_complete(
+                client.post('/analyze', files={'file': ('apple.jpg', payload, 'image/jpeg')})
+            )
+            response.raise_for_status()
+
+        cases.update({
+            f"load_image[{label}]": lambda path=path: ImageProcessor.load_image(path),
+            f"resize_image[{label}]": lambda image=image: ImageProcessor.resize_image(image),
+            f"normalize_image[{label}]": lambda resized=resized: ImageProcessor.normalize_image(resized),
+            f"preprocess_for_model[{label}]": lambda image=image: ImageProcessor.preprocess_for_model(image),
+            f"extract_color_histogram[{label}]": lambda image=image: ImageProcessor.extract_color_histogram(image),
+            f"analyze[{label}]": lambda processed=processed: analyzer.analyze(processed),
+            f"api_analyze[{label}]": post,
+        })
+    return cases
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default=DEFAULT_SIZES, help='Comma-separated WIDTHxHEIGHT list')
+    parser.add_argument('--filter', default='', help='Only run cases whose name contains this')
+    parser.add_argument('--repeat', type=int, default=7, help='Timed rounds per case')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='Allowed slowdown against the baseline, as a fraction')
+    parser.add_argument('--baseline', type=Path, default=BASELINE_DIR / 'pipeline.json',
+                        help='Baseline file to compare with or save to')
+    parser.add_argument('--save-baseline', action='store_true', help='Record these results as the baseline')
+    parser.add_argument('--settings', type=json.loads, help='Runtime settings overrides as JSON')
+    args = parser.parse_args()
+    
+    if args.settings:
+        sys.path.insert(0, str(PROJECT_DIR))
+        from app.utils import settings
+        print(f"Settings: {settings.update(args.settings, persist=False).as_dict()}")
+
+    with tempfile.TemporaryDirectory() as workdir:
+        cases = build_cases(parse_sizes(args.sizes), workdir)
+        results = {}
+        for name, fn in cases.items():
+            if args.filter in name:
+                results[name] = measure(fn, repeat=args.repeat)
+
+    if args.save_baseline:
+        save_baseline(args.baseline, results)
+        report(results, None, args.threshold)
+        print(f"Baseline saved to {args.baseline}")
+        return
+
+    regressed = report(results, load_baseline(args.baseline), args.threshold)
+    if regressed:
+        sys.exit(1)
+
+if __name__ == '__main__':
+    main()
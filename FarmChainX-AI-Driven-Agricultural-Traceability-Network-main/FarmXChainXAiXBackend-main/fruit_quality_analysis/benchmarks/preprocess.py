@@ -0,0 +1,106 @@
+"""
+Preprocessing time and allocations per image.
+
+Compares the allocating chain extract_features used to run (every OpenCV
+call and NumPy op returns a new array) with the buffered Preprocessor,
+both for one image at a time and for a batch written into preallocated
+slots. Time is the median per image; memory is measured with tracemalloc
+over one call, as the peak above the starting point (temporaries included)
+and what is still held afterwards (the outputs). tracemalloc sees NumPy
+and OpenCV-to-NumPy arrays but not OpenCV's internal scratch memory.
+
+Usage:
+    python -m benchmarks.preprocess [--width 640 --height 480] [--batch 32]
+"""
+import argparse
+import tracemalloc
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from app.utils.image_processor import cv2, preprocessor
+from app.utils.settings import current_settings
+from benchmarks.harness import measure
+
+def legacy_features(image: np.ndarray, target_size: Tuple[int, int], bins: int):
+    """extract_features as it was before the buffered engine"""
+    small = cv2.resize(image, target_size, interpolation=cv2.INTER_AREA)
+    rgb = cv2.cvtColor(small, cv2.COLOR_BGR2RGB)
+    processed = np.expand_dims(rgb.astype('float32') / 255.0, axis=0)
+    hsv = cv2.cvtColor(small, cv2.COLOR_BGR2HSV)
+    hist = []
+    for channel in range(3):
+        channel_hist = cv2.calcHist([hsv], [channel], None, [bins], [0, 256])
+        hist.append(cv2.normalize(channel_hist, channel_hist).flatten())
+    return processed, np.hstack(hist)
+
+def legacy_batch(images: List[np.ndarray], target_size: Tuple[int, int], bins: int):
+    """process_images as it was: per-image outputs copied into the batch"""
+    width, height = target_size
+    processed_images = np.empty((len(images), height, width, 3), dtype=np.float32)
+    color_histograms = np.empty((len(images), 3 * bins), dtype=np.float32)
+    for index, image in enumerate(images):
+        processed, hist = legacy_features(image, target_size, bins)
+        processed_images[index] = processed[0]
+        color_histograms[index] = hist
+    return processed_images, color_histograms
+
+def engine_batch(images: List[np.ndarray], target_size: Tuple[int, int], bins: int):
+    width, height = target_size
+    processed_images = np.empty((len(images), height, width, 3), dtype=np.float32)
+    color_histograms = np.empty((len(images), 3 * bins), dtype=np.float32)
+    for index, image in enumerate(images):
+        preprocessor.features(
+            image, target_size, bins,
+            tensor_out=processed_images[index:index + 1], hist_out=color_histograms[index]
+        )
+    return processed_images, color_histograms
+
+def allocations(fn: Callable[[], object]) -> Dict[str, int]:
+    """Peak and retained bytes traced over one call of fn"""
+    fn()  # Scratch buffers are sized on first use
+    tracemalloc.start()
+    try:
+        start, _ = tracemalloc.get_traced_memory()
+        result = fn()
+        retained, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return {'peak': peak - start, 'retained': retained - start}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--width', type=int, default=640, help='Decoded frame width')
+    parser.add_argument('--height', type=int, default=480, help='Decoded frame height')
+    parser.add_argument('--batch', type=int, default=32, help='Images per batch case')
+    args = parser.parse_args()
+
+    settings = current_settings()
+    target_size, bins = settings.target_size, settings.hist_bins
+    rng = np.random.default_rng(0)
+    images = [
+        cv2.GaussianBlur(rng.integers(0, 255, (args.height, args.width, 3), dtype=np.uint8), (9, 9), 0)
+        for _ in range(args.batch)
+    ]
+    image = images[0]
+
+    cases = {
+        'single legacy': (1, lambda: legacy_features(image, target_size, bins)),
+        'single engine': (1, lambda: preprocessor.features(image, target_size, bins)),
+        f'batch[{args.batch}] legacy': (args.batch, lambda: legacy_batch(images, target_size, bins)),
+        f'batch[{args.batch}] engine': (args.batch, lambda: engine_batch(images, target_size, bins)),
+    }
+
+    print(f"{args.width}x{args.height} frames -> {target_size[0]}x{target_size[1]}, {bins} bins")
+    print(f"{'Case':<22} {'us/image':>10} {'peak KB/image':>15} {'kept KB/image':>15}")
+    print("-" * 65)
+    for name, (count, fn) in cases.items():
+        timing = measure(fn)
+        memory = allocations(fn)
+        print(f"{name:<22} {timing['median'] / count * 1e6:>10.1f} "
+              f"{memory['peak'] / count / 1024:>15.1f} {memory['retained'] / count / 1024:>15.1f}")
+    print("-" * 65)
+
+if __name__ == '__main__':
+    main()
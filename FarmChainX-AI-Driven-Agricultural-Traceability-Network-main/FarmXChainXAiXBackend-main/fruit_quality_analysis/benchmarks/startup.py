@@ -0,0 +1,92 @@
+"""
+Startup-time benchmark for the Fruit Quality Analysis API.
+
+Each run happens in a fresh interpreter so import caches do not hide the
+cold-start cost. Reports how long `import app.main` takes, when /health first
+answers, when the background warm-up finishes and the latency of the first
+and second /analyze requests.
+
+Usage:
+    python -m benchmarks.startup [--runs 5]
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+# Runs inside the child interpreter; prints one JSON object
+CHILD_SCRIPT = r"""
+import json, sys, time
+started = time.perf_counter()
+import app.main
+import_seconds = time.perf_counter() - started
+heavy_loaded = {name: name in sys.modules for name in ('cv2', 'tensorflow')}
+
+import numpy as np
+from fastapi.testclient import TestClient
+
+with TestClient(app.main.app) as client:
+    started = time.perf_counter()
+    client.get('/health')
+    first_health = time.perf_counter() - started
+
+    started = time.perf_counter()
+    while not client.get('/health').json()['startup']['ready']:
+        time.sleep(0.005)
+    ready_seconds = time.perf_counter() - started
+
+    from app.utils.image_processor import cv2
+    image = np.random.randint(0, 255, (1080, 1920, 3), dtype=np.uint8)
+    payload = cv2.imencode('.jpg', image)[1].tobytes()
+    latencies = []
+    for attempt in range(2):
+        # Vary a trailing byte so the result cache cannot answer the second request
+        body = payload + bytes([attempt])
+        started = time.perf_counter()
+        response = client.post('/analyze', files={'file': ('bench.jpg', body, 'image/jpeg')})
+        latencies.append(time.perf_counter() - started)
+        assert response.status_code == 200, response.text
+
+print(json.dumps({
+    'import_seconds': import_seconds,
+    'heavy_modules_after_import': heavy_loaded,
+    'first_health_seconds': first_health,
+    'warmup_seconds': ready_seconds,
+    'first_analyze_seconds': latencies[0],
+    'second_analyze_seconds': latencies[1],
+}))
+"""
+
+def run_once() -> dict:
+    """Measure one cold start in a fresh interpreter"""
+    output = subprocess.run(
+        [sys.executable, '-W', 'ignore', '-c', CHILD_SCRIPT],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True,
+        # Benchmark uploads should not fill data/raw
+        env=dict(os.environ, ARCHIVE_UPLOADS='False')
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='Number of cold starts to measure')
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+
+    print(f"Cold start over {args.runs} runs (median, max) in ms")
+    print("-" * 50)
+    for key in ('import_seconds', 'first_health_seconds', 'warmup_seconds',
+                'first_analyze_seconds', 'second_analyze_seconds'):
+        values = [run[key] * 1000 for run in runs]
+        print(f"{key.replace('_seconds', ''):<20} {statistics.median(values):>10.1f} {max(values):>10.1f}")
+    print("-" * 50)
+    print(f"Heavy modules imported by 'import app.main': {runs[0]['heavy_modules_after_import']}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,133 @@
+"""
+Pipeline throughput under different threading settings.
+
+Each setting is WORKERSxEXECUTORxNATIVE: that many worker processes run at
+once (like pre-forked API workers), each pushing images through an
+AnalysisExecutor with EXECUTOR threads while OpenCV and the BLAS/OpenMP
+pools are capped at NATIVE threads. Every worker is a fresh interpreter so
+the environment variables take effect before NumPy loads. Reports the
+combined images per second, so oversubscribed settings show up as lower
+throughput.
+
+By default the grid holds the derived policy (app/utils/threading_policy)
+next to library defaults and deliberately oversubscribed settings.
+
+Usage:
+    python -m benchmarks.threads [--grid 1x8x1,1x8x8,2x4x1] [--duration 10]
+                                 [--width 1920 --height 1080]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from pathlib import Path
+from typing import List, Tuple
+
+PROJECT_DIR = Path(__file__).resolve().parent.parent
+
+CHILD_SCRIPT = r"""
+import asyncio, json, sys, time
+executor_workers, native_threads, width, height = (int(value) for value in sys.argv[1:5])
+duration = float(sys.argv[5])
+
+import numpy as np
+from app.utils.executor import AnalysisExecutor
+from app.utils.image_processor import cv2
+from app.utils.pipeline import run_analysis
+from app.utils.threading_policy import apply_native_threads
+
+apply_native_threads(native_threads)
+rng = np.random.default_rng(0)
+photo = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (9, 9), 0)
+payload = cv2.imencode('.jpg', photo, [cv2.IMWRITE_JPEG_QUALITY, 90])[1].tobytes()
+run_analysis(payload)
+
+async def main():
+    executor = AnalysisExecutor('thread', executor_workers)
+    deadline = time.perf_counter() + duration
+    done = 0
+
+    async def client():
+        nonlocal done
+        while time.perf_counter() < deadline:
+            await executor.run(run_analysis, payload)
+            done += 1
+
+    started = time.perf_counter()
+    # Twice as many callers as threads keeps the executor saturated
+    await asyncio.gather(*(client() for _ in range(2 * executor_workers)))
+    elapsed = time.perf_counter() - started
+    executor.shutdown()
+    return done, elapsed
+
+done, elapsed = asyncio.run(main())
+print(json.dumps({'images': done, 'seconds': elapsed}))
+"""
+
+Setting = Tuple[int, int, int]
+
+def parse_grid(value: str) -> List[Setting]:
+    return [tuple(int(part) for part in item.lower().split('x')) for item in value.split(',')]
+
+def default_grid() -> List[Setting]:
+    """Derived policy for 1 and 2 workers, versus library defaults and oversubscription"""
+    from app.utils.threading_policy import available_cpus, derive_policy
+
+    cpus = available_cpus()
+    grid = []
+    for workers in sorted({1, max(1, cpus // 2)}):
+        policy = derive_policy(cpu_count=cpus, workers=workers)
+        grid.append((workers, policy.executor_workers, policy.native_threads))
+        # Library defaults: every thread of every worker may use every core
+        grid.append((workers, policy.executor_workers, cpus))
+    # One executor thread per core in every worker, the pre-policy default
+    grid.append((max(1, cpus // 2), cpus, cpus))
+    return list(dict.fromkeys(grid))
+
+def run_setting(setting: Setting, width: int, height: int, duration: float) -> float:
+    """Combined images per second of all workers for one setting"""
+    from app.utils.threading_policy import NATIVE_THREAD_VARS
+
+    workers, executor_workers, native_threads = setting
+    env = dict(os.environ, **{var: str(native_threads) for var in NATIVE_THREAD_VARS})
+
+    children = [
+        subprocess.Popen(
+            [sys.executable, '-W', 'ignore', '-c', CHILD_SCRIPT, str(executor_workers), str(native_threads),
+             str(width), str(height), str(duration)],
+            cwd=PROJECT_DIR, env=env, stdout=subprocess.PIPE, text=True
+        )
+        for _ in range(workers)
+    ]
+    throughput = 0.0
+    for child in children:
+        output, _ = child.communicate()
+        if child.returncode != 0:
+            raise SystemExit(f"Benchmark worker failed for setting {setting}")
+        result = json.loads(output.strip().splitlines()[-1])
+        throughput += result['images'] / result['seconds']
+    return throughput
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--grid', help='Comma-separated WORKERSxEXECUTORxNATIVE settings')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds per setting')
+    parser.add_argument('--width', type=int, default=1920, help='Synthetic photo width')
+    parser.add_argument('--height', type=int, default=1080, help='Synthetic photo height')
+    args = parser.parse_args()
+
+    grid = parse_grid(args.grid) if args.grid else default_grid()
+    from app.utils.threading_policy import available_cpus
+
+    print(f"{args.width}x{args.height} JPEG, {available_cpus()} CPUs, {args.duration:g}s per setting")
+    print(f"{'workers':>8} {'executor':>9} {'native':>7} {'threads':>8} {'images/s':>10}")
+    print('-' * 46)
+    for setting in grid:
+        workers, executor_workers, native_threads = setting
+        throughput = run_setting(setting, args.width, args.height, args.duration)
+        total_threads = workers * executor_workers * native_threads
+        print(f"{workers:>8} {executor_workers:>9} {native_threads:>7} {total_threads:>8} {throughput:>10.1f}")
+
+if __name__ == '__main__':
+    main()
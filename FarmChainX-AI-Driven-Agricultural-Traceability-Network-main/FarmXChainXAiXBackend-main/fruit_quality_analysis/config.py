@@ -21,10 +21,114 @@ API_CONFIG = {
     'title': 'Fruit Quality Analysis API',
     'description': 'API for analyzing fruit quality from images',
     'version': '1.0.0',
-    'host': '0.0.0.0',
-    'port': 8000,
-    'reload': True,
-    'workers': 1,
+    'host': os.getenv('API_HOST', '0.0.0.0'),
+    'port': int(os.getenv('API_PORT', 8000)),
+    'reload': os.getenv('API_RELOAD', 'True').lower() in ('1', 'true', 'yes'),  # Development mode only
+    # 'development' (single worker, auto-reload) or 'production' (pre-forked workers)
+    'server_mode': os.getenv('ENVIRONMENT', 'development').lower(),
+    'workers': int(os.getenv('API_WORKERS', 0)) or os.cpu_count() or 1,  # Production worker processes
+    'backlog': int(os.getenv('API_BACKLOG', 2048)),                    # Pending connections on the listen socket
+    'timeout_keep_alive': int(os.getenv('KEEP_ALIVE', 5)),         # Seconds an idle connection is kept
+    'limit_concurrency': int(os.getenv('LIMIT_CONCURRENCY', 0)) or None,  # Per worker; excess gets 503
+    # Load the model in the supervisor before forking so workers share its
+    # memory copy-on-write; disable for frameworks that are not fork-safe
+    'preload_model': os.getenv('PRELOAD_MODEL', 'True').lower() in ('1', 'true', 'yes'),
+    # Pool that runs image decoding and analysis off the event loop:
+    # 'thread' (OpenCV releases the GIL) or 'process'
+    'executor': os.getenv('ANALYSIS_EXECUTOR', 'thread'),
+    'executor_workers': int(os.getenv('ANALYSIS_WORKERS', 0)) or None,  # None = CPU count
+    'max_batch_files': int(os.getenv('MAX_BATCH_FILES', 64)),  # Images per /analyze/batch request
+}
+
+# Native thread pools (OpenCV, OpenMP/BLAS, TensorFlow). None derives them
+# from the CPU count, API workers and executor size so threads ~= cores
+THREADING_CONFIG = {
+    'native_threads': int(os.getenv('NATIVE_THREADS', 0)) or None,         # Per pipeline call
+    'tf_intra_op_threads': int(os.getenv('TF_INTRA_OP_THREADS', 0)) or None,
+    'tf_inter_op_threads': int(os.getenv('TF_INTER_OP_THREADS', 0)) or None,
+}
+
+# Multipart boundary and part headers allowed per file on top of its bytes
+MULTIPART_PART_OVERHEAD = 16 * 1024
+
+# Upload settings
+UPLOAD_CONFIG = {
+    'upload_dir': Path(os.getenv('UPLOAD_FOLDER', RAW_IMAGE_DIR)),
+    # Archive raw uploads to disk in the background; analysis never reads them back
+    'archive_uploads': os.getenv('ARCHIVE_UPLOADS', 'True').lower() in ('1', 'true', 'yes'),
+    'max_upload_size': int(os.getenv('MAX_UPLOAD_SIZE', 10 * 1024 * 1024)),    # Per file, in bytes
+}
+# Whole request body, the limit enforced while the body arrives: the
+# multipart parser spools every file before the per-file checks run, so
+# this is what bounds a request. Derived from the per-file and per-batch
+# limits so it always admits a full batch and nothing more
+UPLOAD_CONFIG['max_request_size'] = API_CONFIG['max_batch_files'] * (
+    UPLOAD_CONFIG['max_upload_size'] + MULTIPART_PART_OVERHEAD
+)
+
+# Raw upload archive in upload_dir: one file per distinct upload, named by
+# its SHA-256 under fan-out directories (ab/cd/<hash>.jpg)
+ARCHIVE_CONFIG = {
+    'fanout': int(os.getenv('ARCHIVE_FANOUT', 2)),  # Directory levels above each file
+    'fsync': os.getenv('ARCHIVE_FSYNC', 'False').lower() in ('1', 'true', 'yes'),
+    # Retention, applied by a background compaction every compact_interval seconds;
+    # 0 disables each limit
+    'retention_days': float(os.getenv('ARCHIVE_RETENTION_DAYS', 0)) or None,  # Since last uploaded
+    'max_bytes': int(os.getenv('ARCHIVE_MAX_BYTES', 0)) or None,              # Oldest files go first
+    'webp_after_days': float(os.getenv('ARCHIVE_WEBP_AFTER_DAYS', 0)) or None,  # Re-encode older files
+    'webp_quality': int(os.getenv('ARCHIVE_WEBP_QUALITY', 90)),
+    'compact_interval': float(os.getenv('ARCHIVE_COMPACT_INTERVAL', 3600)),
+}
+
+# Result cache settings (keyed by a hash of the upload bytes)
+CACHE_CONFIG = {
+    'enabled': os.getenv('RESULT_CACHE', 'True').lower() in ('1', 'true', 'yes'),
+    'max_entries': int(os.getenv('RESULT_CACHE_MAX_ENTRIES', 10000)),
+    'max_bytes': int(os.getenv('RESULT_CACHE_MAX_BYTES', 32 * 1024 * 1024)),
+    'ttl_seconds': float(os.getenv('RESULT_CACHE_TTL', 3600)),
+    'disk_path': os.getenv('RESULT_CACHE_PATH') or None,  # SQLite file that survives restarts
+}
+
+# Results store: every AnalysisResult is queued and written in batches
+RESULTS_CONFIG = {
+    'enabled': os.getenv('RESULTS_STORE', 'True').lower() in ('1', 'true', 'yes'),
+    # Any SQLAlchemy URL; SQLite in the data directory by default
+    'url': os.getenv('DATABASE_URL') or f"sqlite:///{DATA_DIR / 'results.sqlite'}",
+    'echo': os.getenv('DATABASE_ECHO', 'False').lower() in ('1', 'true', 'yes'),
+    'pool_size': int(os.getenv('DATABASE_POOL_SIZE', 5)),
+    'max_overflow': int(os.getenv('DATABASE_MAX_OVERFLOW', 10)),
+    # Results waiting to be written; when full, new results are dropped (and counted)
+    'queue_size': int(os.getenv('RESULTS_QUEUE_SIZE', 10000)),
+    # A batch is written when it has this many rows or its oldest row is this old
+    'batch_size': int(os.getenv('RESULTS_BATCH_SIZE', 500)),
+    'flush_interval_ms': float(os.getenv('RESULTS_FLUSH_INTERVAL_MS', 1000)),
+    # Run the alembic migrations on startup
+    'auto_migrate': os.getenv('RESULTS_AUTO_MIGRATE', 'True').lower() in ('1', 'true', 'yes'),
+    # Required (as X-Results-Token) by /results, which is refused to everyone
+    # while it is unset; defaults to the admin token
+    'api_token': os.getenv('RESULTS_API_TOKEN') or os.getenv('ADMIN_TOKEN') or None,
+}
+
+# Metrics settings (Prometheus text format at /metrics)
+METRICS_CONFIG = {
+    # Disabled, stage timing and counters are skipped entirely
+    'enabled': os.getenv('METRICS_ENABLED', 'True').lower() in ('1', 'true', 'yes'),
+    # Directory pre-forked workers share their values through, so any worker
+    # answers /metrics for all; production mode uses a temporary one if unset
+    'multiprocess_dir': os.getenv('METRICS_MULTIPROC_DIR') or None,
+    # Seconds between a worker's snapshots
+    'sync_interval': float(os.getenv('METRICS_SYNC_INTERVAL', 1.0)),
+}
+
+# Profiling settings (cProfile of the analysis pipeline, slowest requests kept)
+PROFILING_CONFIG = {
+    # 'off', 'header' (requests sending the header below) or 'always'
+    'mode': os.getenv('PROFILING', 'off').lower(),
+    'header': 'x-profile',
+    'keep_slowest': int(os.getenv('PROFILING_KEEP_SLOWEST', 20)),
+    # Required by /admin and by header-gated profiling; those are refused
+    # to everyone while it is unset
+    'admin_token': os.getenv('ADMIN_TOKEN') or None,
 }
 
 # Image processing settings
@@ -33,6 +137,7 @@ IMAGE_PROCESSING = {
     'color_space': 'RGB',       # Color space for processing
     'normalize': True,          # Whether to normalize pixel values
     'hist_bins': 256,           # Number of bins for color histogram
+    'reduced_decode': True,     # Decode large JPEGs at 1/2, 1/4 or 1/8 scale when still >= target_size
 }
 
 # Analysis settings
@@ -43,9 +148,22 @@ ANALYSIS_CONFIG = {
         'defects': 0.3,
     },
     'ripeness_thresholds': {
-        'underripe': 40,
-        'optimal': 70,
-        'overripe': 90,
+        'underripe': 40,  # Below this: "not yet ripe"
+        'optimal': 60,    # Shelf life is longest here
+        'overripe': 80,   # Above this: "fully ripe"
+    },
+    # Weighted score (0-100) behind the overall condition
+    'condition_weights': {
+        'freshness': 0.4,
+        'ripeness': 0.3,
+        'shelf_life': 0.3,
+    },
+    # Lowest score for each condition; anything below 'poor' is spoiled
+    'condition_thresholds': {
+        'poor': 25,
+        'fair': 50,
+        'good': 75,
+        'excellent': 90,
     },
     'shelf_life_factors': {
         'freshness': 0.6,
@@ -53,12 +171,24 @@ ANALYSIS_CONFIG = {
     },
 }
 
+# Runtime settings: target_size, hist_bins, reduced_decode and the condition
+# and ripeness settings above can be changed without a restart, through
+# PUT /admin/settings or by editing this JSON file and sending SIGHUP
+SETTINGS_CONFIG = {
+    'overrides_path': os.getenv('SETTINGS_OVERRIDES_PATH') or None,
+}
+
 # Model settings (for future implementation)
 MODEL_CONFIG = {
-    'model_path': None,  # Path to pre-trained model
+    'model_path': os.getenv('MODEL_PATH') or None,  # Path to pre-trained model (Keras/SavedModel/TFLite/ONNX)
+    # keras, savedmodel, tflite, onnx, or auto (by file extension)
+    'backend': os.getenv('MODEL_BACKEND', 'auto'),
     'input_shape': (224, 224, 3),
     'num_classes': len(['apple', 'banana', 'orange', 'mango', 'grapes', 'strawberry']),
-    'confidence_threshold': 0.7,
+    'confidence_threshold': float(os.getenv('CONFIDENCE_THRESHOLD', 0.7)),
+    # Dynamic micro-batching of concurrent /analyze requests; 1 disables it
+    'max_batch_size': int(os.getenv('MODEL_MAX_BATCH_SIZE', 1)),
+    'batch_timeout_ms': float(os.getenv('MODEL_BATCH_TIMEOUT_MS', 5)),
 }
 
 # Logging configuration
@@ -0,0 +1,58 @@
+"""
+Alembic environment for the results database.
+
+Run from the command line (alembic upgrade head), the URL comes from
+config.RESULTS_CONFIG. The results store runs the migrations in-process
+and passes its own connection in config.attributes['connection'].
+"""
+from logging.config import fileConfig
+
+from alembic import context
+from sqlalchemy import engine_from_config, pool
+
+from app.models.records import metadata
+from config import RESULTS_CONFIG
+
+config = context.config
+target_metadata = metadata
+
+def configure(connection) -> None:
+    context.configure(
+        connection=connection,
+        target_metadata=target_metadata,
+        # SQLite cannot ALTER most things; batch mode recreates the table instead
+        render_as_batch=connection.dialect.name == 'sqlite',
+    )
+
+def run_migrations_offline() -> None:
+    """Emit the SQL instead of running it (alembic upgrade head --sql)"""
+    context.configure(
+        url=config.get_main_option('sqlalchemy.url') or RESULTS_CONFIG['url'],
+        target_metadata=target_metadata,
+        literal_binds=True,
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+def run_migrations_online() -> None:
+    connection = config.attributes.get('connection')
+    if connection is not None:
+        configure(connection)
+        with context.begin_transaction():
+            context.run_migrations()
+        return
+
+    if config.config_file_name is not None:
+        fileConfig(config.config_file_name)
+    section = config.get_section(config.config_ini_section, {})
+    section.setdefault('sqlalchemy.url', RESULTS_CONFIG['url'])
+    engine = engine_from_config(section, prefix='sqlalchemy.', poolclass=pool.NullPool)
+    with engine.connect() as connection:
+        configure(connection)
+        with context.begin_transaction():
+            context.run_migrations()
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
@@ -0,0 +1,42 @@
+"""Create analysis_results
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-18
+"""
+from alembic import op
+import sqlalchemy as sa
+
+revision = '0001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+def upgrade() -> None:
+    op.create_table(
+        'analysis_results',
+        sa.Column('id', sa.Integer, primary_key=True, autoincrement=True),
+        sa.Column('created_at', sa.DateTime(timezone=True), nullable=False),
+        sa.Column('endpoint', sa.String(32), nullable=False),
+        sa.Column('filename', sa.String(255)),
+        sa.Column('upload_bytes', sa.Integer),
+        sa.Column('cached', sa.Boolean, nullable=False),
+        sa.Column('fruit_type', sa.String(32), nullable=False),
+        sa.Column('overall_condition', sa.String(32), nullable=False),
+        sa.Column('confidence', sa.Float, nullable=False),
+        sa.Column('freshness', sa.Float, nullable=False),
+        sa.Column('ripeness', sa.Float, nullable=False),
+        sa.Column('shelf_life_days', sa.Integer, nullable=False),
+        sa.Column('recommendations', sa.JSON, nullable=False),
+        sa.Column('analyzer_version', sa.String(32), nullable=False),
+        sa.Column('settings_fingerprint', sa.String(32)),
+    )
+    op.create_index('ix_analysis_results_created_at', 'analysis_results', ['created_at'])
+    op.create_index('ix_analysis_results_fruit_type', 'analysis_results', ['fruit_type'])
+    op.create_index('ix_analysis_results_overall_condition', 'analysis_results', ['overall_condition'])
+
+def downgrade() -> None:
+    op.drop_index('ix_analysis_results_overall_condition', 'analysis_results')
+    op.drop_index('ix_analysis_results_fruit_type', 'analysis_results')
+    op.drop_index('ix_analysis_results_created_at', 'analysis_results')
+    op.drop_table('analysis_results')
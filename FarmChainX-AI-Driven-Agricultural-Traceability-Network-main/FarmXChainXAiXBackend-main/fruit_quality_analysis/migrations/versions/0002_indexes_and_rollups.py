@@ -0,0 +1,114 @@
+"""Add lots, composite indexes and hourly/daily rollups
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-18
+"""
+from datetime import timezone
+
+from alembic import context, op
+import sqlalchemy as sa
+
+revision = '0002'
+down_revision = '0001'
+branch_labels = None
+depends_on = None
+
+SHELF_LIFE_COLUMNS = ('shelf_life_0_2', 'shelf_life_3_4', 'shelf_life_5_7', 'shelf_life_8_14', 'shelf_life_15_plus')
+# Highest day of each shelf-life column but the last
+SHELF_LIFE_LIMITS = (2, 4, 7, 14)
+MEASURES = ('results', 'freshness_sum', 'ripeness_sum', 'shelf_life_sum', *SHELF_LIFE_COLUMNS)
+
+def create_rollup_table(name: str) -> None:
+    op.create_table(
+        name,
+        sa.Column('bucket_start', sa.DateTime(timezone=True), primary_key=True),
+        sa.Column('fruit_type', sa.String(32), primary_key=True),
+        sa.Column('overall_condition', sa.String(32), primary_key=True),
+        sa.Column('lot', sa.String(64), primary_key=True),
+        sa.Column('results', sa.Integer, nullable=False),
+        sa.Column('freshness_sum', sa.Float, nullable=False),
+        sa.Column('ripeness_sum', sa.Float, nullable=False),
+        sa.Column('shelf_life_sum', sa.Integer, nullable=False),
+        *(sa.Column(column, sa.Integer, nullable=False) for column in SHELF_LIFE_COLUMNS),
+    )
+    op.create_index(f'ix_{name}_fruit_type_bucket_start', name, ['fruit_type', 'bucket_start'])
+    op.create_index(f'ix_{name}_lot_bucket_start', name, ['lot', 'bucket_start'])
+
+def backfill_rollups(connection) -> None:
+    """
+    Roll up the results stored before this migration
+
+    A frozen copy of the rollup rules as of this revision (UTC hour and day
+    buckets, cache hits left out), so later changes to app code cannot
+    change what this migration does. The tables were just created, so
+    plain inserts are enough.
+    """
+    results = sa.table(
+        'analysis_results',
+        sa.column('created_at', sa.DateTime(timezone=True)), sa.column('cached', sa.Boolean),
+        sa.column('fruit_type', sa.String), sa.column('overall_condition', sa.String),
+        sa.column('lot', sa.String), sa.column('freshness', sa.Float), sa.column('ripeness', sa.Float),
+        sa.column('shelf_life_days', sa.Integer),
+    )
+    totals = {'analysis_rollups_hourly': {}, 'analysis_rollups_daily': {}}
+    rows = connection.execute(sa.select(results).where(results.c.cached.is_(False))).mappings()
+    while True:
+        chunk = rows.fetchmany(10000)
+        if not chunk:
+            break
+        for row in chunk:
+            created_at = row['created_at']
+            if created_at.tzinfo is None:
+                created_at = created_at.replace(tzinfo=timezone.utc)
+            hour = created_at.astimezone(timezone.utc).replace(minute=0, second=0, microsecond=0)
+            shelf_life = int(row['shelf_life_days'])
+            column = next((name for name, limit in zip(SHELF_LIFE_COLUMNS, SHELF_LIFE_LIMITS) if shelf_life <= limit),
+                          SHELF_LIFE_COLUMNS[-1])
+            for name, bucket in (('analysis_rollups_hourly', hour), ('analysis_rollups_daily', hour.replace(hour=0))):
+                key = (bucket, row['fruit_type'], row['overall_condition'], row['lot'] or '')
+                measures = totals[name].setdefault(key, dict.fromkeys(MEASURES, 0))
+                measures['results'] += 1
+                measures['freshness_sum'] += row['freshness']
+                measures['ripeness_sum'] += row['ripeness']
+                measures['shelf_life_sum'] += shelf_life
+                measures[column] += 1
+
+    keys = ('bucket_start', 'fruit_type', 'overall_condition', 'lot')
+    for name, buckets in totals.items():
+        if buckets:
+            table = sa.table(
+                name, sa.column('bucket_start', sa.DateTime(timezone=True)),
+                *(sa.column(key) for key in keys[1:]), *(sa.column(measure) for measure in MEASURES)
+            )
+            connection.execute(table.insert(), [dict(zip(keys, key), **measures) for key, measures in buckets.items()])
+
+def upgrade() -> None:
+    with op.batch_alter_table('analysis_results') as batch:
+        batch.add_column(sa.Column('lot', sa.String(64)))
+        # Superseded by the composite indexes, which start with the same column
+        batch.drop_index('ix_analysis_results_fruit_type')
+        batch.drop_index('ix_analysis_results_overall_condition')
+        batch.create_index('ix_analysis_results_fruit_type_created_at', ['fruit_type', 'created_at'])
+        batch.create_index('ix_analysis_results_overall_condition_created_at', ['overall_condition', 'created_at'])
+        batch.create_index('ix_analysis_results_lot_created_at', ['lot', 'created_at'])
+
+    create_rollup_table('analysis_rollups_hourly')
+    create_rollup_table('analysis_rollups_daily')
+
+    if not context.is_offline_mode():
+        backfill_rollups(op.get_bind())
+
+def downgrade() -> None:
+    for name in ('analysis_rollups_daily', 'analysis_rollups_hourly'):
+        op.drop_index(f'ix_{name}_lot_bucket_start', name)
+        op.drop_index(f'ix_{name}_fruit_type_bucket_start', name)
+        op.drop_table(name)
+
+    with op.batch_alter_table('analysis_results') as batch:
+        batch.drop_index('ix_analysis_results_lot_created_at')
+        batch.drop_index('ix_analysis_results_overall_condition_created_at')
+        batch.drop_index('ix_analysis_results_fruit_type_created_at')
+        batch.create_index('ix_analysis_results_fruit_type', ['fruit_type'])
+        batch.create_index('ix_analysis_results_overall_condition', ['overall_condition'])
+        batch.drop_column('lot')
@@ -2,20 +2,24 @@
 Run the Fruit Quality Analysis API.
 
 This script starts the FastAPI server for the fruit quality analysis application.
+
+Usage:
+    python run.py          # development: single worker with auto-reload
+    python run.py --prod   # production: pre-forked workers (or ENVIRONMENT=production)
 """
-import uvicorn
+import argparse
 import os
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Run the Fruit Quality Analysis API")
+    parser.add_argument("--prod", action="store_true", default=None,
+                        help="Production mode: API_WORKERS pre-forked workers, no reload")
+    args = parser.parse_args()
+    
     # Create data directories if they don't exist
     os.makedirs("data/raw", exist_ok=True)
     os.makedirs("data/processed", exist_ok=True)
     
-    # Start the FastAPI server
-    uvicorn.run(
-        "app.main:app",
-        host="0.0.0.0",
-        port=8000,
-        reload=True,
-        workers=1
-    )
+    # Imported after argument parsing so --help stays fast
+    from app.server import main
+    main(production=args.prod)
@@ -43,6 +43,7 @@ def test_health_check():
     assert "status" in data
     assert data["status"] == "healthy"
     assert "timestamp" in data
+    assert data["executor"]["in_flight"] >= 0
 
 def test_analyze_endpoint():
     """Test the analyze endpoint with a valid image."""
@@ -73,6 +74,51 @@ def test_analyze_endpoint():
             assert isinstance(data["recommendations"], list)
             assert len(data["recommendations"]) > 0
 
+def test_analyze_repeated_upload_is_cached():
+    """Test that re-uploading the same image is served from the result cache."""
+    from app.main import result_cache
+    
+    with open(TEST_IMAGES[1], "rb") as img:
+        contents = img.read()
+    
+    first = client.post("/analyze", files={"file": ("a.jpg", contents, "image/jpeg")})
+    hits_before = result_cache.stats()['hits']
+    second = client.post("/analyze", files={"file": ("b.jpg", contents, "image/jpeg")})
+    
+    assert first.status_code == second.status_code == 200
+    assert first.json() == second.json()
+    assert result_cache.stats()['hits'] == hits_before + 1
+
+def test_analyze_batch_endpoint():
+    """Test the batch analyze endpoint with several images."""
+    files = [("files", (Path(path).name, open(path, "rb"), "image/jpeg")) for path in TEST_IMAGES]
+    try:
+        response = client.post("/analyze/batch", files=files)
+    finally:
+        for _, (_, handle, _) in files:
+            handle.close()
+    
+    assert response.status_code == 200
+    data = response.json()
+    assert isinstance(data, list)
+    assert len(data) == len(TEST_IMAGES)
+    for result in data:
+        assert "fruit_type" in result
+        assert "overall_condition" in result
+        assert len(result["recommendations"]) > 0
+
+def test_analyze_batch_invalid_file():
+    """Test the batch analyze endpoint when one file is not an image."""
+    with open(TEST_IMAGES[0], "rb") as img:
+        files = [
+            ("files", ("apple.jpg", img, "image/jpeg")),
+            ("files", ("notes.txt", b"This is not an image", "text/plain")),
+        ]
+        response = client.post("/analyze/batch", files=files)
+    
+    assert response.status_code == 400
+    assert "must be an image" in response.json()["detail"].lower()
+
 def test_analyze_invalid_file():
     """Test the analyze endpoint with an invalid file."""
     # Create a temporary text file
@@ -93,6 +139,43 @@ def test_analyze_invalid_file():
     if test_file.exists():
         test_file.unlink()
 
+def test_analyze_corrupt_image():
+    """Test the analyze endpoint with a JPEG header followed by garbage."""
+    files = {"file": ("test.jpg", b"\xff\xd8\xff\xe0" + b"not really a jpeg", "image/jpeg")}
+    response = client.post("/analyze", files=files)
+    
+    assert response.status_code == 400
+    data = response.json()
+    assert "detail" in data
+    assert "decode" in data["detail"].lower()
+
+def test_analyze_sniffs_content_not_content_type():
+    """Test that a real image is accepted even with a generic content type."""
+    with open(TEST_IMAGES[0], "rb") as img:
+        files = {"file": ("upload.bin", img, "application/octet-stream")}
+        response = client.post("/analyze", files=files)
+    
+    assert response.status_code == 200
+
+def test_analyze_disguised_non_image():
+    """Test that a non-image is rejected even when labelled as a JPEG."""
+    files = {"file": ("evil.jpg", b"MZ\x90\x00 definitely an executable", "image/jpeg")}
+    response = client.post("/analyze", files=files)
+    
+    assert response.status_code == 400
+    assert "must be an image" in response.json()["detail"].lower()
+
+def test_analyze_oversized_file(monkeypatch):
+    """Test that uploads over the per-file limit get a 413."""
+    from config import UPLOAD_CONFIG
+    monkeypatch.setitem(UPLOAD_CONFIG, "max_upload_size", 1024)
+    
+    with open(TEST_IMAGES[0], "rb") as img:
+        files = {"file": ("apple.jpg", img, "image/jpeg")}
+        response = client.post("/analyze", files=files)
+    
+    assert response.status_code == 413
+
 def test_analyze_no_file():
     """Test the analyze endpoint with no file provided."""
     response = client.post("/analyze")
@@ -0,0 +1,181 @@
+"""
+Tests for the content-addressed upload archive.
+"""
+import hashlib
+import os
+import time
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app import main
+from app.utils import archive as archive_module
+from app.utils.archive import UploadArchive
+
+DAY = 86400
+
+def encode(seed, extension='.png', size=(64, 64)):
+    image = np.random.default_rng(seed).integers(0, 255, (*size, 3), dtype=np.uint8)
+    return cv2.imencode(extension, image)[1].tobytes()
+
+def archived_files(archive):
+    return sorted(entry.path for entry in archive._scan() if not entry.name.startswith('.'))
+
+def age(path, days, now):
+    os.utime(path, (now - days * DAY, now - days * DAY))
+
+def test_store_is_content_addressed_and_deduplicated(tmp_path):
+    """Test the fan-out layout, deduplication and that no temporary files remain."""
+    archive = UploadArchive(tmp_path)
+    data = encode(0)
+    digest = hashlib.sha256(data).hexdigest()
+
+    path, written = archive.store(data)
+    assert written
+    assert path == tmp_path / digest[:2] / digest[2:4] / f"{digest}.png"
+    assert path.read_bytes() == data
+    assert archive.store(bytearray(data)) == (path, False)
+
+    archive.store(encode(1, '.jpg'))
+    assert [os.path.splitext(p)[1] for p in archived_files(archive)].count('.jpg') == 1
+    assert not [name for _, _, names in os.walk(tmp_path) for name in names if name.endswith('.tmp')]
+
+    stats = archive.stats()
+    assert (stats['stored'], stats['deduplicated']) == (2, 1)
+    assert stats['bytes_deduplicated'] == len(data)
+
+def test_failed_write_leaves_no_partial_file(tmp_path, monkeypatch):
+    """Test that an error before the rename leaves neither the file nor its temporary."""
+    archive = UploadArchive(tmp_path)
+    monkeypatch.setattr(archive_module.os, 'replace', lambda *args: (_ for _ in ()).throw(OSError("disk full")))
+    with pytest.raises(OSError):
+        archive.store(encode(0))
+    assert [name for _, _, names in os.walk(tmp_path) for name in names] == []
+    assert archive.stats()['write_errors'] == 1
+
+def test_retention_expires_old_files(tmp_path):
+    """Test age-based retention, counted from the last upload of an image."""
+    archive = UploadArchive(tmp_path, retention_days=30)
+    now = time.time()
+    old, recent, reuploaded = (archive.store(encode(seed))[0] for seed in range(3))
+    for path in (old, reuploaded):
+        age(path, 40, now)
+    archive.store(encode(2))
+
+    run = archive.compact(now)
+    assert run['expired'] == 1 and run['bytes_reclaimed'] > 0
+    assert not old.exists() and recent.exists() and reuploaded.exists()
+    assert archive.stats()['files'] == 2
+
+def test_size_limit_evicts_oldest(tmp_path):
+    """Test that the oldest hours are evicted until the archive fits."""
+    now = time.time()
+    archive = UploadArchive(tmp_path)
+    paths = [archive.store(encode(seed))[0] for seed in range(4)]
+    for days, path in zip((4, 3, 2, 1), paths):
+        age(path, days, now)
+    size = paths[0].stat().st_size
+    archive.max_bytes = 2 * size
+
+    run = archive.compact(now)
+    assert run['evicted'] == 2 and run['bytes'] <= archive.max_bytes
+    assert [path.exists() for path in paths] == [False, False, True, True]
+
+def test_size_limit_trims_fresh_uploads_to_fit(tmp_path):
+    """Test that going just over the limit within the current hour evicts only the oldest file."""
+    now = time.time()
+    archive = UploadArchive(tmp_path)
+    paths = [archive.store(encode(seed))[0] for seed in range(4)]
+    for seconds, path in zip((40, 30, 20, 10), paths):
+        os.utime(path, (now - seconds, now - seconds))
+    archive.max_bytes = sum(path.stat().st_size for path in paths) - 1
+
+    # Files newer than the start of the run are never evicted
+    assert archive.compact(now - 60)['evicted'] == 0
+    run = archive.compact(now)
+    assert run['evicted'] == 1 and run['bytes'] <= archive.max_bytes
+    assert [path.exists() for path in paths] == [False, True, True, True]
+
+def test_reencode_to_webp_keeps_deduplicating(tmp_path):
+    """Test that old files are re-encoded to WebP under the original hash."""
+    if not cv2.haveImageWriter('.webp'):
+        pytest.skip("OpenCV built without WebP")
+    now = time.time()
+    archive = UploadArchive(tmp_path, webp_after_days=7, webp_quality=80)
+    # A smooth image compresses far better as lossy WebP than as PNG
+    data = cv2.imencode('.png', np.tile(np.arange(256, dtype=np.uint8), (256, 1)))[1].tobytes()
+    path, _ = archive.store(data)
+    age(path, 10, now)
+
+    run = archive.compact(now)
+    webp = path.with_suffix('.webp')
+    assert run['reencoded'] == 1 and run['bytes_reclaimed'] > 0
+    assert not path.exists() and webp.exists()
+    assert cv2.imread(str(webp)) is not None
+    assert abs(webp.stat().st_mtime - (now - 10 * DAY)) < 1
+    assert archive.store(data) == (webp, False)
+
+def test_incompressible_files_are_bounded(tmp_path, monkeypatch):
+    """Test that files not worth re-encoding are remembered only while present, up to a limit."""
+    monkeypatch.setattr(archive_module, '_INCOMPRESSIBLE_LIMIT', 2)
+    now = time.time()
+    archive = UploadArchive(tmp_path, webp_after_days=7)
+    # Not images, so they never decode and are never re-encoded
+    paths = [archive.store(f"not an image {seed}".encode())[0] for seed in range(3)]
+    for path in paths:
+        age(path, 10, now)
+
+    assert archive.compact(now)['reencoded'] == 0
+    assert len(archive._incompressible) == 2
+    archive.compact(now)
+    assert len(archive._incompressible) == 2
+
+    paths[0].unlink()
+    paths[1].unlink()
+    archive.compact(now)
+    assert list(archive._incompressible) == [str(paths[2])]
+
+def test_flat_files_are_adopted(tmp_path):
+    """Test that uploads from the flat uuid layout move into the sharded one, and nothing else does."""
+    data = encode(0, '.jpg')
+    (tmp_path / 'a7c1e0a2-5b3d-4e6f-8a9b-0c1d2e3f4a5b.jpg').write_bytes(data)
+    (tmp_path / 'b7c1e0a2-5b3d-4e6f-9a9b-0c1d2e3f4a5b.JPEG').write_bytes(data)
+    (tmp_path / '.gitkeep').write_bytes(b'')
+    (tmp_path / 'README.md').write_bytes(b'Raw uploads')
+    (tmp_path / 'a7c1e0a2-5b3d-4e6f-8a9b-0c1d2e3f4a5b.log').write_bytes(b'')
+    archive = UploadArchive(tmp_path)
+
+    run = archive.compact()
+    digest = hashlib.sha256(data).hexdigest()
+    assert run['adopted'] == 2 and run['files'] == 1
+    assert sorted(os.listdir(tmp_path)) == sorted(['.compact.lock', '.gitkeep', 'README.md',
+                                                   'a7c1e0a2-5b3d-4e6f-8a9b-0c1d2e3f4a5b.log', digest[:2]])
+    assert archive.path_for(digest, 'jpg').read_bytes() == data
+
+def test_one_compaction_at_a_time(tmp_path):
+    """Test that a second compactor skips its run while the lock is held."""
+    if archive_module.fcntl is None:
+        pytest.skip("No fcntl")
+    first = UploadArchive(tmp_path)
+    second = UploadArchive(tmp_path)
+    lock = first._try_lock()
+    try:
+        assert second.compact() is None
+    finally:
+        lock.close()
+    assert second.compact() is not None
+
+def test_analyze_archives_upload(tmp_path, monkeypatch):
+    """Test that uploads are archived once however often they are sent."""
+    archive = UploadArchive(tmp_path)
+    monkeypatch.setattr(main, 'archive', archive)
+    client = TestClient(main.app)
+    data = encode(3)
+
+    # The file name plays no part in where the upload is stored
+    assert client.post("/analyze", files={"file": ("../../fruit.png", data, "image/png")}).status_code == 200
+    response = client.post("/analyze/batch", files=[("files", ("a.png", data, "image/png")),
+                                                    ("files", ("b.png", data, "image/png"))])
+    assert response.status_code == 200
+    assert len(archived_files(archive)) == 1
+    assert client.get("/health").json()["archive"]["deduplicated"] == 2
@@ -0,0 +1,97 @@
+"""
+Tests for the request micro-batcher.
+"""
+import asyncio
+import numpy as np
+import pytest
+from app.utils.batcher import MicroBatcher
+from app.utils.executor import AnalysisExecutor
+
+
+def double_all(items):
+    return [item * 2 for item in items]
+
+
+def test_batches_fill_up_to_max_size():
+    """Test that concurrent submissions are coalesced into full batches."""
+    calls = []
+    
+    def process(items):
+        calls.append(list(items))
+        return double_all(items)
+    
+    batcher = MicroBatcher(process, max_batch_size=4, max_wait_ms=50)
+    
+    async def submit_all():
+        return await asyncio.gather(*(batcher.submit(i) for i in range(8)))
+    
+    results = asyncio.run(submit_all())
+    
+    assert results == [i * 2 for i in range(8)]
+    assert calls == [[0, 1, 2, 3], [4, 5, 6, 7]]
+    assert batcher.stats()['batches'] == 2
+    assert batcher.stats()['avg_batch_size'] == 4
+
+
+def test_partial_batch_flushes_after_timeout():
+    """Test that a lone request is not held longer than max_wait_ms."""
+    batcher = MicroBatcher(double_all, max_batch_size=16, max_wait_ms=5)
+    
+    async def submit_one():
+        return await asyncio.wait_for(batcher.submit(21), timeout=1.0)
+    
+    assert asyncio.run(submit_one()) == 42
+    assert batcher.stats()['largest_batch'] == 1
+    assert batcher.stats()['queued'] == 0
+
+
+def test_errors_reach_every_waiter():
+    """Test that a failing batch fails all requests in it."""
+    def explode(items):
+        raise RuntimeError("inference failed")
+    
+    batcher = MicroBatcher(explode, max_batch_size=2, max_wait_ms=5)
+    
+    async def submit_all():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2), return_exceptions=True)
+    
+    results = asyncio.run(submit_all())
+    assert all(isinstance(result, RuntimeError) for result in results)
+
+
+def test_runs_on_executor():
+    """Test batches run on the analysis executor when one is given."""
+    executor = AnalysisExecutor(kind="thread", max_workers=1)
+    batcher = MicroBatcher(double_all, max_batch_size=2, max_wait_ms=5, executor=executor)
+    
+    async def submit_all():
+        return await asyncio.gather(batcher.submit(1), batcher.submit(2))
+    
+    try:
+        assert asyncio.run(submit_all()) == [2, 4]
+    finally:
+        executor.shutdown()
+    assert executor.stats()['completed'] == 1
+
+
+def test_analyze_processed_batch():
+    """Test coalescing separately processed images into one analysis batch."""
+    from app.utils.pipeline import analyze_processed_batch
+    from app.utils.image_processor import ProcessedImage
+    
+    image_datas = [
+        ProcessedImage(
+            np.random.random((1, 224, 224, 3)).astype('float32'),
+            np.random.random(768).astype('float32')
+        )
+        for _ in range(3)
+    ]
+    
+    results = analyze_processed_batch(image_datas)
+    assert len(results) == 3
+
+
+def test_invalid_batch_size():
+    """Test that a batch size below one is rejected."""
+    with pytest.raises(ValueError):
+        MicroBatcher(double_all, max_batch_size=0)
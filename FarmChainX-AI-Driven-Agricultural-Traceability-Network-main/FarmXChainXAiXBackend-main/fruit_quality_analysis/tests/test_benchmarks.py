@@ -0,0 +1,52 @@
+"""
+Tests for the benchmark timing and baseline helpers.
+"""
+from benchmarks.harness import compare, load_baseline, measure, save_baseline
+
+
+def test_measure_reports_per_call_time():
+    """Test that timings are per call and rounds are calibrated."""
+    calls = []
+    result = measure(lambda: calls.append(1), min_round_time=0.001, repeat=3)
+    
+    assert result['rounds'] == 3
+    assert result['number'] >= 1
+    assert 0 < result['min'] <= result['median']
+    assert len(calls) >= 1 + 3 * result['number']
+
+
+def test_baseline_roundtrip_and_regressions(tmp_path):
+    """Test saving, merging and comparing against a baseline."""
+    path = tmp_path / "baseline.json"
+    save_baseline(path, {"resize": {"median": 1.0}, "decode": {"median": 2.0}})
+    save_baseline(path, {"resize": {"median": 0.5}})
+    
+    baseline = load_baseline(path)
+    assert baseline['medians'] == {"resize": 0.5, "decode": 2.0}
+    
+    rows = {row['name']: row for row in compare(
+        {"resize": {"median": 0.6}, "decode": {"median": 3.0}, "new": {"median": 1.0}},
+        baseline, threshold=0.25
+    )}
+    assert not rows["resize"]['regressed']
+    assert rows["decode"]['regressed']
+    assert rows["new"]['baseline'] is None and not rows["new"]['regressed']
+    assert load_baseline(tmp_path / "missing.json") is None
+
+
+def test_load_summary_percentiles_and_errors():
+    """Test latency percentiles, throughput and error rate of a load run."""
+    from collections import Counter
+    from benchmarks.load import percentile, summarize
+    
+    latencies = [i / 1000 for i in range(1, 101)]  # 1..100 ms
+    assert percentile(latencies, 0.5) == 0.05
+    assert percentile(latencies, 0.99) == 0.099
+    assert percentile([], 0.5) == 0.0
+    
+    summary = summarize(latencies, Counter({200: 95, 500: 3, 'ReadTimeout': 2}), elapsed=10.0)
+    assert summary['requests'] == 100
+    assert summary['throughput_rps'] == 9.5
+    assert summary['error_rate'] == 0.05
+    assert summary['latency_ms']['p95'] == 95.0
+    assert summary['statuses'] == {'200': 95, '500': 3, 'ReadTimeout': 2}
@@ -0,0 +1,136 @@
+"""
+Tests for the content-hash result cache.
+"""
+import time
+from app.utils.cache import ResultCache
+from app.models.fruit_analysis import AnalysisResult, FruitType, ConditionLevel
+
+
+def make_result(freshness=90.0):
+    return AnalysisResult(
+        fruit_type=FruitType.APPLE,
+        confidence=95.0,
+        freshness=freshness,
+        ripeness=60.0,
+        shelf_life_days=10,
+        overall_condition=ConditionLevel.GOOD,
+        recommendations=["Refrigerate to extend shelf life"]
+    )
+
+
+def test_hit_and_miss():
+    """Test that a stored result is returned for the same bytes only."""
+    cache = ResultCache()
+    key = cache.key(b"image bytes")
+    
+    assert cache.get(key) is None
+    cache.put(key, make_result())
+    
+    assert cache.get(key) == make_result()
+    assert cache.get(cache.key(b"other bytes")) is None
+    stats = cache.stats()
+    assert stats['hits'] == 1
+    assert stats['misses'] == 2
+
+
+def test_lru_eviction():
+    """Test that the least recently used entry is evicted first."""
+    cache = ResultCache(max_entries=2)
+    keys = [cache.key(bytes([i])) for i in range(3)]
+    
+    cache.put(keys[0], make_result(10.0))
+    cache.put(keys[1], make_result(20.0))
+    cache.get(keys[0])  # keys[1] is now least recently used
+    cache.put(keys[2], make_result(30.0))
+    
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]).freshness == 10.0
+    assert cache.stats()['evictions'] == 1
+
+
+def test_byte_bound():
+    """Test that total serialized size never exceeds max_bytes."""
+    entry_size = len(make_result().model_dump_json())
+    cache = ResultCache(max_bytes=entry_size * 3)
+    for i in range(10):
+        cache.put(cache.key(bytes([i])), make_result())
+    
+    assert cache.stats()['entries'] == 3
+    assert cache.stats()['bytes'] <= entry_size * 3
+
+
+def test_ttl_expiry():
+    """Test that entries are not served after their TTL."""
+    cache = ResultCache(ttl_seconds=0.01)
+    key = cache.key(b"image bytes")
+    cache.put(key, make_result())
+    time.sleep(0.02)
+    
+    assert cache.get(key) is None
+    assert cache.stats()['expirations'] == 1
+
+
+def test_namespace_changes_key():
+    """Test that results from a different analyzer version never match."""
+    assert ResultCache(namespace="v1").key(b"x") != ResultCache(namespace="v2").key(b"x")
+    # Model paths that only differ after the first 64 bytes are still told apart
+    prefix = "1.0:auto:/srv/models/" + "fruit_quality_classifier_" * 3
+    assert ResultCache(namespace=prefix + "a.tflite").key(b"x") != ResultCache(namespace=prefix + "b.tflite").key(b"x")
+
+
+def test_file_signature_tracks_model_file(tmp_path):
+    """Test that replacing a model file in place changes its signature."""
+    from app.utils.cache import file_signature
+    model = tmp_path / "model.tflite"
+    model.write_bytes(b"weights")
+    before = file_signature(model)
+    model.write_bytes(b"new weights")
+    assert before and file_signature(model) != before
+    assert file_signature(None) == file_signature(tmp_path / "missing") == ''
+
+
+def test_disk_tier_survives_restart(tmp_path):
+    """Test that the SQLite tier serves results to a fresh cache instance."""
+    path = tmp_path / "cache.sqlite"
+    cache = ResultCache(disk_path=path)
+    key = cache.key(b"image bytes")
+    cache.put(key, make_result())
+    cache.close()
+    
+    restarted = ResultCache(disk_path=path)
+    assert restarted.get(key) == make_result()
+    assert restarted.stats()['disk_hits'] == 1
+    restarted.close()
+
+
+def test_disk_errors_are_misses(tmp_path):
+    """Test that a failing persistent tier degrades to misses instead of raising."""
+    cache = ResultCache(disk_path=tmp_path / "cache.sqlite")
+    cache._db.execute("DROP TABLE analysis_cache")
+    key = cache.key(b"image bytes")
+
+    assert cache.get(key) is None
+    cache.put(key, make_result())
+    # The memory tier still works
+    assert cache.get(key) == make_result()
+    assert cache.stats()['disk_errors'] == 2
+    cache.close()
+
+
+def test_analyze_survives_disk_errors(tmp_path, monkeypatch):
+    """Test that a cache write failing after a successful analysis does not fail the request."""
+    import cv2
+    import numpy as np
+    from fastapi.testclient import TestClient
+    from app import main
+
+    cache = ResultCache(disk_path=tmp_path / "cache.sqlite")
+    cache._db.execute("DROP TABLE analysis_cache")
+    monkeypatch.setattr(main, 'result_cache', cache)
+    image = np.random.default_rng(1).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    data = cv2.imencode('.png', image)[1].tobytes()
+
+    response = TestClient(main.app).post("/analyze", files={"file": ("fruit.png", data, "image/png")})
+    assert response.status_code == 200
+    assert cache.stats()['disk_errors'] == 2
+    cache.close()
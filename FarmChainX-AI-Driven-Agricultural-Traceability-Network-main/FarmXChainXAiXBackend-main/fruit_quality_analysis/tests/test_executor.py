@@ -0,0 +1,65 @@
+"""
+Tests for the analysis worker pool.
+"""
+import asyncio
+import operator
+import pytest
+from app.utils.executor import AnalysisExecutor
+
+
+@pytest.mark.parametrize("kind", ["thread", "process"])
+def test_run_returns_result(kind):
+    """Test that work submitted to the pool comes back to the caller."""
+    executor = AnalysisExecutor(kind=kind, max_workers=2)
+    try:
+        result = asyncio.run(executor.run(operator.add, 2, 3))
+    finally:
+        executor.shutdown()
+    
+    assert result == 5
+    stats = executor.stats()
+    assert stats['kind'] == kind
+    assert stats['submitted'] == 1
+    assert stats['completed'] == 1
+    assert stats['failed'] == 0
+    assert stats['in_flight'] == 0
+    assert stats['wait_seconds_avg'] >= 0
+
+
+def test_run_propagates_errors():
+    """Test that exceptions raised in the pool reach the caller and are counted."""
+    executor = AnalysisExecutor(kind="thread", max_workers=1)
+    try:
+        with pytest.raises(ZeroDivisionError):
+            asyncio.run(executor.run(operator.truediv, 1, 0))
+    finally:
+        executor.shutdown()
+    
+    assert executor.stats()['failed'] == 1
+
+
+def test_queue_depth_under_load():
+    """Test that tasks beyond the pool size are reported as queued."""
+    import time
+    executor = AnalysisExecutor(kind="thread", max_workers=1)
+    seen = []
+    
+    async def submit_many():
+        tasks = [asyncio.ensure_future(executor.run(time.sleep, 0.05)) for _ in range(3)]
+        await asyncio.sleep(0.01)
+        seen.append(executor.stats()['queue_depth'])
+        await asyncio.gather(*tasks)
+    
+    try:
+        asyncio.run(submit_many())
+    finally:
+        executor.shutdown()
+    
+    assert seen[0] == 2
+    assert executor.stats()['wait_seconds_max'] > 0
+
+
+def test_unknown_kind():
+    """Test that an unsupported executor kind is rejected."""
+    with pytest.raises(ValueError):
+        AnalysisExecutor(kind="gpu")
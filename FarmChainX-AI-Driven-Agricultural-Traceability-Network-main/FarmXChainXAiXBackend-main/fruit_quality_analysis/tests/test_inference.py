@@ -0,0 +1,182 @@
+"""
+Tests for the inference backends, using stand-ins for the runtimes.
+"""
+import sys
+import numpy as np
+import pytest
+from app.utils import inference
+from app.utils.image_processor import process_image, preprocessor
+from app.utils.inference import KerasBackend, ONNXBackend, TFLiteBackend, backend_for, quantize
+from app.utils.model_registry import ModelHandle
+
+
+class FakeInterpreter:
+    """Mimics tf.lite.Interpreter for a model quantized with scale 1/255."""
+
+    def __init__(self, input_dtype=np.int8, zero_point=-128):
+        self.input_dtype = input_dtype
+        self.zero_point = zero_point
+        self.resized = []
+        self.inputs = None
+
+    def get_input_details(self):
+        return [{'index': 0, 'dtype': self.input_dtype, 'quantization': (1 / 255, self.zero_point)}]
+
+    def get_output_details(self):
+        return [{'index': 1, 'dtype': np.uint8, 'quantization': (1 / 256, 0)}]
+
+    def resize_tensor_input(self, index, shape):
+        self.resized.append(tuple(shape))
+
+    def allocate_tensors(self):
+        pass
+
+    def set_tensor(self, index, value):
+        assert value.dtype == self.input_dtype
+        self.inputs = value
+
+    def invoke(self):
+        pass
+
+    def get_tensor(self, index):
+        # Class 2 at probability 0.75
+        output = np.full((len(self.inputs), 6), 12, dtype=np.uint8)
+        output[:, 2] = 192
+        return output
+
+
+class FakeInput:
+    def __init__(self, type, shape):
+        self.name, self.type, self.shape = 'input', type, shape
+
+
+class FakeSession:
+    """Mimics onnxruntime.InferenceSession."""
+
+    def __init__(self, type='tensor(float)', shape=('N', 224, 224, 3)):
+        self.model_input = FakeInput(type, shape)
+        self.feeds = []
+
+    def get_inputs(self):
+        return [self.model_input]
+
+    def run(self, outputs, feeds):
+        self.feeds.append(feeds['input'])
+        return [np.tile(np.eye(6, dtype=np.float32)[4], (len(feeds['input']), 1))]
+
+
+def pixels(batch_size=2):
+    return np.random.default_rng(0).integers(0, 256, (batch_size, 224, 224, 3), dtype=np.uint8)
+
+
+@pytest.mark.parametrize("path, expected", [
+    ("model.h5", KerasBackend),
+    ("saved_model/", KerasBackend),
+    ("model_int8.TFLITE", TFLiteBackend),
+    ("model.onnx", ONNXBackend),
+])
+def test_backend_by_extension(path, expected):
+    """Test that 'auto' picks the backend from the file extension."""
+    assert backend_for(path) is expected
+
+
+def test_unknown_backend():
+    """Test that a misspelt MODEL_BACKEND is rejected."""
+    with pytest.raises(ValueError, match="Unknown inference backend"):
+        backend_for("model.onnx", "onxx")
+
+
+def test_backend_must_implement_predict():
+    """Test that a backend missing predict() cannot be instantiated."""
+    class Incomplete(inference.InferenceBackend):
+        @classmethod
+        def load(cls, model_path):
+            return cls()
+
+    with pytest.raises(TypeError, match="predict"):
+        Incomplete.load("model.bin")
+
+
+def test_missing_runtime_names_package(monkeypatch):
+    """Test that a backend without its runtime says what to install."""
+    monkeypatch.setitem(sys.modules, 'onnxruntime', None)
+    with pytest.raises(ImportError, match="pip install onnxruntime"):
+        ONNXBackend.load("model.onnx")
+
+
+def test_quantize_uint8_pixels_without_floats():
+    """Test that pixels map to int8 by shifting the zero point."""
+    batch = pixels()
+    quantized = quantize(batch, 1 / 255, -128, np.int8)
+
+    assert quantized.dtype == np.int8
+    np.testing.assert_array_equal(quantized.astype(np.int16), batch.astype(np.int16) - 128)
+    # Equal to quantizing the float tensor
+    np.testing.assert_array_equal(quantized, quantize(batch.astype(np.float32) / 255, 1 / 255, -128, np.int8))
+    # uint8 models with zero point 0 take the pixels unchanged
+    assert quantize(batch, 1 / 255, 0, np.uint8) is batch
+
+
+def test_tflite_int8_backend():
+    """Test that a quantized model takes uint8 pixels and returns dequantized probabilities."""
+    interpreter = FakeInterpreter()
+    backend = TFLiteBackend(interpreter)
+    assert backend.quantized and backend.input_dtype == np.uint8
+
+    output = backend.predict(pixels(2))
+    np.testing.assert_allclose(output[:, 2], 0.75)
+    assert interpreter.inputs.dtype == np.int8
+
+    # The interpreter is only resized when the batch size changes
+    backend.predict(pixels(2))
+    backend.predict(pixels(3))
+    assert interpreter.resized == [(2, 224, 224, 3), (3, 224, 224, 3)]
+
+
+def test_onnx_backend_layouts():
+    """Test float and channels-first ONNX inputs."""
+    session = FakeSession(shape=('N', 3, 224, 224))
+    backend = ONNXBackend(session)
+    assert backend.channels_first and backend.input_dtype == np.float32
+
+    output = backend.predict(pixels(2))
+    assert output.argmax(axis=1).tolist() == [4, 4]
+    assert session.feeds[0].shape == (2, 3, 224, 224)
+    assert session.feeds[0].dtype == np.float32 and session.feeds[0].max() <= 1.0
+
+    with pytest.raises(ValueError, match="Unsupported"):
+        ONNXBackend(FakeSession(type='tensor(string)'))
+
+
+def test_handle_reports_backend():
+    """Test that the handle exposes the backend's input dtype and info."""
+    handle = ModelHandle(TFLiteBackend(FakeInterpreter()))
+    assert handle.input_dtype == np.uint8
+    assert handle.info()['backend'] == 'tflite'
+    assert handle.info()['quantized'] is True
+
+    handle.warm_up(batch_sizes=[1, 4])
+    assert handle.model.interpreter.resized == [(1, 224, 224, 3), (4, 224, 224, 3)]
+
+    assert ModelHandle().input_dtype == np.float32
+    assert ModelHandle().info()['backend'] is None
+
+
+def test_uint8_preprocessing_matches_float():
+    """Test that quantized models see the same pixels the float tensor encodes."""
+    import cv2
+    image = np.random.default_rng(1).integers(0, 255, (300, 400, 3), dtype=np.uint8)
+    data = cv2.imencode('.png', image)[1].tobytes()
+
+    float_input = process_image(data)
+    uint8_input = process_image(data, input_dtype=np.uint8)
+
+    assert uint8_input.processed_image.dtype == np.uint8
+    np.testing.assert_array_equal(
+        uint8_input.processed_image.astype(np.float32) / np.float32(255.0), float_input.processed_image
+    )
+    np.testing.assert_array_equal(uint8_input.color_histogram, float_input.color_histogram)
+    np.testing.assert_array_equal(
+        inference.to_float(uint8_input.processed_image), float_input.processed_image
+    )
+    assert preprocessor.model_input(image, (224, 224), dtype=np.uint8).dtype == np.uint8
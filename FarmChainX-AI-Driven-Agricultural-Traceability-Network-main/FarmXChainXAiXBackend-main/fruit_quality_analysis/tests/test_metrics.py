@@ -0,0 +1,151 @@
+"""
+Tests for the Prometheus metrics and per-stage timing.
+"""
+import json
+import os
+import subprocess
+import sys
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils import metrics
+from app.utils.metrics import Counter, Gauge, Histogram, MetricsRegistry, StageTimer
+from config import METRICS_CONFIG
+
+client = TestClient(app)
+
+
+def jpeg_bytes(width=320, height=240):
+    image = np.full((height, width, 3), (0, 165, 255), dtype=np.uint8)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+def test_histogram_render():
+    """Test cumulative buckets, sum and count in the text format."""
+    histogram = Histogram('latency_seconds', 'Latency', ('stage',), buckets=(0.1, 1.0))
+    for value in (0.05, 0.5, 5.0):
+        histogram.observe(value, stage='decode')
+
+    lines = histogram.render()
+    assert '# TYPE latency_seconds histogram' in lines
+    assert 'latency_seconds_bucket{stage="decode",le="0.1"} 1' in lines
+    assert 'latency_seconds_bucket{stage="decode",le="1"} 2' in lines
+    assert 'latency_seconds_bucket{stage="decode",le="+Inf"} 3' in lines
+    assert 'latency_seconds_sum{stage="decode"} 5.55' in lines
+    assert 'latency_seconds_count{stage="decode"} 3' in lines
+
+
+def test_counter_and_gauge():
+    """Test label handling and rendering of counters and gauges."""
+    registry = MetricsRegistry()
+    counter = registry.register(Counter('results_total', 'Results', ('fruit_type',)))
+    gauge = registry.register(Gauge('in_flight', 'In flight'))
+    registry.register_callback('pool', 'Pool', ('stat',), lambda: {('queue_depth',): 3})
+
+    counter.inc(fruit_type='Apple')
+    counter.inc(fruit_type='Apple')
+    with gauge.track_inprogress():
+        assert gauge.value() == 1
+    assert gauge.value() == 0
+
+    with pytest.raises(ValueError):
+        counter.inc(color='red')
+
+    text = registry.render()
+    assert 'results_total{fruit_type="Apple"} 2' in text
+    assert 'in_flight 0' in text
+    assert 'pool{stat="queue_depth"} 3' in text
+
+
+def test_stage_without_timer_is_noop():
+    """Test that stage() records nothing when no timer is active."""
+    assert metrics.current_timer() is None
+    with metrics.stage('decode'):
+        pass
+    assert metrics.stage('decode') is metrics.stage('preprocess')
+
+
+def test_timed_call_collects_pipeline_stages():
+    """Test that stages reported inside the pipeline reach the timer."""
+    from app.utils.pipeline import run_analysis
+
+    result, timer = metrics.timed_call(run_analysis, jpeg_bytes())
+
+    assert result.fruit_type is not None
+    assert {'decode', 'preprocess', 'histogram', 'analyze'} <= set(timer.stages)
+    assert timer.image_sizes == [(320, 240)]
+
+    merged = StageTimer()
+    merged.merge(timer)
+    merged.merge(timer)
+    assert merged.stages['decode'] == pytest.approx(2 * timer.stages['decode'])
+
+
+def test_metrics_endpoint_reports_analyze_stages():
+    """Test that an /analyze request shows up in the scrape."""
+    before = metrics.REQUESTS.value(endpoint='/analyze', status='200')
+    response = client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(321, 241), "image/jpeg")})
+    assert response.status_code == 200
+    assert metrics.REQUESTS.value(endpoint='/analyze', status='200') == before + 1
+
+    response = client.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    for stage in ('upload_read', 'decode', 'preprocess', 'histogram', 'analyze', 'serialize'):
+        assert f'fruit_analysis_stage_seconds_count{{stage="{stage}"}}' in text
+    assert 'fruit_analysis_results_total{fruit_type=' in text
+    assert 'fruit_analysis_in_flight_requests{endpoint="/analyze"} 0' in text
+    assert 'fruit_analysis_upload_bytes_count' in text
+    assert 'fruit_analysis_image_megapixels_count' in text
+
+
+def test_rejected_requests_are_counted_by_status():
+    """Test that failed requests are labelled with their HTTP status."""
+    before = metrics.REQUESTS.value(endpoint='/analyze', status='400')
+    response = client.post("/analyze", files={"file": ("notes.txt", b"not an image", "text/plain")})
+    assert response.status_code == 400
+    assert metrics.REQUESTS.value(endpoint='/analyze', status='400') == before + 1
+
+
+def test_metrics_disabled(monkeypatch):
+    """Test that nothing is recorded and /metrics is gone when disabled."""
+    monkeypatch.setitem(METRICS_CONFIG, 'enabled', False)
+    before = metrics.STAGE_SECONDS.count(stage='decode')
+
+    response = client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(322, 242), "image/jpeg")})
+    assert response.status_code == 200
+    assert metrics.STAGE_SECONDS.count(stage='decode') == before
+    assert client.get("/metrics").status_code == 404
+
+
+def test_render_adds_up_worker_snapshots(tmp_path):
+    """Test that every worker's counts are summed and only live workers' gauges."""
+    registry = MetricsRegistry()
+    counter = registry.register(Counter('results_total', 'Results', ('fruit_type',)))
+    gauge = registry.register(Gauge('in_flight', 'In flight'))
+    histogram = registry.register(Histogram('latency_seconds', 'Latency', buckets=(1.0,)))
+    registry.register_callback('pool', 'Pool', ('stat',), lambda: {('queued',): 2})
+    counter.inc(fruit_type='Apple')
+    gauge.inc()
+    histogram.observe(0.5)
+    own = registry.snapshot()
+
+    exited = subprocess.Popen([sys.executable, '-c', 'pass'])
+    exited.wait()
+    live_pid, dead_pid = os.getppid(), exited.pid
+    for pid in (live_pid, dead_pid):
+        (tmp_path / f"{pid}.json").write_text(json.dumps(dict(own, pid=pid)))
+    registry.dump(str(tmp_path))
+    assert sorted(os.listdir(tmp_path)) == sorted(f"{pid}.json" for pid in (live_pid, dead_pid, os.getpid()))
+
+    lines = registry.render(str(tmp_path)).splitlines()
+    assert 'results_total{fruit_type="Apple"} 3' in lines
+    assert 'latency_seconds_bucket{le="1"} 3' in lines
+    assert 'latency_seconds_sum 1.5' in lines
+    assert 'in_flight 2' in lines
+    assert f'pool{{stat="queued",worker="{live_pid}"}} 2' in lines
+    assert not [line for line in lines if f'worker="{dead_pid}"' in line]
+    assert registry.render().splitlines().count('results_total{fruit_type="Apple"} 1') == 1
@@ -0,0 +1,181 @@
+"""
+Tests for model loading, warm-up and model-backed analysis.
+"""
+import threading
+import time
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.model_registry import ModelHandle, ModelRegistry, registry as shared_registry
+from app.utils.analysis import FruitQualityAnalyzer, analyze_fruit_quality_batch
+from app.models.fruit_analysis import FruitType
+from config import MODEL_CONFIG
+
+
+class FakeModel:
+    """Stands in for a Keras model; always predicts the given class."""
+    
+    def __init__(self, class_index, probability=0.9, num_classes=6):
+        self.class_index = class_index
+        self.probability = probability
+        self.num_classes = num_classes
+        self.batch_sizes = []
+    
+    def __call__(self, batch, training=False):
+        self.batch_sizes.append(len(batch))
+        output = np.full((len(batch), self.num_classes), (1 - self.probability) / (self.num_classes - 1))
+        output[:, self.class_index] = self.probability
+        return output
+
+
+def sample_data():
+    return {
+        'processed_image': np.random.random((1, 224, 224, 3)).astype('float32'),
+        'color_histogram': np.random.random(768).astype('float32'),
+        'image_path': None
+    }
+
+
+def test_empty_handle():
+    """Test that a handle without a model predicts nothing."""
+    handle = ModelRegistry().load(model_path=None)
+    assert not handle.loaded
+    assert handle.predict(np.zeros((1, 224, 224, 3), dtype=np.float32)) is None
+
+
+def test_warm_up_traces_each_batch_size():
+    """Test that warm-up runs dummy batches of every requested size."""
+    model = FakeModel(0)
+    handle = ModelHandle(model)
+    handle.warm_up(batch_sizes=[1, 8])
+    
+    assert model.batch_sizes == [1, 8]
+    assert handle.warmup_seconds is not None
+
+
+def test_ensure_reuses_preloaded_model(monkeypatch):
+    """Test that ensure() keeps a model loaded from the same path."""
+    registry = ModelRegistry()
+    loads = []
+    monkeypatch.setattr(ModelRegistry, "_load_model", staticmethod(lambda path: loads.append(path) or FakeModel(0)))
+    
+    first = registry.load(model_path="model.h5")
+    assert registry.ensure(model_path="model.h5") is first
+    assert registry.ensure(model_path="other.h5") is not first
+    assert loads == ["model.h5", "other.h5"]
+
+
+def slow_loader(loads, seconds=1.0):
+    def load(path):
+        loads.append(threading.current_thread().name)
+        time.sleep(seconds)
+        return FakeModel(0)
+    return staticmethod(load)
+
+
+def test_concurrent_ensure_loads_once(monkeypatch):
+    """Test that callers racing to load the same model wait for a single load."""
+    registry = ModelRegistry()
+    loads = []
+    monkeypatch.setattr(ModelRegistry, "_load_model", slow_loader(loads, 0.3))
+    handles = []
+    threads = [threading.Thread(target=lambda: handles.append(registry.ensure(model_path="model.h5")))
+               for _ in range(3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    
+    assert len(loads) == 1
+    assert handles[0] is handles[1] is handles[2]
+
+
+def test_health_during_warm_up_does_not_load(monkeypatch):
+    """Test that /health answers at once during a slow warm-up, which loads the model exactly once."""
+    loads = []
+    monkeypatch.setattr(ModelRegistry, "_load_model", slow_loader(loads))
+    monkeypatch.setitem(MODEL_CONFIG, "model_path", "slow.h5")
+    shared_registry.clear()
+    try:
+        with TestClient(app) as client:
+            started = time.perf_counter()
+            data = client.get("/health").json()
+            assert time.perf_counter() - started < 0.5
+            assert not data["startup"]["ready"] and data["model"] == {"loaded": False}
+            
+            deadline = time.time() + 30
+            while not data["startup"]["ready"] and time.time() < deadline:
+                time.sleep(0.05)
+                data = client.get("/health").json()
+        
+        assert data["model"]["loaded"] and data["model"]["model_path"] == "slow.h5"
+        assert len(loads) == 1
+    finally:
+        shared_registry.clear()
+
+
+def test_missing_model_file():
+    """Test that a configured but missing model fails loudly."""
+    with pytest.raises(FileNotFoundError):
+        ModelRegistry().load(model_path="does/not/exist.h5")
+
+
+def test_analyzer_uses_model_predictions():
+    """Test that the fruit type comes from the model when one is loaded."""
+    analyzer = FruitQualityAnalyzer(ModelHandle(FakeModel(3, probability=0.95)))
+    result = analyzer.analyze(sample_data())
+    
+    assert result.fruit_type == FruitType.MANGO
+    assert result.confidence == 95.0
+
+
+def test_low_confidence_is_unknown():
+    """Test that predictions below the confidence threshold are not trusted."""
+    analyzer = FruitQualityAnalyzer(ModelHandle(FakeModel(0, probability=0.3)))
+    assert analyzer.analyze(sample_data()).fruit_type == FruitType.UNKNOWN
+
+
+def test_batch_runs_one_inference():
+    """Test that batch analysis calls the model once for all images."""
+    model = FakeModel(1)
+    batch = {
+        'processed_images': np.random.random((5, 224, 224, 3)).astype('float32'),
+        'color_histograms': np.random.random((5, 768)).astype('float32'),
+        'image_paths': [None] * 5
+    }
+    results = analyze_fruit_quality_batch(batch, model=ModelHandle(model))
+    
+    assert model.batch_sizes == [5]
+    assert all(result.fruit_type == FruitType.BANANA for result in results)
+
+
+def test_batch_mixes_trusted_and_unknown_rows():
+    """Test that the confidence threshold is applied per row of a batch."""
+    predictions = np.array([
+        [0.05, 0.05, 0.05, 0.8, 0.025, 0.025],
+        [0.3, 0.2, 0.2, 0.1, 0.1, 0.1],
+    ])
+    histograms = np.random.random((2, 768)).astype('float32')
+    trusted, unknown = FruitQualityAnalyzer().analyze_batch(histograms, predictions=predictions)
+    
+    assert (trusted.fruit_type, trusted.confidence) == (FruitType.MANGO, 80.0)
+    assert (unknown.fruit_type, unknown.confidence) == (FruitType.UNKNOWN, 30.0)
+    assert "Refrigerate to extend shelf life" not in unknown.recommendations
+
+
+def test_startup_warms_up_model():
+    """Test that the background warm-up registers and traces the model."""
+    import time
+    with TestClient(app) as client:
+        deadline = time.time() + 30
+        while True:
+            data = client.get("/health").json()
+            if data["startup"]["ready"] or time.time() > deadline:
+                break
+            time.sleep(0.05)
+    
+    assert data["startup"]["ready"]
+    assert data["startup"]["error"] is None
+    assert "import_cv2" in data["startup"]["timings"]
+    assert data["model"]["warmup_seconds"] is not None
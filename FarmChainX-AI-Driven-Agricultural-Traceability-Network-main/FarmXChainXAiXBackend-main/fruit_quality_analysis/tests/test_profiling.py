@@ -0,0 +1,146 @@
+"""
+Tests for request profiling and the admin download endpoints.
+"""
+import io
+import json
+import marshal
+import pstats
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils.profiling import RequestProfile, SlowRequestLog, profiled_call, slow_requests
+from app.utils.pipeline import run_analysis
+from config import PROFILING_CONFIG, RESULTS_CONFIG
+
+client = TestClient(app)
+ADMIN = {"X-Admin-Token": "secret"}
+
+
+def jpeg_bytes(width, height=240):
+    image = np.full((height, width, 3), (0, 255, 255), dtype=np.uint8)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+@pytest.fixture(autouse=True)
+def empty_log(monkeypatch):
+    monkeypatch.setitem(PROFILING_CONFIG, 'admin_token', 'secret')
+    slow_requests.clear()
+    yield
+    slow_requests.clear()
+
+
+def make_profile(duration):
+    profile = RequestProfile('/analyze')
+    profile.duration = duration
+    return profile
+
+
+def test_slow_request_log_keeps_slowest():
+    """Test that only the N slowest requests are kept, slowest first."""
+    log = SlowRequestLog(capacity=2)
+    for duration in (0.3, 0.1, 0.5, 0.2):
+        log.offer(make_profile(duration))
+
+    assert [profile.duration for profile in log.entries()] == [0.5, 0.3]
+
+
+def test_profiled_call_exports_pstats_and_speedscope(tmp_path):
+    """Test that a profiled pipeline run converts to both download formats."""
+    result, timer, stats = profiled_call(run_analysis, jpeg_bytes(300))
+    assert result.fruit_type is not None
+    assert 'decode' in timer.stages
+
+    profile = make_profile(0.1)
+    profile.add_stats(stats)
+    profile.add_stats(stats)
+
+    path = tmp_path / "profile.pstats"
+    path.write_bytes(profile.to_pstats())
+    loaded = pstats.Stats(str(path), stream=io.StringIO())
+    functions = {name for _, _, name in loaded.stats}
+    assert 'process_image' in functions
+    assert 'analyze' in functions
+    # Merging twice must not change the stored per-call stats
+    assert marshal.loads(profile.to_pstats()) == marshal.loads(profile.to_pstats())
+
+    speedscope = profile.to_speedscope()
+    frames = speedscope['shared']['frames']
+    samples = speedscope['profiles'][0]['samples']
+    assert len(samples) == len(speedscope['profiles'][0]['weights'])
+    assert all(0 <= index < len(frames) for stack in samples for index in stack)
+    assert any(frame['name'] == 'process_image' for frame in frames)
+
+
+def test_profiling_off_by_default():
+    """Test that nothing is recorded unless profiling is enabled."""
+    response = client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(301), "image/jpeg")},
+                           headers={"X-Profile": "1"})
+    assert response.status_code == 200
+    assert client.get("/admin/profiles", headers=ADMIN).json()["profiles"] == []
+
+
+def test_header_gated_profiling(monkeypatch):
+    """Test that only requests sending the header are profiled and downloadable."""
+    monkeypatch.setitem(PROFILING_CONFIG, 'mode', 'header')
+
+    client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(302), "image/jpeg")})
+    response = client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(303), "image/jpeg")},
+                           headers={"X-Profile": "1", **ADMIN})
+    assert response.status_code == 200
+
+    profiles = client.get("/admin/profiles", headers=ADMIN).json()["profiles"]
+    assert len(profiles) == 1
+    entry = profiles[0]
+    assert entry["endpoint"] == "/analyze"
+    assert entry["status"] == 200
+    assert entry["image_sizes"] == [[303, 240]]
+    assert {'upload_read', 'decode', 'analyze'} <= set(entry["stages"])
+
+    response = client.get(f"/admin/profiles/{entry['id']}", headers=ADMIN)
+    assert response.status_code == 200
+    assert "attachment" in response.headers["content-disposition"]
+    assert marshal.loads(response.content)
+
+    response = client.get(f"/admin/profiles/{entry['id']}", params={"format": "speedscope"}, headers=ADMIN)
+    assert response.status_code == 200
+    assert json.loads(response.content)["profiles"][0]["type"] == "sampled"
+
+    assert client.get("/admin/profiles/missing", headers=ADMIN).status_code == 404
+    assert client.get(f"/admin/profiles/{entry['id']}", params={"format": "svg"}, headers=ADMIN).status_code == 422
+
+
+def test_admin_token(monkeypatch):
+    """Test that the admin token guards the endpoints and the header."""
+    monkeypatch.setitem(PROFILING_CONFIG, 'mode', 'header')
+
+    client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(304), "image/jpeg")},
+                headers={"X-Profile": "1"})
+    assert client.get("/admin/profiles").status_code == 403
+
+    response = client.get("/admin/profiles", headers={"X-Admin-Token": "secret"})
+    assert response.status_code == 200
+    assert response.json()["profiles"] == []
+
+    client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(305), "image/jpeg")},
+                headers={"X-Profile": "1", "X-Admin-Token": "secret"})
+    response = client.get("/admin/profiles", headers={"X-Admin-Token": "secret"})
+    assert len(response.json()["profiles"]) == 1
+
+
+def test_admin_closed_without_token(monkeypatch):
+    """Test that no token configured means no admin access at all, not open access."""
+    monkeypatch.setitem(PROFILING_CONFIG, 'mode', 'header')
+    monkeypatch.setitem(PROFILING_CONFIG, 'admin_token', None)
+    monkeypatch.setitem(RESULTS_CONFIG, 'api_token', None)
+
+    client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(306), "image/jpeg")},
+                headers={"X-Profile": "1"})
+    assert len(slow_requests.entries()) == 0
+    for headers in ({}, {"X-Admin-Token": ""}, ADMIN):
+        assert client.get("/admin/profiles", headers=headers).status_code == 403
+        assert client.get("/admin/settings", headers=headers).status_code == 403
+        assert client.put("/admin/settings", json={"image_processing": {"hist_bins": 16}},
+                          headers=headers).status_code == 403
+        assert client.get("/results", headers={"X-Results-Token": "secret", **headers}).status_code == 403
@@ -0,0 +1,151 @@
+"""
+Tests for result queries and the rollups behind them.
+"""
+from datetime import datetime, timedelta, timezone
+import pytest
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+from app import main
+from app.models.records import ROLLUP_TABLES
+from app.utils.results_query import find_results, rollup_series
+from app.utils.results_store import ResultStore
+from app.utils.rollups import rebuild_rollups
+from config import PROFILING_CONFIG, RESULTS_CONFIG
+
+DAY = datetime(2024, 5, 1, tzinfo=timezone.utc)
+
+def make_row(created_at, fruit_type="Mango", condition="Good", shelf_life_days=5, lot=None, freshness=80.0):
+    return {
+        'created_at': created_at, 'endpoint': '/analyze', 'filename': None, 'upload_bytes': None,
+        'lot': lot, 'cached': False, 'fruit_type': fruit_type, 'overall_condition': condition,
+        'confidence': 90.0, 'freshness': freshness, 'ripeness': 50.0, 'shelf_life_days': shelf_life_days,
+        'recommendations': [], 'analyzer_version': '1', 'settings_fingerprint': None,
+    }
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(f"sqlite:///{tmp_path / 'results.sqlite'}", batch_size=3, flush_interval_ms=50)
+    rows = [
+        # Day 1: 4 mangoes, 1 poor and 1 spoiled; 1 apple
+        make_row(DAY + timedelta(hours=1), condition="Excellent", shelf_life_days=10, lot="A"),
+        make_row(DAY + timedelta(hours=2), condition="Good", lot="A"),
+        make_row(DAY + timedelta(hours=2, minutes=30), condition="Poor", shelf_life_days=2, lot="B", freshness=30.0),
+        make_row(DAY + timedelta(hours=5), condition="Spoiled", shelf_life_days=0, lot="B", freshness=10.0),
+        make_row(DAY + timedelta(hours=6), fruit_type="Apple", condition="Poor", shelf_life_days=1),
+        # Day 2: 2 mangoes, neither poor nor spoiled
+        make_row(DAY + timedelta(days=1, hours=3), condition="Good", lot="A"),
+        make_row(DAY + timedelta(days=1, hours=4), condition="Fair", shelf_life_days=3, lot="A"),
+    ]
+    for row in rows:
+        assert store.put(row)
+    assert store.flush()
+    yield store
+    store.close()
+
+def test_rollups_match_rows(store):
+    """Test that incrementally maintained rollups equal a rebuild from the rows."""
+    def snapshot(connection):
+        return {name: sorted(map(tuple, connection.execute(sa.select(table)).all()))
+                for name, table in ROLLUP_TABLES.items()}
+
+    with store.engine.begin() as connection:
+        incremental = snapshot(connection)
+        assert rebuild_rollups(connection) == 7
+        assert snapshot(connection) == incremental
+    assert sum(row[4] for row in incremental['day']) == 7
+    assert len(incremental['day']) == 7 and len(incremental['hour']) == 7
+
+def test_cache_hits_are_not_rolled_up(store):
+    """Test that re-uploads answered from the cache are listed but not counted as new fruit."""
+    cached = dict(make_row(DAY + timedelta(hours=1), condition="Spoiled", lot="A"), cached=True)
+    assert store.put(cached)
+    assert store.flush()
+
+    with store.engine.begin() as connection:
+        series = rollup_series(connection, 'day', fruit_types=['Mango'], start=DAY, end=DAY + timedelta(days=1))
+        assert rebuild_rollups(connection) == 7
+        assert rollup_series(connection, 'day', fruit_types=['Mango'], start=DAY,
+                             end=DAY + timedelta(days=1)) == series
+        listed = find_results(connection, lot='A', conditions=['Spoiled'])
+    assert series[0]['results'] == 4
+    assert [row['cached'] for row in listed['results']] == [True]
+
+def test_share_of_poor_mangoes_per_day(store):
+    """Test the share of poor or spoiled mangoes, including a day without any."""
+    with store.engine.connect() as connection:
+        series = rollup_series(connection, 'day', fruit_types=['Mango'], conditions=['Poor', 'Spoiled'])
+
+    assert [item['bucket_start'] for item in series] == [DAY, DAY + timedelta(days=1)]
+    first, second = series
+    assert (first['results'], first['share']) == (2, 0.5)
+    assert first['mean_freshness'] == pytest.approx(20.0)
+    assert first['shelf_life_days'] == {'0-2': 2, '3-4': 0, '5-7': 0, '8-14': 0, '15+': 0}
+    assert (second['results'], second['share'], second['mean_freshness']) == (0, 0.0, None)
+
+def test_rollup_group_by(store):
+    """Test splitting buckets by lot and condition."""
+    with store.engine.connect() as connection:
+        series = rollup_series(connection, 'day', fruit_types=['Mango'], start=DAY, end=DAY + timedelta(days=1),
+                               group_by=['lot', 'overall_condition'])
+        by_lot = rollup_series(connection, 'hour', group_by=['lot'], lot='B')
+
+    groups = {(item['overall_condition'], item['lot']): item for item in series}
+    assert set(groups) == {('Excellent', 'A'), ('Good', 'A'), ('Poor', 'B'), ('Spoiled', 'B')}
+    assert groups[('Poor', 'B')]['share'] == 0.5
+    assert [item['results'] for item in by_lot] == [1, 1]
+    assert all(item['lot'] == 'B' for item in by_lot)
+
+    with store.engine.connect() as connection, pytest.raises(ValueError):
+        rollup_series(connection, 'day', group_by=['filename'])
+
+def test_find_results_pages_with_cursor(store):
+    """Test filtered listing, newest first, across cursor pages."""
+    pages = []
+    cursor = None
+    with store.engine.connect() as connection:
+        while True:
+            page = find_results(connection, fruit_types=['Mango'], limit=2, cursor=cursor)
+            pages.append(page['results'])
+            cursor = page['next']
+            if cursor is None:
+                break
+        poor = find_results(connection, conditions=['Poor'], start=DAY, end=DAY + timedelta(hours=6))
+
+    times = [row['created_at'] for page in pages for row in page]
+    assert [len(page) for page in pages] == [2, 2, 2]
+    assert times == sorted(times, reverse=True) and len(set(times)) == 6
+    assert [row['lot'] for row in poor['results']] == ['B']
+
+def test_result_endpoints(store, monkeypatch):
+    """Test GET /results and GET /results/rollups, behind their own token."""
+    monkeypatch.setattr(main, 'results_store', store)
+    monkeypatch.setitem(RESULTS_CONFIG, 'api_token', 'secret')
+    client = TestClient(main.app, headers={"X-Results-Token": "secret"})
+
+    response = client.get("/results", params={"fruit_type": "Mango", "lot": "A", "limit": 2})
+    assert response.status_code == 200
+    body = response.json()
+    assert len(body["results"]) == 2 and body["next"]
+    assert client.get("/results", params={"cursor": body["next"], "fruit_type": "Mango", "lot": "A"}).json()["next"] is None
+
+    response = client.get("/results/rollups", params={
+        "fruit_type": "Mango", "overall_condition": ["Poor", "Spoiled"], "granularity": "day"
+    })
+    assert response.status_code == 200
+    assert [item["share"] for item in response.json()["series"]] == [0.5, 0.0]
+
+    assert client.get("/results", params={"cursor": "nonsense"}).status_code == 400
+    assert client.get("/results/rollups", params={"granularity": "week"}).status_code == 422
+    assert client.get("/results/rollups", params={"group_by": "filename"}).status_code == 400
+
+    # The admin token neither opens nor closes the results API
+    monkeypatch.setitem(PROFILING_CONFIG, 'admin_token', None)
+    assert client.get("/results").status_code == 200
+    monkeypatch.setitem(PROFILING_CONFIG, 'admin_token', 'admin')
+    assert client.get("/results", headers={"X-Results-Token": "admin"}).status_code == 403
+    monkeypatch.setitem(RESULTS_CONFIG, 'api_token', None)
+    assert client.get("/results").status_code == 403
+    monkeypatch.setitem(RESULTS_CONFIG, 'api_token', 'secret')
+
+    monkeypatch.setattr(main, 'results_store', None)
+    assert client.get("/results").status_code == 503
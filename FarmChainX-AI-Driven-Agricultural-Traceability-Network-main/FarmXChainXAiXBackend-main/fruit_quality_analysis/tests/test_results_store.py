@@ -0,0 +1,193 @@
+"""
+Tests for the batched results store.
+"""
+import threading
+import time
+import cv2
+import numpy as np
+import pytest
+import sqlalchemy as sa
+from fastapi.testclient import TestClient
+from app import main
+from app.models.fruit_analysis import AnalysisResult, FruitType
+from app.utils.results_store import ResultStore
+
+
+def sample_result(fruit_type="Apple"):
+    return AnalysisResult(
+        fruit_type=fruit_type, confidence=90.0, freshness=85.0, ripeness=60.0,
+        shelf_life_days=7, overall_condition="Good", recommendations=["Store in a cool place"]
+    )
+
+
+@pytest.fixture
+def store(tmp_path):
+    store = ResultStore(f"sqlite:///{tmp_path / 'results.sqlite'}", batch_size=4, flush_interval_ms=50)
+    yield store
+    store.close()
+
+
+def count_rows(store):
+    with store.engine.connect() as connection:
+        return connection.execute(sa.text("SELECT COUNT(*) FROM analysis_results")).scalar()
+
+
+def test_rows_are_written_in_batches(store):
+    """Test that rows are inserted in batch_size transactions."""
+    for _ in range(10):
+        assert store.record(sample_result(), '/analyze', 'apple.jpg', 1234)
+    assert store.flush()
+
+    stats = store.stats()
+    assert count_rows(store) == 10
+    assert stats['written'] == 10 and stats['dropped'] == 0
+    assert stats['largest_batch'] == 4
+    assert stats['flushes'] == 3
+
+    with store.engine.connect() as connection:
+        row = connection.execute(sa.text(
+            "SELECT filename, upload_bytes, fruit_type, recommendations FROM analysis_results LIMIT 1"
+        )).one()
+    assert row[:3] == ('apple.jpg', 1234, 'Apple')
+
+
+def test_partial_batch_is_written_after_interval(store):
+    """Test that a lone row does not wait for the batch to fill up."""
+    store.record(sample_result(), '/analyze')
+
+    deadline = time.time() + 5
+    while store.stats()['written'] < 1 and time.time() < deadline:
+        time.sleep(0.01)
+    assert count_rows(store) == 1
+
+
+def test_full_queue_drops_instead_of_blocking(tmp_path, monkeypatch):
+    """Test backpressure: a stalled database fills the queue and new rows are dropped."""
+    store = ResultStore(f"sqlite:///{tmp_path / 'results.sqlite'}", queue_size=2, batch_size=1)
+    release = threading.Event()
+    original_write = store._write
+    monkeypatch.setattr(store, '_write', lambda rows: release.wait(5) and original_write(rows))
+
+    accepted = [store.record(sample_result(), '/analyze') for _ in range(3)]
+    # The writer holds the first row while it waits on the database
+    deadline = time.time() + 5
+    while store.stats()['queue_depth'] > 1 and time.time() < deadline:
+        time.sleep(0.01)
+    accepted += [store.record(sample_result(), '/analyze') for _ in range(3)]
+
+    stats = store.stats()
+    assert accepted.count(False) == stats['dropped'] > 0
+    assert stats['queue_depth'] == stats['queue_capacity'] == 2
+
+    release.set()
+    store.close()
+    assert count_rows(store) == stats['enqueued'] == accepted.count(True)
+
+
+def test_close_writes_pending_rows(tmp_path):
+    """Test that shutdown flushes rows still waiting for their batch."""
+    store = ResultStore(f"sqlite:///{tmp_path / 'results.sqlite'}", batch_size=100, flush_interval_ms=60000)
+    for _ in range(5):
+        store.record(sample_result(), '/analyze')
+    store.close()
+
+    assert count_rows(store) == 5
+    assert not store.record(sample_result(), '/analyze')
+
+
+def test_migrations_create_schema(store):
+    """Test that the alembic migration matches the table definition."""
+    from alembic.migration import MigrationContext
+    from alembic.autogenerate import compare_metadata
+    from alembic.script import ScriptDirectory
+    from app.models.records import metadata
+    from app.utils.results_store import MIGRATIONS_DIR
+
+    store.record(sample_result(), '/analyze')
+    store.flush()
+    with store.engine.connect() as connection:
+        context = MigrationContext.configure(connection)
+        assert context.get_current_revision() == ScriptDirectory(str(MIGRATIONS_DIR)).get_current_head()
+        assert compare_metadata(context, metadata) == []
+
+
+def test_rollup_backfill_matches_rebuild(tmp_path):
+    """Test that migration 0002 rolls up existing results the way the app does."""
+    from datetime import datetime, timedelta, timezone
+    from alembic import command
+    from alembic.config import Config
+    from app.models.records import ROLLUP_TABLES
+    from app.utils.results_store import MIGRATIONS_DIR, create_engine
+    from app.utils.rollups import rebuild_rollups
+
+    engine = create_engine(f"sqlite:///{tmp_path / 'results.sqlite'}")
+    config = Config()
+    config.set_main_option('script_location', str(MIGRATIONS_DIR))
+
+    def upgrade(revision):
+        with engine.begin() as connection:
+            config.attributes['connection'] = connection
+            command.upgrade(config, revision)
+
+    upgrade('0001')
+    results = sa.table('analysis_results', *(sa.column(name) for name in (
+        'endpoint', 'cached', 'fruit_type', 'overall_condition', 'confidence', 'freshness', 'ripeness',
+        'shelf_life_days', 'recommendations', 'analyzer_version')), sa.column('created_at', sa.DateTime(timezone=True)))
+    start = datetime(2024, 5, 1, 23, 30, tzinfo=timezone.utc)
+    with engine.begin() as connection:
+        connection.execute(results.insert(), [{
+            'created_at': start + timedelta(minutes=20 * i), 'endpoint': '/analyze', 'cached': i % 4 == 3,
+            'fruit_type': ('Apple', 'Mango')[i % 2], 'overall_condition': ('Good', 'Poor', 'Spoiled')[i % 3],
+            'confidence': 90.0, 'freshness': 10.0 * i, 'ripeness': 50.0, 'shelf_life_days': i,
+            'recommendations': '[]', 'analyzer_version': '1',
+        } for i in range(20)])
+    upgrade('head')
+
+    def snapshot(connection):
+        return {name: sorted(map(tuple, connection.execute(sa.select(table)).all()))
+                for name, table in ROLLUP_TABLES.items()}
+
+    with engine.begin() as connection:
+        migrated = snapshot(connection)
+        assert rebuild_rollups(connection) == 15
+        assert snapshot(connection) == migrated
+    assert sum(row[4] for row in migrated['day']) == 15
+    engine.dispose()
+
+
+def test_in_memory_database():
+    """Test that sqlite:// shares one database between the writer and readers."""
+    store = ResultStore("sqlite://", batch_size=1)
+    store.record(sample_result("Mango"), '/analyze')
+    store.flush()
+    assert count_rows(store) == 1
+    store.close()
+
+
+def test_analyze_endpoint_stores_result(monkeypatch, tmp_path):
+    """Test that /analyze queues its result, and cache hits are marked as such."""
+    store = ResultStore(f"sqlite:///{tmp_path / 'results.sqlite'}")
+    monkeypatch.setattr(main, 'results_store', store)
+    client = TestClient(main.app)
+    image = np.random.default_rng(0).integers(0, 255, (120, 160, 3), dtype=np.uint8)
+    data = cv2.imencode('.png', image)[1].tobytes()
+
+    first = client.post("/analyze", files={"file": ("fruit.png", data, "image/png")}, data={"lot": "L-7"})
+    second = client.post("/analyze", files={"file": ("fruit.png", data, "image/png")})
+    assert first.status_code == second.status_code == 200
+    store.flush()
+
+    with store.engine.connect() as connection:
+        rows = connection.execute(sa.text(
+            "SELECT endpoint, filename, upload_bytes, cached, fruit_type, settings_fingerprint, lot "
+            "FROM analysis_results ORDER BY id"
+        )).all()
+    assert len(rows) == 2
+    assert rows[0][:3] == ('/analyze', 'fruit.png', len(data))
+    assert FruitType(rows[0][4]) == FruitType(first.json()["fruit_type"])
+    assert rows[0][5] == main.settings.current_settings().fingerprint
+    assert [row[6] for row in rows] == ['L-7', None]
+    if main.result_cache is not None:
+        assert [row[3] for row in rows] == [False, True]
+    assert client.get("/health").json()["results_store"]["enqueued"] == 2
+    store.close()
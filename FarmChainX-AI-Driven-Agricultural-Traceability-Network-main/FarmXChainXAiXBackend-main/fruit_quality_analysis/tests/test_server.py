@@ -0,0 +1,92 @@
+"""
+Tests for the production server mode.
+"""
+import os
+import signal
+import socket
+import subprocess
+import sys
+import time
+from pathlib import Path
+import httpx
+import pytest
+
+PROJECT_DIR = Path(__file__).parent.parent
+
+
+def wait_for_health(url, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            response = httpx.get(f"{url}/health", timeout=2)
+            if response.status_code == 200:
+                return response.json()
+        except httpx.HTTPError:
+            pass
+        time.sleep(0.2)
+    pytest.fail(f"{url} did not become healthy")
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="pre-forking needs fork()")
+def test_prefork_restarts_workers_and_shuts_down():
+    """Test that a killed worker is replaced and SIGTERM stops the server."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    url = f"http://127.0.0.1:{port}"
+    env = dict(os.environ, API_HOST="127.0.0.1", API_PORT=str(port), API_WORKERS="1",
+               ARCHIVE_UPLOADS="False")
+    server = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "run.py", "--prod"],
+        cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        worker = wait_for_health(url)["worker_pid"]
+        assert worker != server.pid
+        
+        os.kill(worker, signal.SIGKILL)
+        time.sleep(0.5)
+        replacement = wait_for_health(url)["worker_pid"]
+        assert replacement not in (worker, server.pid)
+        
+        server.send_signal(signal.SIGTERM)
+        assert server.wait(timeout=20) == 0
+    finally:
+        if server.poll() is None:
+            server.kill()
+            server.wait()
+
+
+@pytest.mark.skipif(not hasattr(os, "fork"), reason="pre-forking needs fork()")
+def test_sighup_reloads_settings_in_workers(tmp_path):
+    """Test that SIGHUP to the supervisor makes workers re-read the overrides file."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        port = sock.getsockname()[1]
+    url = f"http://127.0.0.1:{port}"
+    overrides = tmp_path / "settings.json"
+    env = dict(os.environ, API_HOST="127.0.0.1", API_PORT=str(port), API_WORKERS="1",
+               ARCHIVE_UPLOADS="False", SETTINGS_OVERRIDES_PATH=str(overrides), ADMIN_TOKEN="secret")
+    server = subprocess.Popen(
+        [sys.executable, "-W", "ignore", "run.py", "--prod"],
+        cwd=PROJECT_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+    )
+    try:
+        before = wait_for_health(url)["settings"]
+        
+        overrides.write_text('{"image_processing": {"hist_bins": 64}}')
+        server.send_signal(signal.SIGHUP)
+        deadline = time.monotonic() + 10
+        while wait_for_health(url)["settings"] == before and time.monotonic() < deadline:
+            time.sleep(0.1)
+        
+        settings = httpx.get(f"{url}/admin/settings", headers={"X-Admin-Token": "secret"}).json()["settings"]
+        assert settings["image_processing"]["hist_bins"] == 64
+        assert server.poll() is None
+    finally:
+        server.send_signal(signal.SIGTERM)
+        try:
+            server.wait(timeout=20)
+        except subprocess.TimeoutExpired:
+            server.kill()
+            server.wait()
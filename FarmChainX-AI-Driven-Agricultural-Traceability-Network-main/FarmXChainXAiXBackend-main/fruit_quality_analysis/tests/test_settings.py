@@ -0,0 +1,188 @@
+"""
+Tests for the runtime settings snapshot and its hot reload.
+"""
+import asyncio
+import json
+import cv2
+import numpy as np
+import pytest
+from fastapi.testclient import TestClient
+from app.main import app
+from app.utils import settings
+from app.utils.analysis import FruitQualityAnalyzer, analyze_fruit_quality
+from app.utils.cache import ResultCache
+from app.utils.image_processor import process_image
+from config import ANALYSIS_CONFIG, IMAGE_PROCESSING, PROFILING_CONFIG, SETTINGS_CONFIG
+
+client = TestClient(app, headers={"X-Admin-Token": "secret"})
+
+
+@pytest.fixture(autouse=True)
+def restore_settings(monkeypatch):
+    monkeypatch.setitem(SETTINGS_CONFIG, 'overrides_path', None)
+    monkeypatch.setitem(PROFILING_CONFIG, 'admin_token', 'secret')
+    previous = settings.current_settings()
+    yield
+    settings.swap(previous)
+
+
+def jpeg_bytes(width=320, height=240):
+    image = np.random.default_rng(0).integers(0, 255, (height, width, 3), dtype=np.uint8)
+    return cv2.imencode('.jpg', image)[1].tobytes()
+
+
+def test_defaults_come_from_config():
+    """Test that the snapshot mirrors IMAGE_PROCESSING and ANALYSIS_CONFIG."""
+    snapshot = settings.defaults()
+    assert snapshot.target_size == IMAGE_PROCESSING['target_size']
+    assert snapshot.hist_bins == IMAGE_PROCESSING['hist_bins']
+    assert snapshot.condition_weights == ANALYSIS_CONFIG['condition_weights']
+    assert snapshot.ripeness_thresholds == ANALYSIS_CONFIG['ripeness_thresholds']
+    assert snapshot.fingerprint == settings.defaults().fingerprint
+
+
+def test_merged_applies_partial_overrides():
+    """Test that nested overrides change only the keys they name."""
+    base = settings.defaults()
+    changed = base.merged({'analysis': {'condition_weights': {'freshness': 0.5}}})
+
+    assert changed.condition_weights == dict(base.condition_weights, freshness=0.5)
+    assert changed.hist_bins == base.hist_bins
+    assert changed.fingerprint != base.fingerprint
+    # The original snapshot is untouched
+    assert base == settings.defaults()
+
+
+@pytest.mark.parametrize("overrides", [
+    {'model': {'confidence_threshold': 0.1}},
+    {'image_processing': {'color_space': 'BGR'}},
+    {'image_processing': {'hist_bins': 0}},
+    {'image_processing': {'target_size': [224]}},
+    {'analysis': {'condition_weights': {'color': 1.0}}},
+    {'analysis': {'condition_thresholds': {'good': 95}}},
+])
+def test_invalid_overrides_are_rejected(overrides):
+    """Test that unknown or inconsistent settings raise ValueError."""
+    with pytest.raises(ValueError):
+        settings.defaults().merged(overrides)
+
+
+def test_update_persists_and_reload_reads_file(tmp_path, monkeypatch):
+    """Test that updates are written to the overrides file and survive a reload."""
+    path = tmp_path / "settings.json"
+    monkeypatch.setitem(SETTINGS_CONFIG, 'overrides_path', str(path))
+
+    updated = settings.update({'image_processing': {'hist_bins': 32}})
+    assert json.loads(path.read_text())['image_processing']['hist_bins'] == 32
+
+    settings.swap(settings.defaults())
+    assert settings.reload() == updated
+
+
+def test_reload_keeps_current_on_bad_file(tmp_path, monkeypatch):
+    """Test that a broken overrides file does not replace working settings."""
+    path = tmp_path / "settings.json"
+    path.write_text('{"image_processing": {"hist_bins": 1000}}')
+    monkeypatch.setitem(SETTINGS_CONFIG, 'overrides_path', str(path))
+
+    before = settings.current_settings()
+    assert settings.reload() is before
+
+
+def test_model_input_size_is_fixed(monkeypatch):
+    """Test that target_size cannot drift from a configured model's input shape."""
+    from config import MODEL_CONFIG
+    monkeypatch.setitem(MODEL_CONFIG, 'model_path', 'model.h5')
+    with pytest.raises(ValueError, match="target_size"):
+        settings.update({'image_processing': {'target_size': [160, 160]}})
+
+
+def test_process_image_uses_snapshot():
+    """Test that the target size and histogram bins come from the settings."""
+    snapshot = settings.defaults().merged(
+        {'image_processing': {'target_size': [160, 120], 'hist_bins': 32}}
+    )
+    result = process_image(jpeg_bytes(), snapshot)
+
+    assert result['processed_image'].shape == (1, 120, 160, 3)
+    assert result['color_histogram'].shape == (96,)
+
+
+def test_analyzer_uses_condition_weights():
+    """Test that the overall condition follows the configured weights."""
+    # Only freshness counts, and every fruit is at least 70% fresh
+    snapshot = settings.defaults().merged({'analysis': {
+        'condition_weights': {'freshness': 1.0, 'ripeness': 0.0, 'shelf_life': 0.0},
+    }})
+    analyzer = FruitQualityAnalyzer(settings=snapshot)
+    scores = analyzer.score_batch(np.random.random((32, 768)).astype('float32'))
+
+    np.testing.assert_allclose(scores['score'], scores['freshness'])
+    assert set(scores['condition_index'].tolist()) <= {2, 3, 4}
+
+
+def test_micro_batch_scores_with_each_requests_snapshot():
+    """Test that coalesced requests keep the settings they were processed with across a reload."""
+    from app.utils.pipeline import analyze_processed_batch
+    old = settings.current_settings()
+    strict = old.merged({'analysis': {'condition_thresholds': {'poor': 97, 'fair': 98, 'good': 99, 'excellent': 100}}})
+    lenient = old.merged({'analysis': {'condition_thresholds': {'poor': 1, 'fair': 2, 'good': 3, 'excellent': 4}}})
+    images = [process_image(jpeg_bytes(320 + i), snapshot) for i, snapshot in enumerate((old, old, strict))]
+
+    # The reload lands after processing, before the batch runs
+    settings.swap(lenient)
+    results = analyze_processed_batch(images)
+
+    expected = [analyze_fruit_quality(image, settings=snapshot) for image, snapshot in zip(images, (old, old, strict))]
+    assert [r.model_dump() for r in results] == [r.model_dump() for r in expected]
+    assert results[2].overall_condition.value == "Spoiled"
+
+
+def test_cache_key_depends_on_settings():
+    """Test that results computed under other settings are not reused."""
+    cache = ResultCache(namespace='test')
+    snapshot = settings.defaults()
+    changed = snapshot.merged({'image_processing': {'hist_bins': 64}})
+    assert cache.key(b'image', snapshot.fingerprint) != cache.key(b'image', changed.fingerprint)
+    assert cache.key(b'image', snapshot.fingerprint) == cache.key(b'image', snapshot.fingerprint)
+
+
+def test_admin_settings_endpoint():
+    """Test reading and changing settings through /admin/settings."""
+    before = client.get("/admin/settings").json()
+    assert before["settings"] == settings.current_settings().as_dict()
+
+    response = client.put("/admin/settings", json={"image_processing": {"hist_bins": 16}})
+    assert response.status_code == 200
+    data = response.json()
+    assert data["settings"]["image_processing"]["hist_bins"] == 16
+    assert data["persisted"] is False and data["broadcast"] is False
+    assert client.get("/health").json()["settings"] == data["fingerprint"]
+
+    # Requests after the swap use the new bins
+    response = client.post("/analyze", files={"file": ("fruit.jpg", jpeg_bytes(), "image/jpeg")})
+    assert response.status_code == 200
+
+    response = client.put("/admin/settings", json={"image_processing": {"hist_bins": 0}})
+    assert response.status_code == 422
+    assert settings.current_settings().hist_bins == 16
+
+
+def test_settings_update_runs_off_the_event_loop(tmp_path, monkeypatch):
+    """Test that PUT /admin/settings writes the overrides file outside the event loop."""
+    monkeypatch.setitem(SETTINGS_CONFIG, 'overrides_path', str(tmp_path / "settings.json"))
+    loops = []
+    update = settings.update
+
+    def recording_update(*args, **kwargs):
+        try:
+            loops.append(asyncio.get_running_loop())
+        except RuntimeError:
+            loops.append(None)
+        return update(*args, **kwargs)
+
+    monkeypatch.setattr(settings, 'update', recording_update)
+    response = client.put("/admin/settings", json={"image_processing": {"hist_bins": 32}})
+    assert response.status_code == 200 and response.json()["persisted"]
+    assert loops == [None]
+    assert json.loads((tmp_path / "settings.json").read_text())["image_processing"]["hist_bins"] == 32
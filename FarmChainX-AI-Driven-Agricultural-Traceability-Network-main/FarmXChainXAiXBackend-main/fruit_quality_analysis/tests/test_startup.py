@@ -0,0 +1,31 @@
+"""
+Tests for deferred imports at API startup.
+"""
+import subprocess
+import sys
+from pathlib import Path
+from app.utils.lazy import lazy_import
+
+PROJECT_DIR = Path(__file__).parent.parent
+
+
+def test_lazy_module_imports_on_first_use():
+    """Test that a lazy module is only imported when an attribute is used."""
+    json_module = lazy_import("json")
+    assert not json_module.loaded
+    assert json_module.dumps([1]) == "[1]"
+    assert json_module.loaded
+
+
+def test_importing_app_skips_heavy_modules():
+    """Test that importing the API does not import OpenCV or TensorFlow."""
+    code = (
+        "import sys, app.main; "
+        "print('cv2' in sys.modules, 'tensorflow' in sys.modules)"
+    )
+    output = subprocess.run(
+        [sys.executable, "-W", "ignore", "-c", code],
+        cwd=PROJECT_DIR, capture_output=True, text=True, check=True
+    ).stdout.split()
+    
+    assert output == ["False", "False"]
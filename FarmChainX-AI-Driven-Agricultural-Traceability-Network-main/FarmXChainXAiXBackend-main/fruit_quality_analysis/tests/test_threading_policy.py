@@ -0,0 +1,74 @@
+"""
+Tests for the native threading policy.
+"""
+import os
+import pytest
+from app.utils import threading_policy
+from app.utils.threading_policy import NATIVE_THREAD_VARS, apply_policy, derive_policy
+from app.utils.image_processor import cv2
+
+
+@pytest.mark.parametrize("cpus, workers, executor, expected", [
+    # One worker on 16 cores: 16 executor threads, one native thread each
+    (16, 1, None, (16, 1, 16)),
+    # Four workers split the cores
+    (16, 4, None, (4, 1, 4)),
+    # A smaller executor leaves cores for OpenCV's own threads
+    (16, 2, 2, (2, 4, 8)),
+    # More workers than cores never goes below one thread
+    (2, 8, None, (1, 1, 1)),
+])
+def test_derive_policy(cpus, workers, executor, expected):
+    """Test that threads are split so they add up to about the core count."""
+    policy = derive_policy(cpu_count=cpus, workers=workers, executor_workers=executor)
+    assert (policy.executor_workers, policy.native_threads, policy.tf_intra_op_threads) == expected
+    assert policy.tf_inter_op_threads == 1
+
+
+def test_explicit_settings_win():
+    """Test that configured values override the derived ones."""
+    policy = derive_policy(cpu_count=16, workers=4, native_threads=3, tf_intra_op_threads=2,
+                           tf_inter_op_threads=2)
+    assert (policy.native_threads, policy.tf_intra_op_threads, policy.tf_inter_op_threads) == (3, 2, 2)
+
+
+def test_apply_policy(monkeypatch):
+    """Test that OpenCV and the BLAS variables follow the policy."""
+    for var in NATIVE_THREAD_VARS:
+        monkeypatch.delenv(var, raising=False)
+    monkeypatch.setenv("MKL_NUM_THREADS", "4")
+    monkeypatch.setattr(threading_policy, "_active", None)
+    previous = cv2.getNumThreads()
+    policy = derive_policy(cpu_count=4, workers=1, executor_workers=2)
+    
+    try:
+        apply_policy(policy)
+        assert cv2.getNumThreads() == 2
+        assert threading_policy.active_policy() == policy
+    finally:
+        cv2.setNumThreads(previous)
+    
+    assert os.environ["OMP_NUM_THREADS"] == "2"
+    assert os.environ["OPENBLAS_NUM_THREADS"] == "2"
+    # Operator settings are left alone
+    assert os.environ["MKL_NUM_THREADS"] == "4"
+
+
+def test_configure_tensorflow_uses_policy(monkeypatch):
+    """Test that TensorFlow's pools are sized from the active policy."""
+    calls = {}
+    
+    class FakeThreading:
+        def set_intra_op_parallelism_threads(self, n):
+            calls["intra"] = n
+        
+        def set_inter_op_parallelism_threads(self, n):
+            calls["inter"] = n
+    
+    class FakeTF:
+        class config:
+            threading = FakeThreading()
+    
+    monkeypatch.setattr(threading_policy, "_active", derive_policy(cpu_count=8, workers=2))
+    threading_policy.configure_tensorflow(FakeTF)
+    assert calls == {"intra": 4, "inter": 1}
@@ -0,0 +1,83 @@
+"""
+Tests for upload sniffing and request size limits.
+"""
+from typing import List
+import pytest
+from fastapi import FastAPI, File, UploadFile
+from fastapi.testclient import TestClient
+from app.utils.uploads import sniff_image_type, RequestSizeLimitMiddleware
+
+
+@pytest.mark.parametrize("head, expected", [
+    (b"\xff\xd8\xff\xe0\x00\x10JFIF\x00", "jpeg"),
+    (b"\x89PNG\r\n\x1a\n\x00\x00\x00\r", "png"),
+    (b"RIFF\x24\x00\x00\x00WEBP", "webp"),
+    (b"BM6\x00\x00\x00\x00\x00\x00\x006\x00", "bmp"),
+    (b"II*\x00\x08\x00\x00\x00\x00\x00\x00\x00", "tiff"),
+    (b"GIF89a\x01\x00\x01\x00\x00\x00", None),  # OpenCV cannot decode GIF
+    (b"This is not an image", None),
+    (b"", None),
+])
+def test_sniff_image_type(head, expected):
+    """Test magic-byte detection of supported image formats."""
+    assert sniff_image_type(head) == expected
+
+
+def make_client(max_bytes):
+    app = FastAPI()
+    app.add_middleware(RequestSizeLimitMiddleware, max_bytes=max_bytes)
+    
+    @app.post("/upload")
+    async def upload(file: UploadFile = File(...)):
+        return {"size": len(await file.read())}
+    
+    return TestClient(app)
+
+
+def test_request_under_limit():
+    """Test that bodies under the limit reach the endpoint."""
+    response = make_client(4096).post("/upload", files={"file": ("a.bin", b"x" * 100)})
+    assert response.status_code == 200
+    assert response.json() == {"size": 100}
+
+
+def test_request_over_limit_by_content_length():
+    """Test that an oversized declared body is rejected up front."""
+    response = make_client(4096).post("/upload", files={"file": ("a.bin", b"x" * 10000)})
+    assert response.status_code == 413
+
+
+def test_streamed_request_over_limit():
+    """Test that a body without Content-Length is cut off once over the limit."""
+    def chunks():
+        yield b"--boundary\r\n"
+        yield b'Content-Disposition: form-data; name="file"; filename="a.bin"\r\n\r\n'
+        for _ in range(10):
+            yield b"x" * 1024
+        yield b"\r\n--boundary--\r\n"
+    
+    response = make_client(4096).post(
+        "/upload",
+        content=chunks(),
+        headers={"content-type": "multipart/form-data; boundary=boundary"}
+    )
+    assert response.status_code == 413
+
+
+def test_request_limit_admits_full_batch():
+    """Test that the derived request limit admits a batch of maximum-size files."""
+    from config import API_CONFIG, MULTIPART_PART_OVERHEAD, UPLOAD_CONFIG
+    assert UPLOAD_CONFIG['max_request_size'] == API_CONFIG['max_batch_files'] * (
+        UPLOAD_CONFIG['max_upload_size'] + MULTIPART_PART_OVERHEAD
+    )
+    
+    app = FastAPI()
+    app.add_middleware(RequestSizeLimitMiddleware, max_bytes=3 * (1000 + MULTIPART_PART_OVERHEAD))
+    
+    @app.post("/upload")
+    async def upload(files: List[UploadFile] = File(...)):
+        return {"files": len(files)}
+    
+    files = [("files", (f"{'n' * 200}{i}.jpg", b"x" * 1000, "image/jpeg")) for i in range(3)]
+    response = TestClient(app).post("/upload", files=files)
+    assert response.status_code == 200 and response.json() == {"files": 3}
@@ -30,6 +30,51 @@ class TestImageProcessor:
         assert image is not None
         assert image.shape == (500, 500, 3)
     
+    def test_decode_image(self):
+        """Test decoding an image from in-memory bytes."""
+        with open(self.test_image_path, "rb") as f:
+            image = self.processor.decode_image(f.read())
+        assert image.shape == (500, 500, 3)
+    
+    def test_decode_image_invalid(self):
+        """Test decoding bytes that are not an image."""
+        with pytest.raises(ValueError):
+            self.processor.decode_image(b"This is not an image")
+    
+    def test_jpeg_size(self):
+        """Test reading JPEG dimensions from the header only."""
+        from app.utils.image_processor import _jpeg_size
+        import cv2
+        
+        encoded = cv2.imencode(".jpg", np.zeros((300, 700, 3), dtype=np.uint8))[1].tobytes()
+        assert _jpeg_size(encoded) == (700, 300)
+        assert _jpeg_size(cv2.imencode(".png", self.test_image)[1].tobytes()) is None
+        assert _jpeg_size(b"\xff\xd8") is None
+    
+    @pytest.mark.parametrize("size, expected", [
+        ((4000, 3000), (500, 375)),    # 1/8 still covers 224x224
+        ((1000, 1000), (250, 250)),    # 1/4 is the largest reduction that still fits
+        ((300, 300), (300, 300)),      # Too small to reduce
+    ])
+    def test_decode_image_reduced(self, size, expected):
+        """Test that large JPEGs are decoded at reduced resolution."""
+        import cv2
+        
+        image = np.random.randint(0, 255, (size[1], size[0], 3), dtype=np.uint8)
+        encoded = cv2.imencode(".jpg", image)[1].tobytes()
+        
+        decoded = self.processor.decode_image(encoded, min_size=(224, 224))
+        assert (decoded.shape[1], decoded.shape[0]) == expected
+        assert min(decoded.shape[:2]) >= 224 or decoded.shape[:2] == image.shape[:2]
+    
+    def test_decode_image_reduced_png(self):
+        """Test that non-JPEG images are decoded at full resolution."""
+        import cv2
+        
+        encoded = cv2.imencode(".png", self.test_image)[1].tobytes()
+        decoded = self.processor.decode_image(encoded, min_size=(224, 224))
+        assert decoded.shape == (500, 500, 3)
+    
     def test_resize_image(self):
         """Test image resizing."""
         resized = self.processor.resize_image(self.test_image, (224, 224))
@@ -91,39 +136,91 @@ class TestFruitQualityAnalyzer:
         assert 0 <= result.ripeness <= 100
         assert result.shelf_life_days >= 0
     
-    def test_detect_fruit_type(self):
-        """Test fruit type detection."""
-        self.analyzer._detect_fruit_type(self.sample_data)
-        assert self.analyzer.fruit_type in list(FruitType)
-        assert 0 <= self.analyzer.confidence <= 100
-    
-    def test_calculate_quality_metrics(self):
-        """Test quality metrics calculation."""
-        self.analyzer._detect_fruit_type(self.sample_data)
-        self.analyzer._calculate_quality_metrics(self.sample_data)
-        
-        assert 0 <= self.analyzer.freshness <= 100
-        assert 0 <= self.analyzer.ripeness <= 100
-        assert self.analyzer.shelf_life_days >= 0
-    
-    def test_generate_recommendations(self):
-        """Test recommendation generation."""
-        self.analyzer._detect_fruit_type(self.sample_data)
-        self.analyzer._calculate_quality_metrics(self.sample_data)
-        recommendations = self.analyzer._generate_recommendations()
-        
-        assert isinstance(recommendations, list)
-        assert len(recommendations) > 0
-        assert all(isinstance(rec, str) for rec in recommendations)
-    
-    def test_determine_overall_condition(self):
-        """Test overall condition determination."""
-        self.analyzer._detect_fruit_type(self.sample_data)
-        self.analyzer._calculate_quality_metrics(self.sample_data)
-        self.analyzer._determine_overall_condition()
-        
-        assert self.analyzer.overall_condition in [
-            'Excellent', 'Good', 'Fair', 'Poor', 'Spoiled'
+    def test_analyze_is_deterministic(self):
+        """Test that the same image features always produce the same result."""
+        first = self.analyzer.analyze(self.sample_data)
+        second = FruitQualityAnalyzer().analyze(dict(self.sample_data))
+        assert first == second
+    
+    def test_score_batch(self):
+        """Test that score_batch returns one in-range value per image."""
+        histograms = np.random.random((16, 768)).astype('float32')
+        scores = self.analyzer.score_batch(histograms)
+        
+        assert all(len(values) == 16 for values in scores.values())
+        assert np.all((80 <= scores['confidence']) & (scores['confidence'] <= 99))
+        assert np.all((70 <= scores['freshness']) & (scores['freshness'] <= 100))
+        assert np.all((30 <= scores['ripeness']) & (scores['ripeness'] <= 100))
+        assert np.all(scores['shelf_life_days'] >= 1)
+        assert np.all(scores['fruit_index'] < FruitQualityAnalyzer.UNKNOWN_INDEX)
+    
+    def test_analyze_batch_matches_analyze(self):
+        """Test that batch results equal scoring each image on its own."""
+        histograms = np.random.random((8, 768)).astype('float32')
+        results = self.analyzer.analyze_batch(histograms)
+        
+        assert results == [self.analyzer.analyze({'color_histogram': hist}) for hist in histograms]
+    
+    def test_analyze_batch_matches_scalar_rules(self):
+        """Test the vectorized shelf life, condition and recommendations against the per-image rules."""
+        shelf_life = FruitQualityAnalyzer.SHELF_LIFE
+        for result in self.analyzer.analyze_batch(np.random.random((64, 768)).astype('float32')):
+            ripeness_factor = 1.0 - abs((result.ripeness - 60) / 100)
+            expected_days = max(1, int(shelf_life[result.fruit_type] * result.freshness / 100 * ripeness_factor * 0.8))
+            assert result.shelf_life_days == expected_days
+            
+            score = (result.freshness * 0.4 + result.ripeness * 0.3
+                     + expected_days / max(shelf_life.values()) * 100 * 0.3)
+            expected_condition = (
+                'Excellent' if score >= 90 else 'Good' if score >= 75 else
+                'Fair' if score >= 50 else 'Poor' if score >= 25 else 'Spoiled'
+            )
+            assert result.overall_condition == expected_condition
+            
+            premium = result.freshness >= 90
+            assert (result.recommendations[0] == "Premium quality - perfect for high-end markets") == premium
+            assert ("Fully ripe - best for immediate consumption" in result.recommendations) == (result.ripeness > 80)
+            assert ("Not yet ripe - needs time to ripen" in result.recommendations) == (result.ripeness < 40)
+    
+    def test_recommendation_table(self):
+        """Test that every band and fruit combination is precomputed once and shared."""
+        table = self.analyzer.recommendations
+        assert len(table.entries) == 3 * 3 * len(FruitQualityAnalyzer.FRUITS)
+        assert all(isinstance(entry, tuple) for entry in table.entries)
+        
+        fruit_index = np.array([0, 0, FruitQualityAnalyzer.UNKNOWN_INDEX])
+        first, second, unknown = table.lookup(np.array([95.0, 95.0, 60.0]), np.array([60.0, 60.0, 85.0]), fruit_index)
+        assert first is second
+        assert first == (
+            "Premium quality - perfect for high-end markets",
+            "Store in optimal conditions to maintain quality",
+            "Ideal ripeness level for retail",
+            "Refrigerate to extend shelf life",
+        )
+        assert unknown[0] == "Consider quick sale or processing"
+        assert unknown[-1] == "Consider discount pricing for quick sale"
+    
+    def test_recommendation_table_uses_ripeness_thresholds(self):
+        """Test that the ripeness bands follow the configured thresholds."""
+        from app.utils.analysis import RecommendationTable
+        
+        table = RecommendationTable(FruitQualityAnalyzer.FRUITS, {'underripe': 20, 'overripe': 50})
+        freshness = np.full(4, 80.0)
+        fruit_index = np.zeros(4, dtype=np.int64)
+        bands = [entry[2] for entry in table.lookup(freshness, np.array([19.9, 20.0, 50.0, 50.1]), fruit_index)]
+        assert bands == [
+            "Not yet ripe - needs time to ripen",
+            "Ideal ripeness level for retail",
+            "Ideal ripeness level for retail",
+            "Fully ripe - best for immediate consumption",
+        ]
+    
+    def test_condition_thresholds(self):
+        """Test that scores on a threshold map to the higher condition."""
+        conditions = FruitQualityAnalyzer.CONDITIONS
+        index = self.analyzer._condition_thresholds.searchsorted([0, 24.99, 25, 50, 75, 89.99, 90, 100], side='right')
+        assert [conditions[i] for i in index] == [
+            'Spoiled', 'Spoiled', 'Poor', 'Fair', 'Good', 'Good', 'Excellent', 'Excellent'
         ]
 
 
@@ -144,19 +241,21 @@ def test_process_image():
         result = process_image(test_path)
         
         # Check that all required keys are present
-        assert 'original_image' in result
         assert 'processed_image' in result
         assert 'color_histogram' in result
         assert 'image_path' in result
         
+        # The decoded frame is not kept around
+        assert 'original_image' not in result
+        
         # Check types
-        assert isinstance(result['original_image'], np.ndarray)
         assert isinstance(result['processed_image'], np.ndarray)
         assert isinstance(result['color_histogram'], np.ndarray)
         assert isinstance(result['image_path'], str)
         
         # Check shapes
-        assert result['original_image'].shape == (500, 500, 3)
+        # JPEGs are decoded at the largest reduction still >= 224x224
+        assert result.image_size == (250, 250)
         assert result['processed_image'].shape == (1, 224, 224, 3)
         assert result['color_histogram'].shape == (768,)
         
@@ -164,3 +263,186 @@ def test_process_image():
         # Clean up
         if Path(test_path).exists():
             Path(test_path).unlink()
+
+
+def test_process_image_from_bytes():
+    """Test process_image with an encoded image buffer instead of a path."""
+    from app.utils.image_processor import process_image
+    import cv2
+    
+    test_image = np.random.randint(0, 255, (500, 500, 3), dtype=np.uint8)
+    ok, encoded = cv2.imencode(".jpg", test_image)
+    assert ok
+    
+    result = process_image(encoded.tobytes())
+    
+    assert result['image_path'] is None
+    assert result.image_size == (250, 250)
+    assert result['processed_image'].shape == (1, 224, 224, 3)
+    assert result['color_histogram'].shape == (768,)
+
+
+def test_process_images_batch():
+    """Test that process_images stacks a batch into single tensors."""
+    from app.utils.image_processor import process_image, process_images
+    import cv2
+    
+    images = [np.random.randint(0, 255, (h, 300, 3), dtype=np.uint8) for h in (200, 400, 600)]
+    encoded = [cv2.imencode(".png", image)[1].tobytes() for image in images]
+    
+    batch = process_images(encoded)
+    
+    assert batch['processed_images'].shape == (3, 224, 224, 3)
+    assert batch['color_histograms'].shape == (3, 768)
+    assert batch['image_paths'] == [None, None, None]
+    
+    # Each slot matches the single-image pipeline
+    single = process_image(encoded[1])
+    np.testing.assert_array_equal(batch['processed_images'][1], single['processed_image'][0])
+    np.testing.assert_array_equal(batch['color_histograms'][1], single['color_histogram'])
+
+
+def test_process_images_reports_bad_index():
+    """Test that a bad image in a batch is reported by position."""
+    from app.utils.image_processor import process_images
+    import cv2
+    
+    good = cv2.imencode(".png", np.zeros((50, 50, 3), dtype=np.uint8))[1].tobytes()
+    with pytest.raises(ValueError, match="image 1"):
+        process_images([good, b"garbage"])
+
+
+def test_analyze_fruit_quality_batch():
+    """Test that batch analysis returns one result per image."""
+    from app.utils.analysis import analyze_fruit_quality_batch
+    
+    batch = {
+        'processed_images': np.random.random((4, 224, 224, 3)).astype('float32'),
+        'color_histograms': np.random.random((4, 768)).astype('float32'),
+        'image_paths': [None] * 4
+    }
+    results = analyze_fruit_quality_batch(batch)
+    
+    assert len(results) == 4
+    assert all(isinstance(result.fruit_type, FruitType) for result in results)
+
+
+def _fruit_like_image(height, width, seed):
+    """Smooth blobs plus mild sensor noise, closer to a photo than uniform noise."""
+    import cv2
+    rng = np.random.default_rng(seed)
+    image = np.zeros((height, width, 3), dtype=np.uint8)
+    image[:] = (40, 120, 60)
+    for _ in range(8):
+        color = tuple(int(c) for c in rng.integers(0, 255, 3))
+        center = (int(rng.integers(0, width)), int(rng.integers(0, height)))
+        cv2.circle(image, center, int(rng.integers(height // 10, height // 3)), color, -1)
+    image = cv2.GaussianBlur(image, (31, 31), 0)
+    return np.clip(image + rng.normal(0, 4, image.shape), 0, 255).astype(np.uint8)
+
+
+@pytest.mark.parametrize("seed", range(3))
+def test_extract_features_matches_separate_steps(seed):
+    """Test the fused pipeline against preprocess_for_model + full-res histogram."""
+    import cv2
+    processor = ImageProcessor()
+    image = _fruit_like_image(1500, 2000, seed)
+    
+    processed, hist = processor.extract_features(image, target_size=(224, 224), bins=256)
+    
+    # The model tensor is bit-for-bit identical
+    np.testing.assert_array_equal(processed, processor.preprocess_for_model(image))
+    
+    # The histogram comes from the 224x224 image, so it is smoother than the
+    # full-resolution one but describes the same color distribution
+    reference = processor.extract_color_histogram(image, bins=256)
+    assert hist.shape == reference.shape == (768,)
+    
+    centers = np.arange(256) + 0.5
+    fused = hist.reshape(3, 256)
+    full = reference.reshape(3, 256)
+    fused_means = (fused * centers).sum(axis=1) / fused.sum(axis=1)
+    full_means = (full * centers).sum(axis=1) / full.sum(axis=1)
+    np.testing.assert_allclose(fused_means[1:], full_means[1:], atol=3.0)  # S and V
+    
+    coarse = cv2.compareHist(
+        processor.extract_color_histogram(processor.resize_image(image, (224, 224)), bins=32),
+        processor.extract_color_histogram(image, bins=32),
+        cv2.HISTCMP_CORREL
+    )
+    assert coarse > 0.8
+
+
+def test_extract_color_histogram_bins():
+    """Test that the histogram size follows the requested bin count."""
+    image = np.random.randint(0, 255, (100, 100, 3), dtype=np.uint8)
+    assert ImageProcessor.extract_color_histogram(image, bins=32).shape == (96,)
+
+
+def test_processed_image_container():
+    """Test the compact feature container returned by process_image."""
+    from app.utils.image_processor import ProcessedImage
+    
+    data = ProcessedImage(np.zeros((1, 224, 224, 3), dtype=np.float32), np.zeros(768, dtype=np.float32))
+    
+    assert not hasattr(data, '__dict__')
+    assert data['color_histogram'] is data.color_histogram
+    assert data.get('predictions') is None
+    assert data.nbytes == 224 * 224 * 3 * 4 + 768 * 4
+    with pytest.raises(KeyError):
+        data['original_image']
+
+
+@pytest.mark.parametrize("seed", range(2))
+def test_preprocessor_matches_naive_chain(seed):
+    """Test the buffered engine against the allocating convert/resize/normalize chain."""
+    import cv2
+    from app.utils.image_processor import preprocessor
+    image = _fruit_like_image(480, 640, seed)
+    
+    tensor, hist = preprocessor.features(image, (224, 224), 256)
+    
+    rgb = cv2.resize(cv2.cvtColor(image, cv2.COLOR_BGR2RGB), (224, 224), interpolation=cv2.INTER_AREA)
+    np.testing.assert_array_equal(tensor, np.expand_dims(rgb.astype('float32') / 255.0, 0))
+    np.testing.assert_array_equal(
+        hist, ImageProcessor.extract_color_histogram(ImageProcessor.resize_image(image, (224, 224)), bins=256)
+    )
+    # One allocation holds both outputs
+    assert tensor.base is hist.base
+
+
+def test_preprocessor_reuses_thread_buffers():
+    """Test that scratch buffers are kept per thread and per shape."""
+    import threading
+    from app.utils.image_processor import Preprocessor
+    engine = Preprocessor()
+    image = np.random.randint(0, 255, (100, 120, 3), dtype=np.uint8)
+    
+    engine.features(image, (64, 48), 16)
+    small = engine.scratch('small', (48, 64, 3))
+    engine.features(image, (64, 48), 16)
+    assert engine.scratch('small', (48, 64, 3)) is small
+    
+    other = []
+    thread = threading.Thread(target=lambda: other.append(engine.scratch('small', (48, 64, 3))))
+    thread.start()
+    thread.join()
+    assert other[0] is not small
+    
+    # A new target size replaces the buffer
+    engine.features(image, (32, 32), 16)
+    assert engine.scratch('small', (32, 32, 3)).shape == (32, 32, 3)
+
+
+def test_process_images_fills_batch_slots():
+    """Test that batch rows equal single-image preprocessing."""
+    import cv2
+    from app.utils.image_processor import process_image, process_images
+    images = [cv2.imencode('.png', _fruit_like_image(200, 300, seed))[1].tobytes() for seed in range(3)]
+    
+    batch = process_images(images)
+    
+    for index, data in enumerate(images):
+        single = process_image(data)
+        np.testing.assert_array_equal(batch['processed_images'][index], single['processed_image'][0])
+        np.testing.assert_array_equal(batch['color_histograms'][index], single['color_histogram'])